@@ -0,0 +1,86 @@
+"""Compare gateway balancing strategies when one backend degrades.
+
+Three backend instances serve the same route.  Each strategy is driven
+through the async forwarding path with a fixed number of concurrent clients,
+first against a healthy pool (the baseline) and then against a pool in which
+one backend becomes ``--slowdown`` times slower once ``--degrade-after`` of
+the requests have been sent.  It keeps answering ``200``, so only the
+gateway's latency outlier ejection can take it out of rotation.  The p50,
+p99 and p99.9 latency and the throughput of both runs are reported; a tail
+that holds steady shows as degraded percentiles close to the baseline.
+Run with::
+
+    python benchmarks/bench_balancing.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import pathlib
+import sys
+import time
+from typing import List
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "api_gateway")])
+
+from fastapi import FastAPI  # noqa: E402
+from main import STRATEGIES, APIGateway  # noqa: E402
+
+
+def make_backend(delays: List[float], index: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work() -> dict:
+        # Read on every request so the delay can change mid-run.
+        await asyncio.sleep(delays[index])
+        return {"ok": True}
+
+    return app
+
+
+def percentile(latencies: List[float], q: float) -> float:
+    return latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000
+
+
+async def run(strategy: str, degrade: bool, args: argparse.Namespace) -> str:
+    gateway = APIGateway(max_concurrency=1_000, max_queue=1_000)
+    delays = [args.delay] * 3
+    gateway.register("svc", [make_backend(delays, index) for index in range(3)], strategy=strategy)
+    degrade_at = int(args.requests * args.degrade_after) if degrade else None
+    latencies = []
+    remaining = iter(range(args.requests))
+
+    async def client() -> None:
+        for sent in remaining:
+            if sent == degrade_at:
+                delays[-1] = args.delay * args.slowdown
+            t0 = time.perf_counter()
+            await gateway.forward_async("svc", "GET", "/work")
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (
+        f"p50 {percentile(latencies, 0.5):6.2f}  p99 {percentile(latencies, 0.99):6.2f}"
+        f"  p99.9 {percentile(latencies, 0.999):6.2f} ms  {len(latencies) / elapsed:7,.0f} req/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--delay", type=float, default=0.002)
+    parser.add_argument("--slowdown", type=float, default=20.0)
+    parser.add_argument("--degrade-after", type=float, default=0.1, help="share of requests sent before the slowdown")
+    args = parser.parse_args()
+    for strategy in STRATEGIES:
+        print(f"{strategy:<22} healthy   {asyncio.run(run(strategy, False, args))}")
+        print(f"{'':<22} degraded  {asyncio.run(run(strategy, True, args))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Measure bot webhook dispatch throughput against the previous implementation.
+
+The previous implementation is not re-typed here: its ``services/bot/main.py``
+is read from git (``--baseline``, by default the revision just before the
+command table was built once per app) and loaded next to the current one.
+Both ``/webhook`` handlers are called directly on the same updates, their
+replies are compared, and updates per second are reported for each.
+
+Updates come from ``--corpus``, a recorded Telegram export: a ``getUpdates``
+response, a JSON list of updates or one update per line.  Without it a
+small built-in sample of group chat traffic is used, which is only good for
+a smoke run; the speedup worth quoting is the one measured on recorded
+traffic.  Updates the old handler cannot handle (it raised ``IndexError``
+on messages without text) are counted and timed like any other.  Run
+with::
+
+    python benchmarks/bench_bot_dispatch.py --corpus updates.json --updates 200000
+"""
+
+import argparse
+import importlib.util
+import json
+import pathlib
+import random
+import subprocess
+import sys
+import time
+import types
+from typing import Any, Callable, Dict, List
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "services" / "bot"))
+
+# Parent of the commit that built the command table once per app.
+DEFAULT_BASELINE = "68aeb75^"
+
+SAMPLE = [
+    "good morning everyone",
+    "can someone check the build?",
+    "ok",
+    "👍",
+    "/ping",
+    "/ping@tasker_bot",
+    "/who",
+    "/who@tasker_bot",
+    "/task finish report @alice 2024-12-31 #work #urgent",
+    "/task@tasker_bot book meeting room for friday #office",
+    "/task fix login redirect @bob #bug",
+    "/task write release notes 2025-01-10",
+    "/start",
+    "/help@tasker_bot",
+    "lunch at 12:30 near the office?",
+    "see https://example.com/issue/123 for details",
+]
+
+
+def load_current() -> types.ModuleType:
+    spec = importlib.util.spec_from_file_location("bot_main", ROOT / "services" / "bot" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_baseline(revision: str) -> types.ModuleType:
+    """Load ``services/bot/main.py`` as it was at ``revision``."""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:services/bot/main.py"], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    module = types.ModuleType("bot_baseline")
+    module.__file__ = f"{revision}:services/bot/main.py"
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    return module
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """Read updates from a ``getUpdates`` response, a JSON list or JSON lines."""
+    text = pathlib.Path(path).read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data.get("result", []) if isinstance(data, dict) else data
+
+
+def webhook(module: types.ModuleType, task_api: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable:
+    app = module.create_app(bot_username="tasker_bot", task_api=task_api)
+    return app.match("POST", "/webhook")[0].handler
+
+
+def run(handler: Callable, updates: List[Dict[str, Any]]) -> tuple:
+    """Dispatch every update; return elapsed seconds, replies and failures."""
+    replies: List[Any] = []
+    failures = 0
+    start = time.perf_counter()
+    for update in updates:
+        try:
+            replies.append(handler(update))
+        except Exception:
+            replies.append(None)
+            failures += 1
+    return time.perf_counter() - start, replies, failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="recorded Telegram updates (getUpdates response, JSON list or JSON lines)")
+    parser.add_argument("--updates", type=int, default=100_000, help="updates to dispatch, sampled from the corpus")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="git revision of the previous implementation")
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        print("no --corpus given: using the built-in sample, not representative traffic")
+        corpus = [{"message": {"text": text, "chat": {"id": 1}}} for text in SAMPLE]
+    rng = random.Random(42)
+    updates = [rng.choice(corpus) for _ in range(args.updates)]
+    created = {"id": 1}
+
+    def task_api(payload: Dict[str, Any]) -> Dict[str, Any]:
+        return created
+
+    current = webhook(load_current(), task_api)
+    baseline = webhook(load_baseline(args.baseline), task_api)
+
+    previous, previous_replies, previous_failures = run(baseline, updates)
+    compiled, compiled_replies, compiled_failures = run(current, updates)
+    differing = sum(
+        old is not None and old != new for old, new in zip(previous_replies, compiled_replies)
+    )
+
+    print(f"{len(corpus)} distinct updates, {args.updates} dispatched")
+    print(f"baseline {args.baseline:<10} {args.updates / previous:12,.0f} updates/s  ({previous_failures} raised)")
+    print(f"current              {args.updates / compiled:12,.0f} updates/s  ({compiled_failures} raised)")
+    print(f"speedup {previous / compiled:.2f}x; replies differing where both answered: {differing}")
+
+
+if __name__ == "__main__":
+    main()
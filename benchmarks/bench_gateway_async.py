@@ -0,0 +1,92 @@
+"""Load benchmark for the API gateway's sync and async forwarding paths.
+
+Two backend instances simulate I/O latency, one of them slower than the
+other.  The sync path forwards requests one after another, as the original
+gateway did; the async path keeps ``--concurrency`` requests in flight.
+Reports p50/p99 latency and requests per second.  Run with::
+
+    python benchmarks/bench_gateway_async.py --requests 2000
+"""
+
+import argparse
+import asyncio
+import pathlib
+import statistics
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "api_gateway")])
+
+from fastapi import FastAPI  # noqa: E402
+from main import APIGateway  # noqa: E402
+
+
+def make_backend(delay: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work() -> dict:
+        await asyncio.sleep(delay)
+        return {"ok": True}
+
+    @app.get("/work-sync")
+    def work_sync() -> dict:
+        time.sleep(delay)
+        return {"ok": True}
+
+    return app
+
+
+def report(label: str, latencies: list, elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{label:<28} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms   {len(latencies) / elapsed:10,.0f} req/s")
+
+
+def bench_sync(gateway: APIGateway, requests: int) -> None:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        gateway.forward("svc", "GET", "/work-sync")
+        latencies.append(time.perf_counter() - t0)
+    report("sync forward", latencies, time.perf_counter() - start)
+
+
+async def bench_async(gateway: APIGateway, requests: int, concurrency: int) -> None:
+    latencies = []
+    rejected = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal rejected
+        for _ in remaining:
+            t0 = time.perf_counter()
+            status, _ = await gateway.forward_async("svc", "GET", "/work")
+            latencies.append(time.perf_counter() - t0)
+            rejected += status == 503
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    report(f"async forward (c={concurrency})", latencies, time.perf_counter() - start)
+    if rejected:
+        print(f"  {rejected} requests shed with 503")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--delay", type=float, default=0.001, help="fast backend latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    gateway = APIGateway(max_concurrency=32, max_queue=128)
+    gateway.register("svc", [make_backend(args.delay), make_backend(args.delay * 5)])
+    bench_sync(gateway, min(args.requests, 500))
+    asyncio.run(bench_async(gateway, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure the per-request cost of the stub's request metrics.
+
+Times ``--requests`` dispatches of a trivial route and of ``GET
+/tasks/{task_id}`` on the task service, then the metrics bookkeeping alone
+(:meth:`RouteStats.begin` and :meth:`Slot.end`) for the same number of
+requests, and reports the bookkeeping as a share of each request.  Also
+times one ``GET /metrics`` render.  Run with::
+
+    python benchmarks/bench_metrics_overhead.py --requests 200000
+"""
+
+import argparse
+import importlib.util
+import json
+import pathlib
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "task")])
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.metrics import RouteStats  # noqa: E402
+
+
+def load_task_service():
+    spec = importlib.util.spec_from_file_location("task_main", ROOT / "services" / "task" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def per_call(count: int, func) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    trivial = FastAPI()
+
+    @trivial.get("/items/{item_id}")
+    def get_item(item_id: int):
+        return {"id": item_id}
+
+    task_app = load_task_service().app
+    status, body = task_app.handle_request("POST", "/tasks", {"chat_id": 1, "title": "measured"})
+    assert status == 200
+    # The task service answers with pre-encoded JSON.
+    task = json.loads(body)
+
+    stats = RouteStats()
+    clock = time.perf_counter_ns
+    bookkeeping = per_call(args.requests, lambda: stats.begin().end(clock(), 200))
+    for label, app, path in (
+        ("trivial route", trivial, "/items/7"),
+        ("GET /tasks/{task_id}", task_app, f"/tasks/{task['id']}"),
+    ):
+        request = per_call(args.requests, lambda: app.dispatch("GET", path))
+        print(
+            f"{label:<22} {request * 1e6:7.2f} us/request   metrics {bookkeeping * 1e6:5.2f} us"
+            f" ({bookkeeping / request:5.1%})"
+        )
+    start = time.perf_counter()
+    text = task_app.metrics.render()
+    print(f"GET /metrics render     {(time.perf_counter() - start) * 1e3:7.2f} ms ({len(text.splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Micro-benchmark route dispatch in the FastAPI stub.
+
+Compares the cost of resolving a request against the original exact-match
+dict lookup for static paths and for parameterised paths as the number of
+registered routes grows.  Run with::
+
+    python benchmarks/bench_router.py
+"""
+
+import argparse
+import pathlib
+import sys
+import timeit
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from fastapi import FastAPI  # noqa: E402
+
+
+def build_app(routes: int) -> FastAPI:
+    app = FastAPI()
+    for i in range(routes):
+        app.get(f"/svc{i}/items")(lambda: None)
+        app.get(f"/svc{i}/items/{{item_id}}")(lambda item_id: item_id)
+        app.get(f"/svc{i}/items/{{item_id}}/tags/{{tag}}")(lambda item_id, tag: tag)
+    return app
+
+
+def per_call_ns(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print(f"{'routes':>7} {'dict lookup':>12} {'static':>10} {'1 param':>10} {'2 params':>10}  (ns/request)")
+    for routes in (10, 100, 1_000, 10_000):
+        app = build_app(routes)
+        last = routes - 1
+        baseline = {f"/svc{i}/items": None for i in range(routes)}
+        static_path = f"/svc{last}/items"
+        dict_ns = per_call_ns(lambda: baseline.get(static_path), args.number)
+        static_ns = per_call_ns(lambda: app.match("GET", static_path), args.number)
+        one_ns = per_call_ns(lambda: app.match("GET", f"/svc{last}/items/42"), args.number)
+        two_ns = per_call_ns(lambda: app.match("GET", f"/svc{last}/items/42/tags/x"), args.number)
+        print(f"{routes:>7} {dict_ns:>12.0f} {static_ns:>10.0f} {one_ns:>10.0f} {two_ns:>10.0f}")
+
+    app = build_app(100)
+    full_ns = per_call_ns(lambda: app.handle_request("GET", "/svc99/items/42/tags/x?debug=1"), args.number)
+    print(f"full handle_request with 2 path params and a query string: {full_ns:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Drive the bot's outgoing send queue on a simulated clock.
+
+A burst of replies is spread over ``--chats`` chats, with ``--hot`` of them
+receiving half of the traffic, and pushed through a :class:`SendQueue` while
+a fake clock advances in ``--tick`` steps.  The report compares the achieved
+global and per-chat send rates with the configured limits, counts sliding
+one-second windows that exceed a limit and shows how many replies merging
+saved.  Run with::
+
+    python benchmarks/bench_send_queue.py --messages 20000
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "bot")])
+
+from send_queue import SendQueue  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingBot:
+    def __init__(self, clock: FakeClock) -> None:
+        self.clock = clock
+        self.sent: List[Tuple[float, int]] = []
+
+    def send_message(self, chat_id: int, text: str) -> None:
+        self.sent.append((self.clock(), chat_id))
+
+
+def max_in_window(times: List[float], window: float = 1.0) -> int:
+    """Largest number of sends within any half-open ``window``."""
+    best = start = 0
+    for end, at in enumerate(times):
+        while times[start] <= at - window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+def run(args: argparse.Namespace, merge: bool) -> None:
+    rng = random.Random(args.seed)
+    clock = FakeClock()
+    bot = RecordingBot(clock)
+    queue = SendQueue(
+        bot,
+        chat_rate=args.chat_rate,
+        chat_burst=args.chat_burst,
+        global_rate=args.global_rate,
+        global_burst=args.global_burst,
+        merge=merge,
+        clock=clock,
+    )
+    hot = list(range(args.hot))
+    for n in range(args.messages):
+        chat_id = rng.choice(hot) if rng.random() < 0.5 else rng.randrange(args.chats)
+        queue.send_message(chat_id, f"reply {n}")
+    while queue.flush() is not None:
+        clock.now += args.tick
+    duration = max(bot.sent[-1][0], args.tick)
+
+    per_chat: Dict[int, List[float]] = defaultdict(list)
+    for at, chat_id in bot.sent:
+        per_chat[chat_id].append(at)
+    global_peak = max_in_window([at for at, _ in bot.sent])
+    chat_peak = max(max_in_window(times) for times in per_chat.values())
+    global_limit = args.global_rate + args.global_burst
+    chat_limit = args.chat_rate + args.chat_burst
+    chat_violations = sum(max_in_window(times) > chat_limit for times in per_chat.values())
+
+    label = "merged" if merge else "unmerged"
+    print(
+        f"{label:<9} replies={args.messages} sends={len(bot.sent)} "
+        f"drained in {duration:.1f}s simulated"
+    )
+    print(
+        f"          global {len(bot.sent) / duration:6.1f} sends/s (limit {args.global_rate:g}/s), "
+        f"peak 1s window {global_peak} (max {global_limit:g})"
+        f"{'  VIOLATION' if global_peak > global_limit else ''}"
+    )
+    print(
+        f"          per-chat peak 1s window {chat_peak} (max {chat_limit:g}), "
+        f"chats over limit: {chat_violations}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--hot", type=int, default=10)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--chat-burst", type=int, default=1)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--global-burst", type=int, default=30)
+    parser.add_argument("--tick", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for merge in (False, True):
+        run(args, merge)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare per-task and batched task creation through the gateway.
+
+Creates ``--tasks`` tasks once with one ``POST /task`` per task and once via
+``POST /task:batch`` in batches of ``--batch-size``, and reports tasks per
+second and the number of backend round trips for each.  Run with::
+
+    python benchmarks/bench_task_batch.py --tasks 20000
+"""
+
+import argparse
+import importlib.util
+import pathlib
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "api_gateway"), str(ROOT / "services" / "task")])
+
+from fastapi.testclient import TestClient  # noqa: E402
+from main import app, gateway  # noqa: E402
+
+
+def load_task_service():
+    spec = importlib.util.spec_from_file_location("task_main", ROOT / "services" / "task" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def payload(i: int) -> dict:
+    return {"chat_id": i % 100, "title": f"imported task {i}", "assignee": "alice", "tags": ["import"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    client = TestClient(app)
+
+    gateway.register("task", [load_task_service().app])
+    start = time.perf_counter()
+    for i in range(args.tasks):
+        client.post("/task", json=payload(i))
+    single = time.perf_counter() - start
+
+    gateway.register("task", [load_task_service().app])
+    start = time.perf_counter()
+    for offset in range(0, args.tasks, args.batch_size):
+        count = min(args.batch_size, args.tasks - offset)
+        client.post("/task:batch", json={"tasks": [payload(offset + i) for i in range(count)]})
+    batched = time.perf_counter() - start
+
+    calls = -(-args.tasks // args.batch_size)
+    print(f"per-task  {args.tasks / single:12,.0f} tasks/s  ({args.tasks} backend calls)")
+    print(f"batched   {args.tasks / batched:12,.0f} tasks/s  ({calls} backend calls, batch size {args.batch_size})")
+    print(f"speed-up  {single / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
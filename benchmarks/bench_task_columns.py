@@ -0,0 +1,92 @@
+"""Compare columnar task reports with list-of-dicts aggregation.
+
+Generates ``--tasks`` tasks and answers three reports both by looping over
+the task dictionaries that ``GET /tasks`` returns and through
+:class:`columns.TaskColumns`: tasks per assignee, tasks per tag and overdue
+tasks per chat.  Also reports the cost of building the columnar view and the
+size of the binary export next to the JSON list.  Run with::
+
+    python benchmarks/bench_task_columns.py --tasks 1000000
+"""
+
+import argparse
+import json
+import pathlib
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "task")])
+
+from columns import TaskColumns  # noqa: E402
+from record import TaskRecord  # noqa: E402
+
+NOW = "2024-07-01"
+
+
+def make_task(i: int) -> Dict[str, Any]:
+    return {
+        "id": i + 1,
+        "chat_id": 1000 + i % 5000,
+        "title": f"task {i}",
+        "assignee": f"user{i % 200}" if i % 3 else None,
+        "due_at": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}" if i % 2 else None,
+        "tags": ["work", f"t{i % 20}"] if i % 4 else [],
+        "created_at": "2024-01-01T00:00:00",
+    }
+
+
+def naive_reports(tasks: List[Dict[str, Any]]) -> List[Dict[Any, int]]:
+    per_assignee: Counter = Counter()
+    per_tag: Counter = Counter()
+    overdue: Counter = Counter()
+    for task in tasks:
+        if task["assignee"]:
+            per_assignee[task["assignee"]] += 1
+        for tag in task["tags"]:
+            per_tag[tag] += 1
+        if task["due_at"] and task["due_at"] <= NOW:
+            overdue[task["chat_id"]] += 1
+    return [dict(per_assignee), dict(per_tag), dict(overdue)]
+
+
+def columnar_reports(view: TaskColumns) -> List[Dict[Any, int]]:
+    return [
+        view.count_by("assignee"),
+        view.count_by("tag"),
+        view.count_by("chat_id", view.select(due_before=NOW)),
+    ]
+
+
+def timed(label: str, func: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<28} {time.perf_counter() - start:8.3f} s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    tasks = [make_task(i) for i in range(args.tasks)]
+    records = [TaskRecord.from_dict(task) for task in tasks]
+    print(f"{args.tasks:,} tasks")
+
+    expected = timed("list of dicts, 3 reports", lambda: naive_reports(tasks))
+    view = timed("build columnar view", lambda: TaskColumns.from_tasks(records))
+    result = timed("columnar, 3 reports", lambda: columnar_reports(view))
+    assert result == expected, "columnar reports disagree with the naive loop"
+
+    exported = timed("binary export", view.to_bytes)
+    encoded = timed("JSON list", lambda: json.dumps(tasks).encode())
+    loaded = timed("load binary export", lambda: TaskColumns.load(exported))
+    assert list(loaded.ids) == list(view.ids)
+    print(f"binary export {len(exported) / 2**20:8.1f} MiB   JSON {len(encoded) / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measure task creation throughput with several writer threads.
+
+Starts 1, 2, 4, ... ``--max-threads`` threads that each create
+``--tasks-per-thread`` tasks through the task service (``POST /tasks``, or
+``POST /tasks:batch`` with ``--batch-size``) against a fresh store, checks
+that every id was handed out exactly once and that ``GET /tasks`` lists them
+in id order, and reports tasks per second next to the single-thread rate.
+Pass ``--data-dir`` to log writes to a write-ahead log there.  Run with::
+
+    python benchmarks/bench_task_concurrency.py --max-threads 8
+"""
+
+import argparse
+import importlib.util
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "task")])
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+def load_task_service():
+    spec = importlib.util.spec_from_file_location("task_main", ROOT / "services" / "task" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(threads: int, per_thread: int, batch_size: int) -> float:
+    client = TestClient(load_task_service().app)
+    ids: List[List[int]] = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def writer(worker: int) -> None:
+        barrier.wait()
+        created = ids[worker]
+        for offset in range(0, per_thread, batch_size):
+            payloads = [
+                {"chat_id": worker + 1, "title": f"task {offset + i}", "tags": ["load"]}
+                for i in range(min(batch_size, per_thread - offset))
+            ]
+            if batch_size == 1:
+                created.append(client.post("/tasks", json=payloads[0]).json()["id"])
+            else:
+                created.extend(task["id"] for task in client.post("/tasks:batch", json={"tasks": payloads}).json())
+
+    pool = [threading.Thread(target=writer, args=(worker,)) for worker in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    allocated = [task_id for created in ids for task_id in created]
+    assert len(allocated) == threads * per_thread, "missing tasks"
+    assert len(set(allocated)) == len(allocated), "duplicate ids"
+    assert [task["id"] for task in client.get("/tasks").json()] == sorted(allocated), "store out of id order"
+    return threads * per_thread / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--max-threads", type=int, default=8)
+    parser.add_argument("--tasks-per-thread", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--data-dir", help="enable the write-ahead log in this directory")
+    args = parser.parse_args()
+
+    threads = 1
+    baseline = None
+    while threads <= args.max_threads:
+        directory = None
+        if args.data_dir:
+            directory = tempfile.mkdtemp(dir=args.data_dir)
+            os.environ["TASK_DATA_DIR"] = directory
+        rate = run(threads, args.tasks_per_thread, args.batch_size)
+        if directory:
+            shutil.rmtree(directory)
+        baseline = baseline or rate
+        print(f"{threads:3d} threads {rate:12,.0f} tasks/s   {rate / baseline:5.2f}x of one thread   ids unique")
+        threads *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Measure the bytes per second of task list responses.
+
+Creates ``--tasks`` tasks in one chat of the task service and serves pages
+of each ``--page-sizes`` size four ways:
+
+* ``encode``: encoding the page's task dicts on every request, as the
+  service did before tasks kept their encoding;
+* ``join``: joining the tasks' cached encodings (:func:`record.encode_list`);
+* ``GET /tasks``: the whole request through the task service;
+* ``gateway``: ``GET /tasks`` forwarded by an :class:`APIGateway` with the
+  body passed through as bytes, next to decoding and re-encoding it.
+
+Run with::
+
+    python benchmarks/bench_task_list_encoding.py --tasks 20000 --page-sizes 100 1000
+"""
+
+import argparse
+import importlib.util
+import json
+import pathlib
+import sys
+import time
+from typing import Callable
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / "services" / "api_gateway")]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "task")])
+
+from main import APIGateway, decode  # noqa: E402
+from record import encode_list  # noqa: E402
+
+
+def load_task_service():
+    spec = importlib.util.spec_from_file_location("task_main", ROOT / "services" / "task" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def throughput(seconds: float, rounds: int, body: bytes) -> float:
+    """Serve ``body`` ``rounds`` times in ``seconds``: megabytes per second."""
+    return len(body) * rounds / seconds / 1e6
+
+
+def measure(label: str, rounds: int, run: Callable[[], bytes]) -> None:
+    body = run()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        run()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {throughput(elapsed, rounds, body):8.1f} MB/s  {elapsed / rounds * 1e6:9.1f} us/page")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tasks", type=int, default=20_000)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    task_main = load_task_service()
+    for offset in range(0, args.tasks, task_main.MAX_BATCH_SIZE):
+        count = min(task_main.MAX_BATCH_SIZE, args.tasks - offset)
+        batch = [
+            {"chat_id": 1, "title": f"benchmark task {offset + i}", "assignee": "ann", "tags": ["bench", "list"]}
+            for i in range(count)
+        ]
+        status, _ = task_main.app.handle_request("POST", "/tasks:batch", {"tasks": batch})
+        assert status == 200
+    gateway = APIGateway()
+    gateway.register("task", [task_main.app])
+
+    for size in args.page_sizes:
+        path = f"/tasks?chat_id=1&limit={size}"
+        tasks = task_main.STORE.query(chat_id=1, limit=size)
+        print(f"page of {size} tasks ({len(encode_list(tasks)):,} bytes)")
+        measure("encode", args.rounds, lambda: json.dumps([task.to_dict() for task in tasks]).encode())
+        measure("join", args.rounds, lambda: encode_list(tasks))
+        measure("GET /tasks", args.rounds, lambda: task_main.app.handle_request("GET", path)[1])
+        measure("gateway, pass-through", args.rounds, lambda: gateway.forward("task", "GET", path)[1])
+        measure(
+            "gateway, decode + encode",
+            args.rounds,
+            lambda: json.dumps(decode(gateway.forward("task", "GET", path)[1])).encode(),
+        )
+
+
+if __name__ == "__main__":
+    main()
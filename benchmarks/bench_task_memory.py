@@ -0,0 +1,99 @@
+"""Compare the memory cost of task representations.
+
+Builds ``--tasks`` tasks with a realistic mix of assignees, tags and due
+dates in three layouts and reports the bytes allocated per task, measured
+with ``tracemalloc``:
+
+* ``dict`` — the dictionaries the task service used to store;
+* ``pydantic`` — ``services/task_service/models.Task`` (skipped when
+  pydantic is not installed);
+* ``compact`` — :class:`record.TaskRecord`.
+
+Run with::
+
+    python benchmarks/bench_task_memory.py --tasks 200000
+"""
+
+import argparse
+import gc
+import pathlib
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "task"), str(ROOT / "services" / "task_service")])
+
+from record import TaskRecord  # noqa: E402
+
+START = datetime(2024, 1, 1)
+
+
+def make_dict(i: int) -> Dict[str, Any]:
+    # Every field is built per task, as when decoding a request or a log line.
+    return {
+        "id": i,
+        "chat_id": 1000 + i % 500,
+        "title": f"task number {i}",
+        "assignee": f"user{i % 50}" if i % 3 else None,
+        "due_at": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}" if i % 2 else None,
+        "tags": ["work", f"t{i % 10}"] if i % 4 else [],
+        "created_at": (START + timedelta(seconds=i, microseconds=i % 1000)).isoformat(),
+    }
+
+
+def make_pydantic(i: int) -> Any:
+    from models import Task
+
+    data = make_dict(i)
+    return Task(
+        id=i,
+        chat_id=data["chat_id"],
+        message_id=i,
+        title=data["title"],
+        assignee=data["assignee"],
+        due_at=data["due_at"],
+        tags=data["tags"],
+        created_by="bench",
+        created_at=data["created_at"],
+        updated_at=data["created_at"],
+    )
+
+
+def make_compact(i: int) -> TaskRecord:
+    return TaskRecord.from_dict(make_dict(i))
+
+
+def measure(build: Callable[[int], Any], count: int) -> float:
+    """Return bytes retained per task after building ``count`` tasks."""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tasks: List[Any] = [build(i) for i in range(count)]
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del tasks
+    return retained / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tasks", type=int, default=200_000)
+    args = parser.parse_args()
+
+    layouts = [("dict", make_dict), ("pydantic", make_pydantic), ("compact", make_compact)]
+    baseline = None
+    for name, build in layouts:
+        try:
+            per_task = measure(build, args.tasks)
+        except ImportError:
+            print(f"{name:<9} skipped (pydantic not installed)")
+            continue
+        baseline = baseline or per_task
+        print(f"{name:<9} {per_task:8.0f} B/task   {per_task / baseline:5.2f}x dict")
+
+
+if __name__ == "__main__":
+    main()
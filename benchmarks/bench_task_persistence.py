@@ -0,0 +1,87 @@
+"""Benchmark the task service write-ahead log.
+
+Reports write throughput for several group-commit batch sizes and the
+cold-start recovery time from a snapshot plus log tail.  Run with::
+
+    python benchmarks/bench_task_persistence.py --tasks 50000
+"""
+
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "task")])
+
+from store import TaskStore  # noqa: E402
+from wal import WriteAheadLog  # noqa: E402
+
+
+def make_task(store: TaskStore, i: int) -> dict:
+    return {
+        "id": store.allocate_id(),
+        "chat_id": i % 500,
+        "title": f"task number {i}",
+        "assignee": f"user{i % 50}",
+        "due_at": f"2024-{i % 12 + 1:02d}-01",
+        "tags": ["bench", f"t{i % 10}"],
+        "created_at": "2024-01-01T00:00:00",
+    }
+
+
+def bench_writes(count: int, sync_every: int) -> float:
+    """Return tasks/sec for ``count`` appends with the given batch size."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = TaskStore()
+        wal = WriteAheadLog(directory, store, sync_every=sync_every, sync_interval=1.0, snapshot_every=0)
+        wal.recover()
+        start = time.perf_counter()
+        for i in range(count):
+            task = make_task(store, i)
+            store.add(task)
+            wal.append(task)
+        wal.close()
+        return count / (time.perf_counter() - start)
+
+
+def bench_recovery(count: int, tail: int) -> float:
+    """Return seconds needed to rebuild a store of ``count`` tasks."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = TaskStore()
+        wal = WriteAheadLog(directory, store, sync_every=1024, snapshot_every=0)
+        wal.recover()
+        for i in range(count):
+            task = make_task(store, i)
+            store.add(task)
+            wal.append(task)
+            if i == count - tail - 1:
+                wal.snapshot()
+        wal.close()
+
+        start = time.perf_counter()
+        recovered = TaskStore()
+        WriteAheadLog(directory, recovered).recover()
+        elapsed = time.perf_counter() - start
+        assert len(recovered) == count
+        return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"write throughput ({args.tasks} tasks)")
+    for sync_every in (1, 16, 64, 256):
+        rate = bench_writes(args.tasks if sync_every > 1 else min(args.tasks, 2_000), sync_every)
+        print(f"  sync_every={sync_every:<4} {rate:12,.0f} tasks/s")
+
+    tail = args.tasks // 10
+    elapsed = bench_recovery(args.tasks, tail)
+    print(f"cold start ({args.tasks} tasks, {tail} in log tail): {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Measure full-text search latency over a large task index.
+
+Indexes ``--tasks`` synthetic titles spread over ``--chats`` chats, with
+words drawn from a Zipf-like vocabulary so some words are very common, and
+runs single-word, two-word AND and prefix queries against random chats.
+Reports p50/p99 latency per query kind, plus the same queries against one
+``--hot-chat-tasks`` chat to show the worst case of a very large chat.
+Run with::
+
+    python benchmarks/bench_task_search.py --tasks 1000000
+"""
+
+import argparse
+import itertools
+import pathlib
+import random
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(ROOT / "services" / "task")])
+
+from search import SearchIndex  # noqa: E402
+
+SYLLABLES = ["ra", "po", "ti", "ke", "lu", "mo", "sa", "ve", "di", "no", "ba", "gu"]
+
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def percentiles(samples: List[float]) -> str:
+    samples.sort()
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99)] * 1e6
+    return f"p50 {p50:8.1f} us   p99 {p99:8.1f} us"
+
+
+def measure(label: str, queries: int, run: Callable[[], object]) -> None:
+    samples = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    print(f"{label:<26} {percentiles(samples)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=2_000)
+    parser.add_argument("--hot-chat-tasks", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=5_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocab = make_vocabulary(args.vocabulary, rng)
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    index = SearchIndex()
+    hot_chat = -1
+
+    def title() -> str:
+        return " ".join(rng.choices(vocab, cum_weights=weights, k=rng.randint(3, 8)))
+
+    start = time.perf_counter()
+    for task_id in range(1, args.tasks + 1):
+        chat_id = hot_chat if task_id <= args.hot_chat_tasks else rng.randrange(args.chats)
+        index.add(task_id, chat_id, title())
+    elapsed = time.perf_counter() - start
+    print(f"indexed {args.tasks:,} tasks in {elapsed:.1f} s ({args.tasks / elapsed:,.0f} tasks/s)")
+
+    for label, chat in (("chat", lambda: rng.randrange(args.chats)), ("hot chat", lambda: hot_chat)):
+        measure(f"{label}: one word", args.queries, lambda: index.search(chat(), rng.choices(vocab, cum_weights=weights)[0]))
+        measure(
+            f"{label}: two words",
+            args.queries,
+            lambda: index.search(chat(), " ".join(rng.choices(vocab, cum_weights=weights, k=2))),
+        )
+        measure(f"{label}: prefix", args.queries, lambda: index.search(chat(), rng.choice(vocab)[:3] + "*"))
+
+
+if __name__ == "__main__":
+    main()
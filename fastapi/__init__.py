@@ -2,12 +2,61 @@
 
 This module provides a minimal subset of FastAPI's interface so that the
 example services can be exercised without installing external dependencies.
-It supports registering synchronous GET and POST routes and exposes a
-``FastAPI`` application object with a :py:meth:`handle_request` method used by
-unit tests and the API gateway.
+It supports registering synchronous GET, POST, PUT, PATCH and DELETE routes
+and exposes a ``FastAPI`` application object with a
+:py:meth:`handle_request` method used by unit tests and the API gateway.
+
+Routes are compiled when they are registered.  Static paths live in a dict
+per method; paths with ``{name}`` parameters are stored in a tree keyed by
+path segment, so dispatch costs one dict lookup per segment regardless of
+how many routes exist.  Path and query string parameters are passed to
+handlers as keyword arguments, mirroring FastAPI's behaviour.
+
+Handlers may be plain functions or ``async def`` coroutines.
+:py:meth:`FastAPI.handle_request_async` awaits them on the caller's event
+loop; the synchronous :py:meth:`FastAPI.handle_request` drives coroutine
+handlers to completion on a per-thread loop, or on a worker thread when it
+is called from code already running on a loop.  Request bodies annotated with a
+pydantic model are validated into that model and model results are dumped to
+JSON-compatible data, without the stub importing pydantic itself.
+
+Request headers are bound to parameters declared with :func:`Header`.  A
+handler can set response headers or the status code through an injected
+:class:`Response` parameter, or return a :class:`Response` directly;
+:py:meth:`FastAPI.dispatch` returns those headers alongside the payload.
+A ``Response`` whose content is already-encoded JSON bytes is passed on as
+is, the way a real server would send it; the test client decodes it.  A
+:class:`StreamingResponse` (also importable from :mod:`fastapi.responses`)
+passes on an iterator of chunks.
+
+Every application records per-route request counts, in-flight requests and
+latency histograms in :attr:`FastAPI.metrics` (see :mod:`fastapi.metrics`)
+and serves them at ``GET /metrics`` in the Prometheus text format.
+``POST /metrics/profile`` starts a sampling profiler on the slowest routes
+(``{"top": 3}``) or on named ones (``{"routes": ["GET /tasks"]}``),
+``GET /metrics/profile`` returns its collapsed stacks and
+``DELETE /metrics/profile`` stops it.
+
+Requests carrying a W3C ``traceparent`` header, called from within a traced
+request, or sampled by :attr:`FastAPI.trace_sample_rate` are timed as spans
+of a distributed trace (see :mod:`fastapi.tracing`).
 """
 
-from typing import Any, Callable, Dict, Tuple
+import asyncio
+import contextvars
+import inspect
+import random
+import threading
+import time
+import types
+import typing
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, unquote
+
+from . import tracing
+from .metrics import Metrics, RouteStats, SamplingProfiler
+
+METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
 
 class HTTPException(Exception):
     """Lightweight HTTP exception carrying a status code and detail message."""
@@ -17,37 +66,242 @@ class HTTPException(Exception):
         self.status_code = status_code
         self.detail = detail
 
+class Response:
+    """Response headers and status code controlled by a handler.
+
+    Declare a parameter annotated with ``Response`` to receive one and set
+    ``status_code`` or ``headers`` on it, or return an instance to send
+    ``content`` as-is.
+    """
+
+    def __init__(
+        self,
+        content: Any = None,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+    ) -> None:
+        self.content = content
+        self.status_code = status_code
+        self.headers: Dict[str, str] = dict(headers or {})
+        if media_type is not None:
+            self.headers["content-type"] = media_type
+
+class StreamingResponse(Response):
+    """Response whose body is produced chunk by chunk.
+
+    ``content`` is an iterable of ``str`` or ``bytes`` chunks that is only
+    consumed as the client reads it, so the first chunks can be sent before
+    the last ones are built.  The stub hands the iterable back as the
+    payload; :class:`~fastapi.testclient.TestClient` reads it lazily with
+    ``iter_bytes()``.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+    ) -> None:
+        super().__init__(iter(content), status_code, headers, media_type)
+
+class _HeaderParam:
+    __slots__ = ("default",)
+
+    def __init__(self, default: Any) -> None:
+        self.default = default
+
+def Header(default: Any = None) -> Any:
+    """Declare a parameter bound to the request header of the same name.
+
+    Underscores in the parameter name match hyphens in the header name and
+    the lookup is case-insensitive (``if_none_match`` reads
+    ``If-None-Match``).
+    """
+    return _HeaderParam(default)
+
+class _Route:
+    """A registered handler with its signature resolved up front."""
+
+    __slots__ = ("handler", "params", "hints", "body_model", "headers", "response_param", "stats", "label", "traced")
+
+    def __init__(self, handler: Callable[..., Any], stats: RouteStats, label: str = "") -> None:
+        self.handler = handler
+        self.stats = stats
+        # ``"METHOD /template"``, the name of the route's spans.
+        self.label = label
+        self.traced = True
+        signature = inspect.signature(handler).parameters
+        parameters = list(signature)
+        try:
+            self.hints = typing.get_type_hints(handler)
+        except Exception:
+            # Unresolvable forward references: fall back to plain strings.
+            self.hints = {}
+        self.headers: Dict[str, Tuple[str, Any]] = {}
+        self.response_param: Optional[str] = None
+        for name, param in signature.items():
+            if isinstance(param.default, _HeaderParam):
+                self.headers[name] = (name.replace("_", "-").lower(), param.default.default)
+            elif self.hints.get(name) is Response:
+                self.response_param = name
+        # Parameters that may be filled from the query string.
+        self.params = frozenset(parameters) - set(self.headers) - {self.response_param}
+        # The first parameter receives the request body; remember its model
+        # class if it is annotated with one.
+        first = self.hints.get(parameters[0]) if parameters else None
+        self.body_model = first if hasattr(first, "model_validate") else None
+
+class _Node:
+    """Segment tree node used for routes containing path parameters."""
+
+    __slots__ = ("static", "param_name", "param_child", "route")
+
+    def __init__(self) -> None:
+        self.static: Dict[str, "_Node"] = {}
+        self.param_name: Optional[str] = None
+        self.param_child: Optional["_Node"] = None
+        self.route: Optional[_Route] = None
+
+    def insert(self, segments: List[str], route: _Route) -> None:
+        node = self
+        for segment in segments:
+            if segment.startswith("{") and segment.endswith("}"):
+                name = segment[1:-1]
+                if node.param_child is None:
+                    node.param_name = name
+                    node.param_child = _Node()
+                elif node.param_name != name:
+                    raise ValueError(f"conflicting path parameter {name!r}")
+                node = node.param_child
+            else:
+                node = node.static.setdefault(segment, _Node())
+        node.route = route
+
+    def match(self, segments: List[str], index: int, bound: List[Tuple[str, str]]) -> Optional[_Route]:
+        """Match ``segments[index:]``, preferring static segments."""
+        if index == len(segments):
+            return self.route
+        child = self.static.get(segments[index])
+        if child is not None:
+            route = child.match(segments, index + 1, bound)
+            if route is not None:
+                return route
+        if self.param_child is not None and segments[index]:
+            bound.append((self.param_name, segments[index]))
+            route = self.param_child.match(segments, index + 1, bound)
+            if route is not None:
+                return route
+            bound.pop()
+        return None
+
 class FastAPI:
     """Very small web framework inspired by FastAPI.
 
     Only the features required for the unit tests are implemented:
 
-    * Route registration via :py:meth:`get` and :py:meth:`post` decorators.
+    * Route registration via the :py:meth:`get`, :py:meth:`post`,
+      :py:meth:`put`, :py:meth:`patch` and :py:meth:`delete` decorators.
     * A :py:meth:`handle_request` helper that dispatches a request to the
       registered handler and returns ``(status_code, payload)``.
+    * Request metrics at ``GET /metrics`` and an on-demand sampling
+      profiler under ``/metrics/profile``.
+    * Trace spans for traced requests, named after ``title``.
+
+    ``trace_sample_rate`` is the share of requests arriving without trace
+    context that start a new trace; it is ``0`` except at entry points such
+    as the gateway.
     """
 
-    def __init__(self) -> None:
-        self._routes: Dict[str, Dict[str, Callable[[Any], Any]]] = {
-            "GET": {},
-            "POST": {},
-        }
-
-    def get(self, path: str) -> Callable[[Callable[[Any], Any]], Callable[[Any], Any]]:
-        """Register a synchronous GET endpoint."""
-        def decorator(func: Callable[[Any], Any]) -> Callable[[Any], Any]:
-            self._routes["GET"][path] = func
-            return func
-        return decorator
+    def __init__(self, title: str = "FastAPI") -> None:
+        self.title = title
+        self.trace_sample_rate = 0.0
+        self._routes: Dict[str, Dict[str, _Route]] = {method: {} for method in METHODS}
+        self._trees: Dict[str, _Node] = {method: _Node() for method in METHODS}
+        # Every route by ``"METHOD /template"``, for the profiler.
+        self._by_label: Dict[str, _Route] = {}
+        self.metrics = Metrics()
+        self.profiler: Optional[SamplingProfiler] = None
+        self.get("/metrics")(self._metrics_endpoint)
+        self.get("/metrics/profile")(self._profile_endpoint)
+        self.post("/metrics/profile")(self._start_profile_endpoint)
+        self.delete("/metrics/profile")(self._stop_profile_endpoint)
+        for route in self._by_label.values():
+            route.traced = False
 
-    def post(self, path: str) -> Callable[[Callable[[Any], Any]], Callable[[Any], Any]]:
-        """Register a synchronous POST endpoint."""
-        def decorator(func: Callable[[Any], Any]) -> Callable[[Any], Any]:
-            self._routes["POST"][path] = func
+    def _register(self, method: str, path: str, **_: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            route = _Route(func, self.metrics.stats(method, path), f"{method} {path}")
+            if "{" in path:
+                self._trees[method].insert(path.split("/"), route)
+            else:
+                self._routes[method][path] = route
+            self._by_label[route.label] = route
             return func
         return decorator
 
-    def handle_request(self, method: str, path: str, json: Any = None) -> Tuple[int, Any]:
+    def get(self, path: str, **options: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Register a GET endpoint.
+
+        Keyword options such as ``response_model`` are accepted for
+        compatibility with FastAPI and otherwise ignored.
+        """
+        return self._register("GET", path, **options)
+
+    def post(self, path: str, **options: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Register a POST endpoint.
+
+        Keyword options such as ``response_model`` are accepted for
+        compatibility with FastAPI and otherwise ignored.
+        """
+        return self._register("POST", path, **options)
+
+    def put(self, path: str, **options: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Register a PUT endpoint.
+
+        Keyword options such as ``response_model`` are accepted for
+        compatibility with FastAPI and otherwise ignored.
+        """
+        return self._register("PUT", path, **options)
+
+    def patch(self, path: str, **options: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Register a PATCH endpoint.
+
+        Keyword options such as ``response_model`` are accepted for
+        compatibility with FastAPI and otherwise ignored.
+        """
+        return self._register("PATCH", path, **options)
+
+    def delete(self, path: str, **options: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Register a DELETE endpoint.
+
+        Keyword options such as ``response_model`` are accepted for
+        compatibility with FastAPI and otherwise ignored.
+        """
+        return self._register("DELETE", path, **options)
+
+    def match(self, method: str, path: str) -> Optional[Tuple[_Route, List[Tuple[str, str]]]]:
+        """Resolve ``path`` (without query string) to a route.
+
+        Returns the route and the raw ``(name, value)`` path parameters, or
+        ``None`` when nothing matches.
+        """
+        route = self._routes.get(method, {}).get(path)
+        if route is not None:
+            return route, []
+        tree = self._trees.get(method)
+        if tree is None:
+            return None
+        bound: List[Tuple[str, str]] = []
+        route = tree.match(path.split("/"), 0, bound)
+        if route is None:
+            return None
+        return route, bound
+
+    def handle_request(
+        self, method: str, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Any]:
         """Dispatch the request to the registered handler.
 
         Parameters
@@ -55,15 +309,301 @@ class FastAPI:
         method:
             HTTP verb in upper case (e.g. ``"GET"`` or ``"POST"``).
         path:
-            Request path starting with ``/``.
+            Request path starting with ``/``, optionally followed by a query
+            string.
         json:
-            Parsed JSON payload supplied for POST requests.
+            Parsed JSON payload supplied for POST, PUT and PATCH requests.
+        headers:
+            Optional request headers.
         """
-        handler = self._routes.get(method, {}).get(path)
-        if handler is None:
-            return 404, {"detail": "Not Found"}
-        if json is None:
-            return 200, handler()
-        return 200, handler(json)
-
-__all__ = ["FastAPI", "HTTPException"]
+        status, payload, _ = self.dispatch(method, path, json, headers)
+        return status, payload
+
+    async def handle_request_async(
+        self, method: str, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Any]:
+        """Asynchronous counterpart of :py:meth:`handle_request`.
+
+        Coroutine handlers are awaited on the running event loop, so many
+        requests can be in flight at once; synchronous handlers are called
+        directly.
+        """
+        status, payload, _ = await self.dispatch_async(method, path, json, headers)
+        return status, payload
+
+    def dispatch(
+        self, method: str, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        """Like :py:meth:`handle_request` but also return response headers."""
+        prepared = self._prepare(method, path, json, headers)
+        if isinstance(prepared[0], int):
+            return prepared
+        route, args, params, response = prepared
+        span = self._server_span(route, headers)
+        token = None if span is None else tracing.activate(span)
+        slot = route.stats.begin()
+        started = time.perf_counter_ns()
+        try:
+            result = route.handler(*args, **params)
+            if inspect.isawaitable(result):
+                result = _run_sync(result)
+            finished = _finish(result, response)
+        except HTTPException as exc:
+            finished = exc.status_code, {"detail": exc.detail}, {}
+        except BaseException:
+            slot.end(started, 500)
+            if span is not None:
+                _end_span(span, token, 500)
+            raise
+        slot.end(started, finished[0])
+        if span is not None:
+            _end_span(span, token, finished[0])
+        return finished
+
+    async def dispatch_async(
+        self, method: str, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        """Asynchronous counterpart of :py:meth:`dispatch`."""
+        prepared = self._prepare(method, path, json, headers)
+        if isinstance(prepared[0], int):
+            return prepared
+        route, args, params, response = prepared
+        span = self._server_span(route, headers)
+        token = None if span is None else tracing.activate(span)
+        slot = route.stats.begin()
+        started = time.perf_counter_ns()
+        try:
+            result = route.handler(*args, **params)
+            if inspect.isawaitable(result):
+                result = await result
+            finished = _finish(result, response)
+        except HTTPException as exc:
+            finished = exc.status_code, {"detail": exc.detail}, {}
+        except BaseException:
+            # Includes cancellation, e.g. a gateway timeout.
+            slot.end(started, 500)
+            if span is not None:
+                _end_span(span, token, 500)
+            raise
+        slot.end(started, finished[0])
+        if span is not None:
+            _end_span(span, token, finished[0])
+        return finished
+
+    def _server_span(self, route: _Route, headers: Optional[Dict[str, str]]) -> Optional[tracing.Span]:
+        """Span timing ``route``'s handler, or ``None`` if not traced."""
+        if not route.traced:
+            return None
+        context = tracing.extract(headers) if headers else None
+        if context is not None:
+            trace_id, parent_id, sampled = context
+            return tracing.Span(route.label, self.title, trace_id, parent_id) if sampled else None
+        parent = tracing.current()
+        if parent is not None:
+            # Called in-process from a traced handler.
+            return parent.child(route.label, self.title)
+        if self.trace_sample_rate and random.random() < self.trace_sample_rate:
+            return tracing.Span(route.label, self.title, tracing.new_trace_id())
+        return None
+
+    def _prepare(self, method: str, path: str, json: Any, headers: Optional[Dict[str, str]]) -> Tuple[Any, ...]:
+        """Resolve and bind a request.
+
+        Returns ``(route, args, kwargs, response)`` ready for the call, or an
+        error ``(status_code, payload, headers)`` tuple.
+        """
+        path, _, query = path.partition("?")
+        matched = self.match(method, path)
+        if matched is None:
+            # Unmatched paths share one series so they cannot flood metrics.
+            self.metrics.stats(method, "<unmatched>").slot().end(time.perf_counter_ns(), 404, begun=False)
+            return 404, {"detail": "Not Found"}, {}
+        route, path_params = matched
+        try:
+            params = _bind(route, path_params, query)
+            if route.body_model is not None and json is not None:
+                json = route.body_model.model_validate(json)
+        except ValueError as exc:
+            # pydantic's ValidationError is a ValueError as well.
+            route.stats.slot().end(time.perf_counter_ns(), 422, begun=False)
+            return 422, {"detail": str(exc)}, {}
+        if route.headers:
+            received = {key.lower(): value for key, value in (headers or {}).items()}
+            for name, (header, default) in route.headers.items():
+                params[name] = received.get(header, default)
+        response = None
+        if route.response_param is not None:
+            response = params[route.response_param] = Response()
+        args = () if json is None else (json,)
+        return route, args, params, response
+
+    def _metrics_endpoint(self) -> Response:
+        return Response(self.metrics.render(), media_type="text/plain; version=0.0.4")
+
+    def start_profiler(
+        self, routes: Optional[List[str]] = None, top: int = 3, interval: float = 0.005
+    ) -> SamplingProfiler:
+        """Start sampling the handlers of ``routes`` or of the ``top`` slowest.
+
+        Routes are named ``"METHOD /template"``; the slowest are ranked by
+        p99 latency so far.  A running profiler is replaced.
+        """
+        if routes is None:
+            ranked = (f"{method} {path}" for method, path in self.metrics.slowest(len(self.metrics.routes)))
+            routes = [label for label in ranked if label in self._by_label and " /metrics" not in label][:top]
+        unknown = [label for label in routes if label not in self._by_label]
+        if unknown:
+            raise ValueError(f"unknown routes: {', '.join(unknown)}")
+        self.stop_profiler()
+        targets = {_code(self._by_label[label].handler): label for label in routes}
+        self.profiler = SamplingProfiler(targets, interval)
+        self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self) -> Optional[SamplingProfiler]:
+        """Stop the running profiler, if any, and return it."""
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.stop()
+        return profiler
+
+    def _start_profile_endpoint(self, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        options = options or {}
+        try:
+            profiler = self.start_profiler(
+                options.get("routes"), int(options.get("top", 3)), float(options.get("interval", 0.005))
+            )
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(400, str(exc)) from None
+        return {"routes": sorted(profiler.targets.values()), "interval": profiler.interval}
+
+    def _profile_endpoint(self) -> Response:
+        if self.profiler is None:
+            raise HTTPException(404, "profiler was never started")
+        return Response(self.profiler.collapsed(), media_type="text/plain")
+
+    def _stop_profile_endpoint(self) -> Response:
+        profiler = self.stop_profiler()
+        if profiler is None:
+            raise HTTPException(404, "profiler was never started")
+        return Response(profiler.collapsed(), media_type="text/plain")
+
+
+def _bind(route: _Route, path_params: List[Tuple[str, str]], query: str) -> Dict[str, Any]:
+    """Map path and query string values onto the route's keyword parameters.
+
+    Unknown query parameters are ignored and values are converted according
+    to the parameter annotations (``int``, ``float``, ``bool`` or ``str``).
+    When a query parameter is repeated the last value wins; path parameters
+    take precedence over query parameters of the same name.
+    """
+    params: Dict[str, Any] = {}
+    if query:
+        for name, raw in parse_qsl(query, keep_blank_values=True):
+            if name in route.params:
+                params[name] = _coerce(name, raw, route.hints.get(name, str))
+    for name, raw in path_params:
+        params[name] = _coerce(name, unquote(raw), route.hints.get(name, str))
+    return params
+
+
+def _coerce(name: str, raw: str, hint: Any) -> Any:
+    """Convert ``raw`` to the type described by ``hint``."""
+    if typing.get_origin(hint) in (Union, types.UnionType):
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        hint = args[0] if len(args) == 1 else str
+    try:
+        if hint is bool:
+            return raw.lower() in ("1", "true", "yes", "on")
+        if hint in (int, float):
+            return hint(raw)
+    except ValueError:
+        raise ValueError(f"invalid value for parameter {name!r}") from None
+    return raw
+
+
+def _finish(result: Any, response: Optional[Response]) -> Tuple[int, Any, Dict[str, str]]:
+    """Turn a handler result into ``(status_code, payload, headers)``."""
+    if isinstance(result, Response):
+        return result.status_code, result.content, result.headers
+    if response is not None:
+        return response.status_code, _jsonable(result), response.headers
+    return 200, _jsonable(result), {}
+
+
+def _end_span(span: tracing.Span, token: Any, status: int) -> None:
+    tracing.deactivate(token)
+    span.finish(status=status)
+
+def _jsonable(value: Any) -> Any:
+    """Dump pydantic models (or lists of them) to plain data."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if isinstance(value, list) and value and hasattr(value[0], "model_dump"):
+        return [item.model_dump(mode="json") for item in value]
+    return value
+
+
+def _code(handler: Callable[..., Any]) -> Any:
+    """Code object executed by ``handler`` (plain function or bound method)."""
+    return getattr(handler, "__func__", handler).__code__
+
+
+_local = threading.local()
+
+
+class _ThreadLoop:
+    """Owner of a thread's private event loop, closing it with the thread."""
+
+    __slots__ = ("loop",)
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+
+    def __del__(self) -> None:
+        # Thread-local values are released when the thread exits; closing
+        # here keeps the loop from being torn down later by the cyclic GC,
+        # possibly after its self-pipe sockets.
+        if not self.loop.is_closed():
+            self.loop.close()
+
+
+def _run_sync(awaitable: Any) -> Any:
+    """Run ``awaitable`` to completion on this thread's private event loop.
+
+    A synchronous request made from code already running on an event loop
+    (a sync handler called by :py:meth:`FastAPI.dispatch_async` that calls
+    back into an app, say) cannot re-enter that loop; the awaitable then
+    runs on a worker thread with its own loop and the caller blocks until
+    it finishes, as it would on a blocking HTTP call.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        owner = getattr(_local, "owner", None)
+        if owner is None or owner.loop.is_closed():
+            owner = _local.owner = _ThreadLoop()
+        return owner.loop.run_until_complete(awaitable)
+    return _run_in_thread(awaitable)
+
+
+def _run_in_thread(awaitable: Any) -> Any:
+    # A thread per call rather than a pool: nested calls each block their
+    # caller, so a bounded pool could run out of workers and deadlock.
+    context = contextvars.copy_context()
+    outcome: Dict[str, Any] = {}
+
+    def run() -> None:
+        try:
+            outcome["result"] = context.run(_run_sync, awaitable)
+        except BaseException as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=run, name="fastapi-run-sync")
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+__all__ = ["FastAPI", "HTTPException", "Header", "Response", "StreamingResponse"]
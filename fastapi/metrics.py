@@ -0,0 +1,373 @@
+"""Request metrics and an on-demand sampling profiler for the stub.
+
+Every :class:`~fastapi.FastAPI` application owns a :class:`Metrics`
+registry that its dispatch methods update for each request: a request
+counter per route and status class, an in-flight gauge and a latency
+:class:`Histogram`.  Routes are labelled by their template
+(``/tasks/{task_id}``), so the number of series does not grow with the ids
+in the URLs.  :meth:`Metrics.render` produces the Prometheus text format
+served at ``GET /metrics``; other components (the gateway's per-backend
+statistics, for instance) contribute series through
+:meth:`Metrics.add_collector`.
+
+Recording has to stay cheap because it runs on every request, so it takes
+no lock.  Each thread records into its own :class:`Slot` of a route (found
+through a :class:`threading.local`) and only :meth:`Metrics.render` sums the
+slots, which makes the counters exact without synchronising writers.  The
+slots of threads that have exited are folded into one retired total when a
+new thread registers or the totals are read, so short-lived threads do not
+accumulate slots.
+Latencies are taken with :func:`time.perf_counter_ns` and bucketed
+logarithmically, HDR style: the bucket of a value is its bit length plus
+its next two bits, four buckets per power of two, which bounds the relative
+error of a bucket at 25% with two shifts and a mask.
+
+:class:`SamplingProfiler` is off until started.  While running, a
+background thread snapshots the stacks of all threads every ``interval``
+seconds and keeps those executing one of the profiled handlers, counted as
+collapsed stacks (the format flame graph tools read).  It only looks at
+handler code objects, so the request path pays nothing for it, on or off.
+"""
+
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Sub-buckets per power of two, as a number of extra bits (2 -> 4 buckets).
+SUB_BITS = 2
+SUB_BUCKETS = 1 << SUB_BITS
+
+# Upper bounds, in nanoseconds, of the cumulative ``le`` buckets exported to
+# Prometheus: every power of two from ~1 microsecond to ~69 seconds.  They
+# are fixed so that series stay comparable across scrapes and instances.
+EXPORT_BOUNDS = tuple(2**exponent for exponent in range(10, 37))
+
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+_now = time.perf_counter_ns
+
+
+def _bucket(ns: int) -> int:
+    """Index of the histogram bucket holding ``ns``."""
+    bits = ns.bit_length()
+    if bits <= SUB_BITS:
+        return ns
+    return ((bits - SUB_BITS) << SUB_BITS) + ((ns >> (bits - SUB_BITS - 1)) & (SUB_BUCKETS - 1))
+
+
+def _bucket_bound(index: int) -> int:
+    """Largest value, in nanoseconds, that falls into bucket ``index``."""
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BITS) - 1
+    return ((SUB_BUCKETS + (index & (SUB_BUCKETS - 1)) + 1) << shift) - 1
+
+
+# Buckets needed for any 64-bit nanosecond value.
+BUCKETS = _bucket(2**64 - 1) + 1
+
+
+class Histogram:
+    """Log-bucketed latency histogram over nanosecond values.
+
+    Not synchronised itself; each instance has a single writer or callers
+    serialise :meth:`record`.
+    """
+
+    __slots__ = ("counts", "count", "sum_ns", "max_ns")
+
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int) -> None:
+        """Add one observation of ``ns`` nanoseconds."""
+        # _bucket() inlined, with SUB_BITS == 2.
+        bits = ns.bit_length()
+        self.counts[((bits - 2) << 2) + ((ns >> (bits - 3)) & 3) if bits > 2 else ns] += 1
+        self.count += 1
+        self.sum_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def merge(self, other: "Histogram") -> None:
+        """Add the observations of ``other`` to this histogram."""
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum_ns += other.sum_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound, in seconds, of the bucket holding quantile ``q``."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(_bucket_bound(index), self.max_ns) / 1e9
+        return self.max_ns / 1e9
+
+    def cumulative(self, bounds_ns: Iterable[int] = EXPORT_BOUNDS) -> List[Tuple[int, int]]:
+        """``(bound, observations <= bound)`` pairs for export.
+
+        A bucket counts towards the first bound that covers its upper end,
+        so counts are exact at powers of two.
+        """
+        result = []
+        index = 0
+        seen = 0
+        counts = self.counts
+        for bound in bounds_ns:
+            while index < len(counts) and _bucket_bound(index) <= bound:
+                seen += counts[index]
+                index += 1
+            result.append((bound, seen))
+        return result
+
+
+class Slot:
+    """One thread's share of a route's statistics; written by that thread only."""
+
+    __slots__ = ("in_flight", "statuses", "latency")
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.statuses = [0] * len(STATUS_CLASSES)
+        self.latency = Histogram()
+
+    def end(self, started: int, status: int, begun: bool = True) -> None:
+        """Record a request that started at ``started`` (a ``perf_counter_ns``).
+
+        Pass ``begun=False`` for requests rejected before
+        :meth:`RouteStats.begin`, such as unmatched paths.
+        """
+        ns = _now() - started
+        # Histogram.record() inlined: this runs on every request.
+        latency = self.latency
+        bits = ns.bit_length()
+        latency.counts[((bits - 2) << 2) + ((ns >> (bits - 3)) & 3) if bits > 2 else ns] += 1
+        latency.count += 1
+        latency.sum_ns += ns
+        if ns > latency.max_ns:
+            latency.max_ns = ns
+        self.statuses[(status // 100 - 1) if 100 <= status < 600 else 4] += 1
+        if begun:
+            self.in_flight -= 1
+
+    def merge(self, other: "Slot") -> None:
+        """Add the statistics of ``other`` to this slot."""
+        self.in_flight += other.in_flight
+        self.statuses = [mine + theirs for mine, theirs in zip(self.statuses, other.statuses)]
+        self.latency.merge(other.latency)
+
+
+class RouteStats:
+    """Counters, in-flight gauge and latency histogram of one route."""
+
+    __slots__ = ("_local", "_lock", "_slots", "_retired")
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Slots of threads that may still record, with their thread.
+        self._slots: List[Tuple[weakref.ref, Slot]] = []
+        # Sum of the slots of threads that have exited.
+        self._retired = Slot()
+
+    def slot(self) -> Slot:
+        """The calling thread's slot, created on its first request."""
+        try:
+            return self._local.slot
+        except AttributeError:
+            slot = self._local.slot = Slot()
+            with self._lock:
+                self._retire()
+                self._slots.append((weakref.ref(threading.current_thread()), slot))
+            return slot
+
+    def _retire(self) -> None:
+        """Fold the slots of exited threads into the retired total; needs ``_lock``."""
+        live = []
+        for ref, slot in self._slots:
+            thread = ref()
+            if thread is not None and thread.is_alive():
+                live.append((ref, slot))
+            else:
+                self._retired.merge(slot)
+        self._slots = live
+
+    def begin(self) -> Slot:
+        """Count a request as in flight; finish it with :meth:`Slot.end`."""
+        slot = self.slot()
+        slot.in_flight += 1
+        return slot
+
+    def totals(self) -> Tuple[List[int], int, Histogram]:
+        """Status class counts, in-flight requests and latency over all threads."""
+        total = Slot()
+        with self._lock:
+            self._retire()
+            total.merge(self._retired)
+            slots = [slot for _, slot in self._slots]
+        for slot in slots:
+            total.merge(slot)
+        return total.statuses, total.in_flight, total.latency
+
+
+class Metrics:
+    """Per-route request metrics of one application."""
+
+    def __init__(self) -> None:
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._lock = threading.Lock()
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def stats(self, method: str, route: str) -> RouteStats:
+        """Return the statistics of ``method route``, creating them once."""
+        key = (method, route)
+        stats = self.routes.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self.routes.setdefault(key, RouteStats())
+        return stats
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Append the exposition lines returned by ``collector()`` to :meth:`render`."""
+        self._collectors.append(collector)
+
+    def _totals(self) -> List[Tuple[Tuple[str, str], Tuple[List[int], int, Histogram]]]:
+        return [(key, stats.totals()) for key, stats in sorted(self.routes.items())]
+
+    def slowest(self, count: int, q: float = 0.99) -> List[Tuple[str, str]]:
+        """The ``count`` routes with the highest latency quantile ``q``."""
+        ranked = sorted(self._totals(), key=lambda item: item[1][2].quantile(q), reverse=True)
+        return [key for key, (_, _, latency) in ranked[:count] if latency.count]
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Counts and latency quantiles per route, for humans and tests."""
+        return {
+            f"{method} {route}": {
+                "requests": sum(statuses),
+                "errors": statuses[4],
+                "in_flight": in_flight,
+                "p50": latency.quantile(0.5),
+                "p99": latency.quantile(0.99),
+                "max": latency.max_ns / 1e9,
+            }
+            for (method, route), (statuses, in_flight, latency) in self._totals()
+        }
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        totals = self._totals()
+        lines = [
+            "# HELP http_requests_total Requests handled, by route and status class.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route), (statuses, _, _) in totals:
+            for status_class, total in zip(STATUS_CLASSES, statuses):
+                if total:
+                    lines.append(f'http_requests_total{{{_labels(method, route)},status="{status_class}"}} {total}')
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        for (method, route), (_, in_flight, _) in totals:
+            lines.append(f"http_requests_in_flight{{{_labels(method, route)}}} {in_flight}")
+        lines += histogram_lines(
+            "http_request_duration_seconds",
+            "Request handling latency.",
+            ((_labels(method, route), latency) for (method, route), (_, _, latency) in totals),
+        )
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def histogram_lines(name: str, help_text: str, series: Iterable[Tuple[str, Histogram]]) -> List[str]:
+    """Exposition lines of a histogram family; ``series`` yields ``(labels, histogram)``."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in series:
+        for bound, seen in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels},le="{bound / 1e9:.9g}"}} {seen}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum_ns / 1e9:.9g}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+def escape(value: str) -> str:
+    """Escape a label value for the exposition format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str) -> str:
+    return f'method="{method}",route="{escape(route)}"'
+
+
+class SamplingProfiler:
+    """Statistical profiler restricted to a set of route handlers.
+
+    ``targets`` maps handler code objects to a label (``"GET /tasks"``).
+    Samples are collapsed stacks from the handler frame down, e.g.
+    ``GET /tasks;list_tasks;query;_query`` mapped to their sample counts.
+    """
+
+    def __init__(self, targets: Dict[Any, str], interval: float = 0.005) -> None:
+        self.targets = targets
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.rounds = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling in a daemon thread."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling; collected samples are kept."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=me)
+
+    def sample(self, exclude: Optional[int] = None) -> None:
+        """Take one sample of every thread running a profiled handler."""
+        self.rounds += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude:
+                continue
+            stack = []
+            while frame is not None:
+                label = self.targets.get(frame.f_code)
+                stack.append(frame.f_code.co_name)
+                if label is not None:
+                    stack[-1] = label + ";" + stack[-1]
+                    self.samples[";".join(reversed(stack))] += 1
+                    break
+                frame = frame.f_back
+
+    def collapsed(self) -> str:
+        """Samples in the collapsed-stack format, most frequent first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
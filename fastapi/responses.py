@@ -0,0 +1,5 @@
+"""Response classes, importable as in FastAPI (``fastapi.responses``)."""
+
+from . import Response, StreamingResponse
+
+__all__ = ["Response", "StreamingResponse"]
@@ -2,27 +2,73 @@
 
 The real FastAPI library ships with a starlette-based ``TestClient`` that
 spins up the ASGI application.  For the purposes of these exercises we simply
-call :py:meth:`fastapi.FastAPI.handle_request` directly.
+call :py:meth:`fastapi.FastAPI.dispatch` directly, or
+:py:meth:`fastapi.FastAPI.dispatch_async` from :class:`AsyncTestClient`.
 """
 
-from typing import Any
+import json
+from typing import Any, Dict, Iterator, Optional
 from . import FastAPI
 
 class Response:
     """Minimal response object mimicking ``requests.Response``."""
-    def __init__(self, status_code: int, data: Any) -> None:
+    def __init__(self, status_code: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
         self.status_code = status_code
         self._data = data
+        self.headers: Dict[str, str] = dict(headers or {})
     def json(self) -> Any:
+        """Payload, decoding a raw JSON body such as pre-encoded bytes."""
+        data = self.content
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return json.loads(bytes(data))
+        return data
+    @property
+    def content(self) -> Any:
+        """Raw payload, e.g. the bytes of a binary response.
+
+        A streamed body is read to the end and returned as bytes.
+        """
+        if isinstance(self._data, Iterator):
+            self._data = b"".join(self.iter_bytes())
         return self._data
+    def iter_bytes(self) -> Iterator[bytes]:
+        """Yield a streamed body chunk by chunk as it is produced."""
+        if not isinstance(self._data, Iterator):
+            yield self.content
+            return
+        for chunk in self._data:
+            yield chunk.encode() if isinstance(chunk, str) else chunk
 
 class TestClient:
     """Synchronous test client for the stubbed :class:`FastAPI` apps."""
     def __init__(self, app: FastAPI) -> None:
         self.app = app
-    def get(self, path: str) -> Response:
-        status, data = self.app.handle_request("GET", path)
-        return Response(status, data)
-    def post(self, path: str, json: Any = None) -> Response:
-        status, data = self.app.handle_request("POST", path, json)
-        return Response(status, data)
+    def get(self, path: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*self.app.dispatch("GET", path, None, headers))
+    def post(self, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*self.app.dispatch("POST", path, json, headers))
+    def put(self, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*self.app.dispatch("PUT", path, json, headers))
+    def patch(self, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*self.app.dispatch("PATCH", path, json, headers))
+    def delete(self, path: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*self.app.dispatch("DELETE", path, None, headers))
+
+class AsyncTestClient:
+    """Asynchronous test client awaiting :py:meth:`FastAPI.handle_request_async`.
+
+    All requests run on the caller's event loop, so ``asyncio.gather`` over
+    several calls exercises ``async def`` handlers concurrently.
+    """
+    def __init__(self, app: FastAPI) -> None:
+        self.app = app
+    async def get(self, path: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*await self.app.dispatch_async("GET", path, None, headers))
+    async def post(self, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*await self.app.dispatch_async("POST", path, json, headers))
+    async def put(self, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*await self.app.dispatch_async("PUT", path, json, headers))
+    async def patch(self, path: str, json: Any = None, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*await self.app.dispatch_async("PATCH", path, json, headers))
+    async def delete(self, path: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(*await self.app.dispatch_async("DELETE", path, None, headers))
@@ -0,0 +1,27 @@
+"""Print latency waterfalls of exported traces.
+
+Reads a JSON lines file written by :meth:`fastapi.tracing.SpanCollector.export`
+and draws every trace in it, or only the given trace ids::
+
+    python -m fastapi.traceview traces.jsonl [trace_id ...]
+"""
+
+import sys
+from typing import Any, Dict, List
+
+from .tracing import load, waterfall
+
+
+def main(argv: List[str]) -> None:
+    if not argv:
+        sys.exit("usage: python -m fastapi.traceview TRACES.jsonl [TRACE_ID ...]")
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for record in load(argv[0]):
+        traces.setdefault(record["trace_id"], []).append(record)
+    for trace_id in argv[1:] or list(traces):
+        print(waterfall(traces.get(trace_id, [])))
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,266 @@
+"""Request tracing across services for the stub.
+
+A trace follows one user action through every service it touches: the
+gateway's ``POST /bot/webhook``, the bot's ``POST /webhook`` and its
+``/task`` command, the gateway's ``POST /task`` and finally the task
+service's ``POST /tasks``.  Each of those steps is a :class:`Span` with a
+wall-clock start, a duration and the id of the span it was called from, so
+the spans of one trace form a tree that :func:`waterfall` draws as per-hop
+latency bars.
+
+The active span lives in a :class:`contextvars.ContextVar`, so it follows
+``await`` chains and tasks created with :func:`asyncio.gather` without
+being passed around.  Between services the context travels in the W3C
+``traceparent`` request header (``00-<trace id>-<span id>-<flags>``):
+:func:`inject` adds it to outgoing headers and the stub's dispatch picks it
+up with :func:`extract` and opens a server span for the handler.  Only
+requests carrying a sampled ``traceparent``, or sampled at an application
+with :attr:`FastAPI.trace_sample_rate` set (the gateway, where traces
+start), are traced; every other request pays one dict lookup.
+
+Finished spans go to a bounded in-process :class:`SpanCollector`, by
+default the process-wide :data:`COLLECTOR`.  :meth:`SpanCollector.export`
+appends them to a JSON lines file, which is also written at exit when
+``TRACE_EXPORT_PATH`` is set.  To read the waterfalls back::
+
+    python -m fastapi.traceview traces.jsonl [trace_id ...]
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+TRACEPARENT = "traceparent"
+
+# Finished spans kept in memory; the oldest are dropped beyond this.
+DEFAULT_MAX_SPANS = 100_000
+
+# Width, in characters, of the bars drawn by :func:`waterfall`.
+BAR_WIDTH = 40
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+def new_trace_id() -> str:
+    """Random 128-bit trace id as 32 hex digits."""
+    return f"{random.getrandbits(128):032x}"
+
+
+def new_span_id() -> str:
+    """Random 64-bit span id as 16 hex digits."""
+    return f"{random.getrandbits(64):016x}"
+
+
+class Span:
+    """One timed operation of a trace."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "service", "start", "duration", "attributes", "_started")
+
+    def __init__(
+        self, name: str, service: str, trace_id: str, parent_id: Optional[str] = None, **attributes: Any
+    ) -> None:
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.attributes = attributes
+        # Wall clock for lining up services offline, a monotonic clock for
+        # the duration.
+        self.start = time.time_ns()
+        self.duration: Optional[int] = None
+        self._started = time.perf_counter_ns()
+
+    def child(self, name: str, service: Optional[str] = None, **attributes: Any) -> "Span":
+        """Start a span of the same trace called from this one."""
+        return Span(name, self.service if service is None else service, self.trace_id, self.span_id, **attributes)
+
+    def finish(self, collector: Optional["SpanCollector"] = None, **attributes: Any) -> None:
+        """Stop the clock and hand the span to ``collector``."""
+        self.duration = time.perf_counter_ns() - self._started
+        self.attributes.update(attributes)
+        (collector or COLLECTOR).add(self)
+
+    @property
+    def traceparent(self) -> str:
+        """``traceparent`` header value naming this span as the parent."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class SpanCollector:
+    """Bounded, thread-safe store of finished spans."""
+
+    def __init__(self, max_spans: int = DEFAULT_MAX_SPANS) -> None:
+        self._spans: Deque[Span] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def add(self, span: Span) -> None:
+        # ``deque.append`` is atomic; the lock only guards snapshots.
+        self._spans.append(span)
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        """Finished spans in completion order, optionally of one trace."""
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id is None:
+            return spans
+        return [span for span in spans if span.trace_id == trace_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+    def export(self, path: str, clear: bool = True) -> int:
+        """Append the spans to the JSON lines file ``path``.
+
+        Returns the number of spans written.  With ``clear`` they are
+        removed from memory, so repeated exports do not repeat spans.
+        """
+        with self._lock:
+            spans = list(self._spans)
+            if clear:
+                self._spans.clear()
+        with open(path, "a", encoding="utf-8") as handle:
+            for span in spans:
+                handle.write(json.dumps(span.to_dict(), separators=(",", ":")) + "\n")
+        return len(spans)
+
+
+COLLECTOR = SpanCollector(int(os.environ.get("TRACE_MAX_SPANS", DEFAULT_MAX_SPANS)))
+if os.environ.get("TRACE_EXPORT_PATH"):
+    atexit.register(COLLECTOR.export, os.environ["TRACE_EXPORT_PATH"])
+
+
+def current() -> Optional[Span]:
+    """The span of the running request, if it is traced."""
+    return _current.get()
+
+
+def activate(span: Optional[Span]) -> contextvars.Token:
+    """Make ``span`` current; pass the token to :func:`deactivate`."""
+    return _current.set(span)
+
+
+def deactivate(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def inject(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Add the current span's ``traceparent`` to ``headers`` (or a new dict)."""
+    headers = {} if headers is None else headers
+    span = _current.get()
+    if span is not None:
+        headers[TRACEPARENT] = span.traceparent
+    return headers
+
+
+def extract(headers: Optional[Dict[str, str]]) -> Optional[Tuple[str, str, bool]]:
+    """Parse ``(trace_id, parent_span_id, sampled)`` from request headers.
+
+    Returns ``None`` when there is no well-formed ``traceparent``.
+    """
+    if not headers:
+        return None
+    value = headers.get(TRACEPARENT)
+    if value is None:
+        for key, candidate in headers.items():
+            if key.lower() == TRACEPARENT:
+                value = candidate
+                break
+        else:
+            return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+@contextmanager
+def span(name: str, service: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time the enclosed block as a child of the current span.
+
+    Outside a traced request nothing is recorded and ``None`` is yielded.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, service, **attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.attributes["error"] = type(exc).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def load(path: str) -> List[Dict[str, Any]]:
+    """Read spans exported by :meth:`SpanCollector.export`."""
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def waterfall(spans: List[Any]) -> str:
+    """Draw the spans of one trace as an indented latency waterfall.
+
+    Accepts :class:`Span` objects or their exported dicts.  Each line shows
+    a span's service and name, its offset from the start of the trace and
+    its duration in milliseconds, and a bar placing it on the timeline.
+    """
+    records = [span.to_dict() if isinstance(span, Span) else span for span in spans]
+    if not records:
+        return ""
+    by_id = {record["span_id"]: record for record in records}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for record in records:
+        # Spans whose parent was not collected are drawn as roots.
+        parent = record["parent_id"] if record["parent_id"] in by_id else None
+        children.setdefault(parent, []).append(record)
+    origin = min(record["start"] for record in records)
+    end = max(record["start"] + (record["duration"] or 0) for record in records)
+    scale = BAR_WIDTH / max(end - origin, 1)
+    lines = [f"trace {records[0]['trace_id']}  {(end - origin) / 1e6:.3f} ms"]
+
+    def draw(record: Dict[str, Any], depth: int) -> None:
+        offset = record["start"] - origin
+        duration = record["duration"] or 0
+        left = int(offset * scale)
+        bar = " " * left + "#" * max(1, int(duration * scale))
+        label = f"{'  ' * depth}{record['service']}: {record['name']}"
+        lines.append(f"{label:<56} {offset / 1e6:9.3f} {duration / 1e6:9.3f}  |{bar:<{BAR_WIDTH}}|")
+        for child in sorted(children.get(record["span_id"], []), key=lambda item: item["start"]):
+            draw(child, depth + 1)
+
+    for root in sorted(children.get(None, []), key=lambda item: item["start"]):
+        draw(root, 0)
+    return "\n".join(lines)
@@ -0,0 +1,162 @@
+"""Load balancing strategies used by the API gateway.
+
+A strategy receives the list of backend instances registered for a service
+and picks one per request via :meth:`Balancer.next`.  Backends are duck
+typed: strategies read ``healthy``, ``in_flight``, ``ewma_latency`` and
+``weight`` from them.  Unhealthy (ejected) backends are skipped; if every
+backend is ejected the strategy fails open and considers all of them, so a
+service is never made unreachable by its health checks alone.
+
+A backend that has degraded but still answers ``200`` never trips the
+gateway's failure-based ejection, yet a share of requests sent to it is
+enough to set the tail latency of the whole service.
+:meth:`Balancer.eject_outliers` therefore also ejects latency outliers:
+backends with at least ``OUTLIER_MIN_SAMPLES`` latency samples (``samples``)
+whose EWMA latency exceeds ``OUTLIER_FACTOR`` times the median of their
+peers', and that median by at least ``OUTLIER_MIN_EXCESS`` seconds
+(``eject()`` takes them out of rotation), never more than half the pool at
+once.  Ejection forgets a backend's latency, so when it returns it
+is judged again on fresh samples.
+
+All strategies are safe to call from several threads.
+"""
+
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# A backend whose EWMA latency exceeds this multiple of the median of its
+# peers' is a latency outlier.
+OUTLIER_FACTOR = 5.0
+# Smaller gaps are scheduling noise on sub-millisecond calls, not a
+# degraded backend.
+OUTLIER_MIN_EXCESS = 0.005
+# Latency samples a backend needs before it can be judged an outlier.
+OUTLIER_MIN_SAMPLES = 3
+# Latency outliers are never ejected beyond this share of the pool.
+MAX_OUTLIER_SHARE = 0.5
+
+
+class Balancer:
+    """Base class holding the backend list and the health filter."""
+    def __init__(self, items: List[Any]):
+        if not items:
+            raise ValueError("at least one backend is required")
+        self.items = items
+        self._lock = threading.Lock()
+    def candidates(self) -> Sequence[Any]:
+        """Return the healthy backends, or all of them if none is healthy."""
+        healthy = [item for item in self.items if item.healthy]
+        return healthy or self.items
+    def next(self) -> Any:
+        raise NotImplementedError
+    def eject_outliers(self) -> List[Any]:
+        """Eject the healthy backends that are latency outliers; return them."""
+        ejected = []
+        with self._lock:
+            judged = [item for item in self.items if item.healthy and item.samples >= OUTLIER_MIN_SAMPLES]
+            ejected_already = sum(not item.healthy for item in self.items)
+            budget = int(len(self.items) * MAX_OUTLIER_SHARE) - ejected_already
+            if len(judged) < 2 or budget <= 0:
+                return ejected
+            for item in sorted(judged, key=lambda item: item.ewma_latency, reverse=True)[:budget]:
+                typical = _median(sorted(peer.ewma_latency for peer in judged if peer is not item))
+                if item.ewma_latency <= max(OUTLIER_FACTOR * typical, typical + OUTLIER_MIN_EXCESS):
+                    break
+                item.eject()
+                ejected.append(item)
+        return ejected
+
+
+class RoundRobin(Balancer):
+    """Cycle through healthy backends in registration order."""
+    def __init__(self, items: List[Any]):
+        super().__init__(items)
+        self.index = 0
+    def next(self) -> Any:
+        with self._lock:
+            for _ in range(len(self.items)):
+                handler = self.items[self.index]
+                self.index = (self.index + 1) % len(self.items)
+                if handler.healthy:
+                    return handler
+            # Everything is ejected: fail open and keep rotating.
+            return handler
+
+
+class WeightedRoundRobin(Balancer):
+    """Smooth weighted round robin, as used by nginx.
+
+    Each pick adds every backend's ``weight`` to its running score, chooses
+    the highest score and subtracts the total weight from it.  Over a cycle
+    each backend is chosen in proportion to its weight, evenly interleaved.
+    """
+    def __init__(self, items: List[Any]):
+        super().__init__(items)
+        self._scores: Dict[int, int] = {id(item): 0 for item in items}
+    def next(self) -> Any:
+        with self._lock:
+            candidates = self.candidates()
+            total = 0
+            best = None
+            for item in candidates:
+                self._scores[id(item)] += item.weight
+                total += item.weight
+                if best is None or self._scores[id(item)] > self._scores[id(best)]:
+                    best = item
+            self._scores[id(best)] -= total
+            return best
+
+
+class LeastOutstanding(Balancer):
+    """Pick the backend with the fewest requests in flight.
+
+    Ties are broken by rotating the starting point so idle backends share
+    the load evenly.
+    """
+    def __init__(self, items: List[Any]):
+        super().__init__(items)
+        self._offset = 0
+    def next(self) -> Any:
+        with self._lock:
+            candidates = self.candidates()
+            self._offset = (self._offset + 1) % len(candidates)
+            ordered = candidates[self._offset:] + candidates[:self._offset]
+            return min(ordered, key=lambda item: item.in_flight)
+
+
+class PowerOfTwoChoices(Balancer):
+    """Sample two backends and keep the one with the lower expected latency.
+
+    The cost of a backend is its EWMA latency scaled by the requests already
+    queued on it, which steers traffic away from slow instances without the
+    herding that always picking the global minimum causes.
+    """
+    def __init__(self, items: List[Any], rng: Optional[random.Random] = None):
+        super().__init__(items)
+        self._rng = rng or random.Random()
+    def next(self) -> Any:
+        with self._lock:
+            candidates = self.candidates()
+            if len(candidates) == 1:
+                return candidates[0]
+            first, second = self._rng.sample(candidates, 2)
+        return first if _cost(first) <= _cost(second) else second
+
+
+def _median(values: List[float]) -> float:
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def _cost(item: Any) -> float:
+    # Floor the latency so a backend without samples still pays for its queue.
+    return max(item.ewma_latency, 1e-6) * (item.in_flight + 1)
+
+
+STRATEGIES: Dict[str, Callable[[List[Any]], Balancer]] = {
+    "round_robin": RoundRobin,
+    "weighted_round_robin": WeightedRoundRobin,
+    "least_outstanding": LeastOutstanding,
+    "p2c": PowerOfTwoChoices,
+}
@@ -0,0 +1,134 @@
+"""Micro-batching of concurrent create requests in the gateway.
+
+A :class:`Coalescer` collects single-item requests that arrive within a short
+window and sends them to the backend as one batch call, then resolves each
+caller with its own item of the batch response.  A window closes after
+``max_delay`` seconds or as soon as ``max_items`` requests are waiting,
+whichever comes first.
+
+``send_batch(payloads)`` reports the batch calls it made as *parts*:
+``(positions, (status, data))`` pairs, each covering the payloads at
+``positions``.  A part must be applied all-or-nothing by the backend (the
+task service validates a whole batch before storing any of it), so one
+invalid payload fails every request of its part.  When a part is rejected
+with a 4xx status nothing of it was written, and the coalescer retries just
+that part's items one by one, giving each caller exactly the reply it would
+have received without batching; items of parts that succeeded are never
+sent again.  Other failures (for example ``503`` or ``504``) are returned
+to the callers of that part, as is a ``502`` when a successful reply does
+not hold one item per request of its part, or when no part covers a
+request: the items cannot be matched to their requests, and retrying them
+could create them twice.
+
+Each event loop submitting requests gets its own window, so callers on
+different loops (successive ``asyncio.run`` calls, or a nested synchronous
+request run on a worker thread) are never batched together or dropped.
+"""
+
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+DEFAULT_MAX_ITEMS = 64
+DEFAULT_MAX_DELAY = 0.005
+
+Reply = Tuple[int, Any]
+# Positions of the payloads one batch call carried, and its reply.
+Part = Tuple[List[int], Reply]
+
+
+class _Window:
+    """Requests waiting to be batched on one event loop."""
+
+    __slots__ = ("pending", "timer")
+
+    def __init__(self) -> None:
+        self.pending: List[Tuple[Any, "asyncio.Future[Reply]"]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class Coalescer:
+    """Group concurrent :meth:`submit` calls into batch calls."""
+
+    def __init__(
+        self,
+        send_batch: Callable[[List[Any]], Awaitable[List[Part]]],
+        send_one: Callable[[Any], Awaitable[Reply]],
+        max_items: int = DEFAULT_MAX_ITEMS,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ) -> None:
+        self.send_batch = send_batch
+        self.send_one = send_one
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.batches = 0
+        self.items = 0
+        self._windows: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Window]" = weakref.WeakKeyDictionary()
+        # Strong references to in-flight batch tasks.
+        self._sending: Set["asyncio.Task[None]"] = set()
+
+    async def submit(self, payload: Any) -> Reply:
+        """Queue ``payload`` for the current window and await its reply."""
+        loop = asyncio.get_running_loop()
+        window = self._windows.get(loop)
+        if window is None:
+            window = self._windows[loop] = _Window()
+        future: "asyncio.Future[Reply]" = loop.create_future()
+        window.pending.append((payload, future))
+        if len(window.pending) >= self.max_items:
+            self._flush(window)
+        elif window.timer is None:
+            window.timer = loop.call_later(self.max_delay, self._flush, window)
+        return await future
+
+    def _flush(self, window: _Window) -> None:
+        if window.timer is not None:
+            window.timer.cancel()
+            window.timer = None
+        batch, window.pending = window.pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[Tuple[Any, "asyncio.Future[Reply]"]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            if len(batch) == 1:
+                replies = [await self.send_one(batch[0][0])]
+            else:
+                replies = await self._send_many([payload for payload, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), reply in zip(batch, replies):
+            if not future.done():
+                future.set_result(reply)
+
+    async def _send_many(self, payloads: List[Any]) -> List[Reply]:
+        replies: List[Optional[Reply]] = [None] * len(payloads)
+        # Positions of rejected parts, which wrote nothing.
+        retry: List[int] = []
+        for positions, (status, data) in await self.send_batch(payloads):
+            if status == 200:
+                if isinstance(data, list) and len(data) == len(positions):
+                    for position, item in zip(positions, data):
+                        replies[position] = (200, item)
+                    continue
+                received = len(data) if isinstance(data, list) else "no"
+                detail = f"batch reply has {received} items for {len(positions)} requests"
+                status, data = 502, {"detail": detail}
+            elif 400 <= status < 500:
+                retry.extend(positions)
+                continue
+            for position in positions:
+                replies[position] = (status, data)
+        if retry:
+            retried = await asyncio.gather(*(self.send_one(payloads[position]) for position in retry))
+            for position, reply in zip(retry, retried):
+                replies[position] = reply
+        missing = (502, {"detail": "no batch reply for this request"})
+        return [missing if reply is None else reply for reply in replies]
@@ -1,61 +1,731 @@
 """API Gateway service.
 
 The gateway exposes a single HTTP interface and forwards requests to
-registered backend services using a simple round-robin strategy.
+registered backend services using a pluggable balancing strategy (round
+robin by default, see :mod:`balancing`).
 It relies on the minimal ``fastapi`` stub shipped with the repository and
-is intentionally synchronous and lightweight so it can run in restricted
-environments such as this kata.
+is intentionally lightweight so it can run in restricted environments such
+as this kata.  Besides the per-route metrics every app serves at
+``GET /metrics``, the gateway's adds request, error, in-flight, health and
+latency series for each backend instance.
+
+Requests can be forwarded synchronously with :meth:`APIGateway.forward` or
+concurrently with :meth:`APIGateway.forward_async`.  The async path, used by
+the gateway's own endpoints, bounds the number of in-flight requests per
+backend instance, queues a limited number of extra callers and sheds load
+with ``503`` once that queue is full; requests exceeding the timeout get a
+``504``.
+
+Backends are health checked passively and actively.  A backend answering
+``max_failures`` consecutive requests with a 5xx status (or an exception) is
+ejected for ``eject_seconds``, and so is a replica whose latency has become
+an outlier among its peers (see :meth:`balancing.Balancer.eject_outliers`);
+:meth:`APIGateway.probe` polls each backend's health endpoint and ejects or
+restores it accordingly.
+
+GET responses of services registered with ``cache_ttl`` are served from a
+:class:`~response_cache.ResponseCache`; any other method forwarded to such a
+service invalidates its cached responses.  The task endpoints emit ETags and
+answer ``If-None-Match`` revalidations with an empty ``304``.
+
+Backends may answer with pre-encoded JSON bytes (the task service does).
+The gateway passes such bodies through, and caches them, as opaque bytes
+whenever it does not need to look inside; only merging shard replies,
+splitting batches and paging decode them (see :func:`decode`).
+
+:meth:`APIGateway.coalesce` turns on micro-batching for a create route:
+concurrent async POSTs to it are merged into calls to the service's batch
+route (see :mod:`coalescer`) while every caller still gets its own reply.
+
+Stateful services whose instances each own part of the data are registered
+with :meth:`APIGateway.register_shards` instead.  Requests carrying a shard
+key (``chat_id`` for tasks) go to the instance owning it on a consistent
+hash ring (see :mod:`sharding`), batches are split per owner, and requests
+without a key are scattered to every shard and their replies merged.
+
+Requests entering the gateway start a trace at the rate set by
+``TRACE_SAMPLE_RATE`` (a share between 0 and 1, off by default; requests
+that arrive with a sampled ``traceparent`` header are always traced).
+Each backend call is timed as a span of it and
+passes the trace context on in the ``traceparent`` header, so the spans
+recorded by the bot and task services join the same trace (see
+:mod:`fastapi.tracing`).
 """
 
-from fastapi import FastAPI
+import asyncio
+import json
+import os
+import threading
+import time
+from fastapi import FastAPI, Header, HTTPException, Response, tracing
+from fastapi.metrics import Histogram, escape, histogram_lines
 from fastapi.testclient import TestClient
-from typing import Callable, Dict, List, Tuple, Any
-
-class RoundRobin:
-    """Cycle through a list of backend handlers."""
-    def __init__(self, items: List[Callable[[str, str, Any], Tuple[int, Any]]]):
-        self.items = items
-        self.index = 0
-    def next(self) -> Callable[[str, str, Any], Tuple[int, Any]]:
-        handler = self.items[self.index]
-        self.index = (self.index + 1) % len(self.items)
-        return handler
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Any, Union
+from urllib.parse import urlencode
+
+from balancing import STRATEGIES, Balancer
+from coalescer import DEFAULT_MAX_DELAY, DEFAULT_MAX_ITEMS, Coalescer, Part
+from response_cache import DEFAULT_MAX_ENTRIES, ResponseCache, compute_etag
+from sharding import DEFAULT_VNODES, HashRing, Reply, first_found, merge_by_id
+
+# Page size used by ``GET /task`` when the caller does not supply ``limit``
+# and the upper bound accepted from callers.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Default async limits applied to every backend instance.
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_MAX_QUEUE = 128
+DEFAULT_TIMEOUT = 10.0
+
+JSON_MEDIA_TYPE = "application/json"
+
+# Passive health checking and latency tracking defaults.
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_EJECT_SECONDS = 10.0
+EWMA_ALPHA = 0.3
+
+
+def with_query(path: str, params: Dict[str, Any]) -> str:
+    """Append the non-``None`` entries of ``params`` to ``path``."""
+    query = urlencode({key: value for key, value in params.items() if value is not None})
+    if not query:
+        return path
+    return f"{path}{'&' if '?' in path else '?'}{query}"
+
+class Backend:
+    """One backend instance reachable through a sync and an async call.
+
+    Calling the object performs a synchronous request.  :meth:`call_async`
+    admits at most ``max_concurrency`` requests at a time; up to
+    ``max_queue`` further callers wait for a slot and any beyond that are
+    rejected immediately with ``503``.  The timeout covers both the wait and
+    the request itself.
+
+    Both paths keep the statistics read by the balancing strategies: the
+    number of requests in flight, an EWMA of the latency and the number of
+    consecutive failures.  Request and error totals and a latency histogram
+    are kept alongside for ``GET /metrics``.
+    """
+    def __init__(
+        self,
+        call: Callable[[str, str, Any], Tuple[int, Any]],
+        call_async: Callable[[str, str, Any], Awaitable[Tuple[int, Any]]],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        weight: int = 1,
+        health_path: str = "/health",
+        max_failures: int = DEFAULT_MAX_FAILURES,
+        eject_seconds: float = DEFAULT_EJECT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        name: str = "",
+    ) -> None:
+        self.name = name
+        self.call = call
+        self._call_async = call_async
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.weight = weight
+        self.health_path = health_path
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.clock = clock
+        self.in_flight = 0
+        self.pending = 0
+        self.ewma_latency = 0.0
+        # Latency samples behind ``ewma_latency``.
+        self.samples = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self._stats_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    def __call__(self, method: str, path: str, payload: Any = None) -> Tuple[int, Any]:
+        span, token = self._start_span(method, path)
+        with self._stats_lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        ok = False
+        status = None
+        try:
+            status, data = self.call(method, path, payload)
+            ok = status < 500
+            return status, data
+        finally:
+            self.record(time.perf_counter() - start, ok)
+            if span is not None:
+                tracing.deactivate(token)
+                span.finish(status=status)
+    def _start_span(self, method: str, path: str) -> Tuple[Optional[tracing.Span], Any]:
+        # Client span of a traced request; the call injects its context.
+        parent = tracing.current()
+        if parent is None:
+            return None, None
+        span = parent.child(f"{method} {path.partition('?')[0]}", backend=self.name)
+        return span, tracing.activate(span)
+    @property
+    def healthy(self) -> bool:
+        """``False`` while the backend is ejected."""
+        return self.clock() >= self.ejected_until
+    @property
+    def waiting(self) -> int:
+        """Number of admitted async requests still waiting for a slot."""
+        return self.pending - self.in_flight
+    def record(self, latency: float, ok: bool) -> None:
+        """Account for a finished request and eject on repeated failures."""
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.latency.record(int(latency * 1e9))
+            self.samples += 1
+            if self.ewma_latency:
+                self.ewma_latency += EWMA_ALPHA * (latency - self.ewma_latency)
+            else:
+                self.ewma_latency = latency
+            if ok:
+                self.failures = 0
+                return
+            self.errors += 1
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.eject()
+    def eject(self, seconds: Optional[float] = None) -> None:
+        """Take the backend out of rotation for ``seconds``.
+
+        Its latency average is dropped, so that it is judged on fresh
+        samples when it returns.
+        """
+        self.ejected_until = self.clock() + (self.eject_seconds if seconds is None else seconds)
+        self.ewma_latency = 0.0
+        self.samples = 0
+    def restore(self) -> None:
+        """Put an ejected backend back into rotation."""
+        self.failures = 0
+        self.ejected_until = 0.0
+    def _limiter(self) -> asyncio.Semaphore:
+        # Semaphores are bound to one event loop; recreate it if the gateway
+        # is driven from a different loop (e.g. successive ``asyncio.run``).
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+    async def call_async(self, method: str, path: str, payload: Any = None) -> Tuple[int, Any]:
+        """Perform a request subject to the concurrency and queue limits."""
+        if self.pending >= self.max_concurrency + self.max_queue:
+            return 503, {"detail": "backend overloaded"}
+        # The span covers the wait for a slot as well as the request.
+        span, token = self._start_span(method, path)
+        self.pending += 1
+        status = None
+        try:
+            status, data = await asyncio.wait_for(self._run(method, path, payload), self.timeout)
+            return status, data
+        except asyncio.TimeoutError:
+            status = 504
+            return 504, {"detail": "backend timeout"}
+        finally:
+            self.pending -= 1
+            if span is not None:
+                tracing.deactivate(token)
+                span.finish(status=status)
+    async def _run(self, method: str, path: str, payload: Any) -> Tuple[int, Any]:
+        async with self._limiter():
+            with self._stats_lock:
+                self.in_flight += 1
+            start = time.perf_counter()
+            ok = False
+            try:
+                status, data = await self._call_async(method, path, payload)
+                ok = status < 500
+                return status, data
+            finally:
+                # Runs on cancellation too, so timeouts count as failures.
+                self.record(time.perf_counter() - start, ok)
 
 class APIGateway:
     """Registry and dispatcher for backend services."""
-    def __init__(self) -> None:
-        self.backends: Dict[str, RoundRobin] = {}
-    def register(self, name: str, apps: List[FastAPI]) -> None:
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        max_failures: int = DEFAULT_MAX_FAILURES,
+        eject_seconds: float = DEFAULT_EJECT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        cache_size: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.backends: Dict[str, Balancer] = {}
+        self.shards: Dict[str, HashRing[Backend]] = {}
+        # Payload field holding the shard key of each sharded service.
+        self.shard_fields: Dict[str, str] = {}
+        self.cache = ResponseCache(cache_size, clock)
+        self.coalescers: Dict[Tuple[str, str], Coalescer] = {}
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.clock = clock
+    def register(
+        self,
+        name: str,
+        apps: List[FastAPI],
+        strategy: Union[str, Callable[[List[Backend]], Balancer]] = "round_robin",
+        weights: Optional[List[int]] = None,
+        health_path: str = "/health",
+        cache_ttl: Optional[float] = None,
+    ) -> None:
         """Register FastAPI applications as backends for ``name``.
 
         The gateway works with both the tiny in-repo FastAPI stub and the real
         framework.  If a backend application exposes ``handle_request`` (the
-        stubbed API) it is used directly.  Otherwise the service falls back to
-        ``TestClient`` which is compatible with the real FastAPI package.
+        stubbed API) it is used directly, together with
+        ``handle_request_async`` for the async path.  Otherwise the service
+        falls back to ``TestClient`` which is compatible with the real FastAPI
+        package; its async path runs the client in a worker thread.
+
+        ``strategy`` names one of :data:`balancing.STRATEGIES` or is a
+        factory taking the backend list.  ``weights`` feed the weighted round
+        robin strategy and ``health_path`` is polled by :meth:`probe`.
+        ``cache_ttl`` enables the response cache for the service's GETs.
         """
-        handlers: List[Callable[[str, str, Any], Tuple[int, Any]]] = []
-        for app in apps:
-            if hasattr(app, "handle_request"):
-                handlers.append(app.handle_request)
-                continue
+        backends = [
+            self._backend(app, weights[index] if weights else 1, health_path, f"{name}-{index}")
+            for index, app in enumerate(apps)
+        ]
+        factory = STRATEGIES[strategy] if isinstance(strategy, str) else strategy
+        self.backends[name] = factory(backends)
+        self.shards.pop(name, None)
+        self.shard_fields.pop(name, None)
+        # Responses of the previous backends must not be served again.
+        self.cache.invalidate(name)
+        if cache_ttl:
+            self.cache.enable(name, cache_ttl)
+    def _backend(self, app: FastAPI, weight: int, health_path: str, name: str) -> Backend:
+        # Every call passes the trace context of the request being forwarded.
+        if hasattr(app, "handle_request"):
+
+            def call(method: str, path: str, payload: Any = None, *, _handle=app.handle_request) -> Tuple[int, Any]:
+                return _handle(method, path, payload, tracing.inject() or None)
+
+            call_async = None
+            handle_async = getattr(app, "handle_request_async", None)
+            if handle_async is not None:
+
+                async def call_async(
+                    method: str, path: str, payload: Any = None, *, _handle=handle_async
+                ) -> Tuple[int, Any]:
+                    return await _handle(method, path, payload, tracing.inject() or None)
+
+        else:
             client = TestClient(app)
 
-            def _call(method: str, path: str, payload: Any = None, *, _c=client) -> Tuple[int, Any]:
-                if method == "GET":
-                    resp = _c.get(path)
+            def call(method: str, path: str, payload: Any = None, *, _c=client) -> Tuple[int, Any]:
+                headers = tracing.inject() or None
+                if method in ("GET", "DELETE"):
+                    resp = getattr(_c, method.lower())(path, headers=headers)
                 else:
-                    resp = _c.post(path, json=payload)
+                    resp = getattr(_c, method.lower())(path, json=payload, headers=headers)
+                if resp.status_code < 400 and resp.headers.get("content-type", "").startswith(JSON_MEDIA_TYPE):
+                    # Successful JSON bodies are passed on without decoding.
+                    return resp.status_code, resp.content
                 return resp.status_code, resp.json()
 
-            handlers.append(_call)
-        self.backends[name] = RoundRobin(handlers)
-    def forward(self, name: str, method: str, path: str, payload: Any = None) -> Tuple[int, Any]:
-        """Forward a request to the next backend registered for ``name``."""
-        backend = self.backends[name].next()
-        return backend(method, path, payload)
+            call_async = None
+        if call_async is None:
+
+            async def call_async(method: str, path: str, payload: Any = None, *, _call=call) -> Tuple[int, Any]:
+                return await asyncio.to_thread(_call, method, path, payload)
+
+        return Backend(
+            call,
+            call_async,
+            self.max_concurrency,
+            self.max_queue,
+            self.timeout,
+            weight=weight,
+            health_path=health_path,
+            max_failures=self.max_failures,
+            eject_seconds=self.eject_seconds,
+            clock=self.clock,
+            name=name,
+        )
+    def register_shards(
+        self,
+        name: str,
+        apps: List[FastAPI],
+        shard_names: Optional[List[str]] = None,
+        key: str = "chat_id",
+        vnodes: int = DEFAULT_VNODES,
+        health_path: str = "/health",
+        cache_ttl: Optional[float] = None,
+    ) -> None:
+        """Register FastAPI applications as shards of a stateful service.
+
+        Each application owns the keys (the ``key`` field of request
+        payloads, e.g. ``chat_id``) that hash to it on a ring with
+        ``vnodes`` virtual nodes per shard.  ``shard_names`` fix each
+        shard's place on the ring and default to ``"<name>-<index>"``; keep
+        them stable, since renaming a shard moves its keys.  Shards are also
+        reachable round robin for requests without a key, and are probed
+        like any other backend.
+        """
+        names = shard_names or [f"{name}-{index}" for index in range(len(apps))]
+        if len(names) != len(apps):
+            raise ValueError("one shard name per application is required")
+        ring: HashRing[Backend] = HashRing(vnodes)
+        backends = []
+        for shard_name, app in zip(names, apps):
+            backend = self._backend(app, 1, health_path, shard_name)
+            ring.add(shard_name, backend)
+            backends.append(backend)
+        self.shards[name] = ring
+        self.shard_fields[name] = key
+        self.backends[name] = STRATEGIES["round_robin"](backends)
+        self.cache.invalidate(name)
+        if cache_ttl:
+            self.cache.enable(name, cache_ttl)
+    def add_shard(self, name: str, shard_name: str, app: FastAPI, health_path: str = "/health") -> None:
+        """Add an instance to a sharded service.
+
+        Only the keys landing on the new shard's arcs of the ring, about
+        ``1/N`` of them, change owner; moving their data is up to the
+        operator.
+        """
+        backend = self._backend(app, 1, health_path, shard_name)
+        self.shards[name].add(shard_name, backend)
+        self.backends[name].items.append(backend)
+        self.cache.invalidate(name)
+    def sharded(self, name: str) -> bool:
+        """``True`` if ``name`` was registered with :meth:`register_shards`."""
+        return name in self.shards
+    def shard_key(self, name: str, payload: Any) -> Any:
+        """Shard key carried by ``payload`` for ``name``, or ``None``."""
+        field = self.shard_fields.get(name)
+        if field is None or not isinstance(payload, dict):
+            return None
+        return payload.get(field)
+    def _pick(self, name: str, shard_key: Any = None) -> Backend:
+        ring = self.shards.get(name)
+        if ring is not None and shard_key is not None:
+            return ring.owner(shard_key)
+        return self.backends[name].next()
+    def forward(self, name: str, method: str, path: str, payload: Any = None, shard_key: Any = None) -> Tuple[int, Any]:
+        """Forward a request to the next backend registered for ``name``.
+
+        For a sharded service the request goes to the owner of
+        ``shard_key``, which defaults to the key found in ``payload``.
+        """
+        if method == "GET" and self.cache.enabled(name):
+            status, data, _ = self.get(name, path, shard_key)
+            return status, data
+        if shard_key is None:
+            shard_key = self.shard_key(name, payload)
+        backend = self._pick(name, shard_key)
+        status, data = backend(method, path, payload)
+        self._after_call(name, method, status)
+        return status, data
+    async def forward_async(
+        self, name: str, method: str, path: str, payload: Any = None, shard_key: Any = None
+    ) -> Tuple[int, Any]:
+        """Forward a request concurrently, honouring the backend's limits."""
+        if method == "GET" and self.cache.enabled(name):
+            status, data, _ = await self.get_async(name, path, shard_key)
+            return status, data
+        if method == "POST" and (name, path) in self.coalescers:
+            return await self.coalescers[(name, path)].submit(payload)
+        return await self._send_async(name, method, path, payload, shard_key)
+    async def _send_async(
+        self, name: str, method: str, path: str, payload: Any, shard_key: Any = None
+    ) -> Tuple[int, Any]:
+        if shard_key is None:
+            shard_key = self.shard_key(name, payload)
+        backend = self._pick(name, shard_key)
+        status, data = await backend.call_async(method, path, payload)
+        self._after_call(name, method, status)
+        return status, data
+    async def forward_batch_async(self, name: str, path: str, items: List[Any], batch_key: str = "tasks") -> Reply:
+        """POST ``{batch_key: items}`` and return the created items in order.
+
+        A sharded service receives one atomic batch per owning shard (see
+        :meth:`forward_batch_parts_async`), so the batch as a whole is not
+        atomic.  If every part fails, the first failure is returned.  If
+        only some fail, the reply is ``207`` with one entry per item: the
+        created item, or ``{"status": ..., "detail": ...}`` for an item of a
+        failed part, so the caller knows exactly which items were stored.
+        """
+        parts = await self.forward_batch_parts_async(name, path, items, batch_key)
+        if len(parts) == 1:
+            return parts[0][1]
+        merged: List[Any] = [None] * len(items)
+        failures = []
+        for indexes, (status, data) in parts:
+            if status >= 400:
+                detail = data.get("detail", "backend error") if isinstance(data, dict) else "backend error"
+                failures.append((status, data))
+                for index in indexes:
+                    merged[index] = {"status": status, "detail": detail}
+            else:
+                for index, item in zip(indexes, decode(data)):
+                    merged[index] = item
+        if len(failures) == len(parts):
+            return failures[0]
+        return (207 if failures else 200), merged
+
+    async def forward_batch_parts_async(
+        self, name: str, path: str, items: List[Any], batch_key: str = "tasks"
+    ) -> List[Part]:
+        """POST ``items`` as batches and return ``(positions, reply)`` per batch.
+
+        A service that is not sharded receives a single batch.  A sharded
+        one receives one batch per owning shard, sent concurrently; each of
+        those is atomic on its shard, so a failed part stored none of its
+        items while the other parts may have been stored.
+        """
+        if not self.sharded(name):
+            return [(list(range(len(items))), await self._send_async(name, "POST", path, {batch_key: items}))]
+        ring = self.shards[name]
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault(ring.owner_name(self.shard_key(name, item)), []).append(index)
+        replies = await asyncio.gather(*(
+            self._call_shard(name, shard_name, "POST", path, {batch_key: [items[index] for index in indexes]})
+            for shard_name, indexes in groups.items()
+        ))
+        return list(zip(groups.values(), replies))
+    async def _call_shard(self, name: str, shard_name: str, method: str, path: str, payload: Any) -> Reply:
+        status, data = await self.shards[name].shards[shard_name].call_async(method, path, payload)
+        self._after_write(name, method, status)
+        return status, data
+    async def scatter_async(self, name: str, method: str, path: str, payload: Any = None) -> List[Reply]:
+        """Send a request to every shard of ``name`` concurrently.
+
+        Returns the replies in shard order; a service that is not sharded
+        answers with a single reply from one of its replicas.
+        """
+        if not self.sharded(name):
+            return [await self._send_async(name, method, path, payload)]
+        replies = await asyncio.gather(*(backend.call_async(method, path, payload) for backend in self.shards[name]))
+        for status, _ in replies:
+            self._after_write(name, method, status)
+        return list(replies)
+    async def get_all_async(
+        self, name: str, path: str, merge: Callable[[List[Reply]], Reply]
+    ) -> Tuple[int, Any, Optional[str]]:
+        """Scatter a GET to every shard and combine the replies with ``merge``.
+
+        The combined reply goes through the response cache like the result
+        of :meth:`get_async`, which this is for services that are not
+        sharded.
+        """
+        if not self.sharded(name):
+            return await self.get_async(name, path)
+        entry = self.cache.get(name, path) if self.cache.enabled(name) else None
+        if entry is not None:
+            return entry.status, entry.data, entry.etag
+        generation = self.cache.generation(name)
+        status, data = merge(await self.scatter_async(name, "GET", path))
+        return self._store(name, path, status, data, generation)
+    def coalesce(
+        self,
+        name: str,
+        path: str,
+        batch_path: str,
+        batch_key: str = "tasks",
+        max_items: int = DEFAULT_MAX_ITEMS,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ) -> Coalescer:
+        """Merge concurrent async POSTs to ``path`` into batch requests.
+
+        Payloads arriving within ``max_delay`` seconds (or until
+        ``max_items`` are waiting) are sent as ``{batch_key: [...]}`` to
+        ``batch_path``, which must return the created items in order and
+        store nothing when it rejects a batch.
+        """
+
+        async def send_batch(payloads: List[Any]) -> List[Part]:
+            # The coalescer hands each caller its own item of each part's reply.
+            parts = await self.forward_batch_parts_async(name, batch_path, payloads, batch_key)
+            return [(positions, (status, decode(data))) for positions, (status, data) in parts]
+
+        async def send_one(payload: Any) -> Tuple[int, Any]:
+            return await self._send_async(name, "POST", path, payload)
+
+        coalescer = Coalescer(send_batch, send_one, max_items, max_delay)
+        self.coalescers[(name, path)] = coalescer
+        return coalescer
+    def get(self, name: str, path: str, shard_key: Any = None) -> Tuple[int, Any, Optional[str]]:
+        """Forward a GET through the response cache.
+
+        Returns ``(status, data, etag)``; ``etag`` is ``None`` unless the
+        response is cacheable.  ``shard_key`` selects the shard of a
+        sharded service.
+        """
+        entry = self.cache.get(name, path) if self.cache.enabled(name) else None
+        if entry is not None:
+            return entry.status, entry.data, entry.etag
+        generation = self.cache.generation(name)
+        status, data = self._pick(name, shard_key)("GET", path, None)
+        self._after_call(name, "GET", status)
+        return self._store(name, path, status, data, generation)
+    async def get_async(self, name: str, path: str, shard_key: Any = None) -> Tuple[int, Any, Optional[str]]:
+        """Asynchronous counterpart of :meth:`get`."""
+        entry = self.cache.get(name, path) if self.cache.enabled(name) else None
+        if entry is not None:
+            return entry.status, entry.data, entry.etag
+        generation = self.cache.generation(name)
+        status, data = await self._pick(name, shard_key).call_async("GET", path, None)
+        self._after_call(name, "GET", status)
+        return self._store(name, path, status, data, generation)
+    def _store(self, name: str, path: str, status: int, data: Any, generation: int) -> Tuple[int, Any, Optional[str]]:
+        if status != 200 or not self.cache.enabled(name):
+            return status, data, None
+        entry = self.cache.put(name, path, status, data, generation)
+        return status, data, entry.etag
+    def _after_call(self, name: str, method: str, status: int) -> None:
+        self._after_write(name, method, status)
+        # Shards own their data, so a slow one cannot be routed around.
+        if name not in self.shards:
+            self.backends[name].eject_outliers()
+    def _after_write(self, name: str, method: str, status: int) -> None:
+        # Anything but a GET may change the service's state.
+        if method != "GET" and status < 400 and self.cache.enabled(name):
+            self.cache.invalidate(name)
+    def probe(self) -> Dict[str, List[bool]]:
+        """Actively health check every backend.
+
+        Each backend's health endpoint is called directly (bypassing the
+        request statistics); a ``200`` restores the backend and anything
+        else, including an exception, ejects it.  Returns the health of each
+        backend per service.
+        """
+        results: Dict[str, List[bool]] = {}
+        for name, balancer in self.backends.items():
+            results[name] = []
+            for backend in balancer.items:
+                try:
+                    status, _ = backend.call("GET", backend.health_path, None)
+                except Exception:
+                    status = 599
+                if status == 200:
+                    backend.restore()
+                else:
+                    backend.eject()
+                results[name].append(status == 200)
+        return results
+    def metric_lines(self) -> List[str]:
+        """Per-backend series in the Prometheus text format.
+
+        Registered as a collector of the gateway app's ``GET /metrics``.
+        """
+        rows = []
+        for service, balancer in sorted(self.backends.items()):
+            for backend in balancer.items:
+                with backend._stats_lock:
+                    latency = Histogram()
+                    latency.merge(backend.latency)
+                    rows.append((
+                        f'service="{escape(service)}",backend="{escape(backend.name)}"',
+                        backend.requests,
+                        backend.errors,
+                        backend.in_flight,
+                        int(backend.healthy),
+                        latency,
+                    ))
+        lines = []
+        for name, kind, help_text, column in (
+            ("gateway_backend_requests_total", "counter", "Requests forwarded to the backend.", 1),
+            ("gateway_backend_errors_total", "counter", "Forwarded requests that failed with a 5xx or an exception.", 2),
+            ("gateway_backend_in_flight", "gauge", "Requests currently in flight to the backend.", 3),
+            ("gateway_backend_healthy", "gauge", "1 unless the backend is ejected.", 4),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{{{row[0]}}} {row[column]}" for row in rows]
+        lines += histogram_lines(
+            "gateway_backend_latency_seconds", "Latency of forwarded requests.", ((row[0], row[5]) for row in rows)
+        )
+        return lines
+    async def probe_forever(self, interval: float = 5.0) -> None:
+        """Run :meth:`probe` every ``interval`` seconds in a worker thread."""
+        while True:
+            await asyncio.to_thread(self.probe)
+            await asyncio.sleep(interval)
+    def iter_pages(
+        self,
+        name: str,
+        path: str,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield a keyset-paginated collection one page at a time.
+
+        Each page is fetched through :meth:`forward` with ``limit`` and
+        ``after_id`` query parameters, so at most one page is held in memory
+        by the gateway.  Iteration stops after the first short page; an
+        error response raises :class:`HTTPException` (see :func:`unwrap`)
+        rather than passing for the end of the collection.
+        """
+        after_id = None
+        while True:
+            query = dict(params or {}, limit=page_size, after_id=after_id)
+            page = decode(unwrap(*self.forward(name, "GET", with_query(path, query))))
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
+
+def decode(data: Any) -> Any:
+    """Parse ``data`` if it is a raw JSON body, else return it unchanged."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return json.loads(bytes(data))
+    return data
+
+def body(data: Any, response: Optional[Response] = None) -> Any:
+    """Return a handler result sending raw JSON bodies as they are.
+
+    Bytes are wrapped in a :class:`Response` carrying the status and
+    headers already set on ``response``; anything else is returned as is.
+    """
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return data
+    if response is None:
+        return Response(data, media_type=JSON_MEDIA_TYPE)
+    return Response(data, response.status_code, response.headers, media_type=JSON_MEDIA_TYPE)
+
+def unwrap(status: int, data: Any) -> Any:
+    """Return ``data`` or re-raise a backend error with its status code."""
+    if status >= 400:
+        detail = data.get("detail", "backend error") if isinstance(data, dict) else "backend error"
+        raise HTTPException(status, detail)
+    return data
+
+def conditional(response: Response, data: Any, etag: Optional[str], if_none_match: Optional[str]) -> Any:
+    """Set the ``ETag`` header and short-circuit matching revalidations.
+
+    Returns ``data`` (see :func:`body`), or ``None`` with a ``304`` status
+    when ``if_none_match`` already names the current ETag.
+    """
+    etag = etag or compute_etag(data)
+    response.headers["ETag"] = etag
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        response.status_code = 304
+        return None
+    return body(data, response)
 
 gateway = APIGateway()
-app = FastAPI()
+app = FastAPI(title="api_gateway")
+# Traces start here; downstream services continue them.  Off unless
+# TRACE_SAMPLE_RATE is set, e.g. to 0.01 to trace one request in a hundred.
+app.trace_sample_rate = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+app.metrics.add_collector(gateway.metric_lines)
 
 @app.get("/health")
 def health() -> Dict[str, str]:
@@ -63,27 +733,135 @@ def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 @app.post("/bot/webhook")
-def bot_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def bot_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
     """Proxy Telegram updates to the bot service.
 
     The gateway determines which backend to use based on a round-robin
     iterator.  Backends must be registered with :func:`gateway.register`
     before handling requests.
     """
-    status, data = gateway.forward("bot", "POST", "/webhook", payload)
-    # ``status`` is ignored because the example services always return 200
-    return data
+    return body(unwrap(*await gateway.forward_async("bot", "POST", "/webhook", payload)))
 
 
 @app.post("/task")
-def create_task(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Proxy task creation to the task service."""
-    status, data = gateway.forward("task", "POST", "/tasks", payload)
-    return data
+async def create_task(payload: Dict[str, Any], idempotency_key: Optional[str] = Header(None)) -> Any:
+    """Proxy task creation to the task service.
+
+    An ``Idempotency-Key`` header travels as the payload's
+    ``idempotency_key``, so it survives coalescing into batches; retries
+    with the same key return the original task.
+    """
+    if idempotency_key is not None and isinstance(payload, dict):
+        payload = dict(payload, idempotency_key=payload.get("idempotency_key") or idempotency_key)
+    return body(unwrap(*await gateway.forward_async("task", "POST", "/tasks", payload)))
+
+
+@app.post("/task:batch")
+async def create_tasks(
+    payload: Dict[str, Any], response: Response = None, idempotency_key: Optional[str] = Header(None)
+) -> Any:
+    """Proxy batch task creation (``{"tasks": [...]}``).
+
+    The batch is atomic on a single task service; a sharded one receives
+    an atomic batch per shard, and when only some shards reject theirs the
+    reply is ``207`` listing each item's task or error (see
+    :meth:`APIGateway.forward_batch_async`).  An ``Idempotency-Key`` header
+    gives item ``i`` the key ``<key>/<i>``, as the task service would.
+    """
+    items = payload.get("tasks") if isinstance(payload, dict) else None
+    if idempotency_key is not None and isinstance(items, list):
+        items = [
+            dict(item, idempotency_key=item.get("idempotency_key") or f"{idempotency_key}/{index}")
+            if isinstance(item, dict)
+            else item
+            for index, item in enumerate(items)
+        ]
+        payload = dict(payload, tasks=items)
+    if isinstance(items, list) and items:
+        status, data = await gateway.forward_batch_async("task", "/tasks:batch", items)
+        response.status_code = status
+        return body(unwrap(status, data), response)
+    return body(unwrap(*await gateway.forward_async("task", "POST", "/tasks:batch", payload)))
 
 
 @app.get("/task")
-def list_tasks() -> Any:
-    """Return tasks from the task service."""
-    status, data = gateway.forward("task", "GET", "/tasks")
-    return data
\ No newline at end of file
+async def list_tasks(
+    chat_id: Optional[int] = None,
+    assignee: Optional[str] = None,
+    tag: Optional[str] = None,
+    due_at: Optional[str] = None,
+    due_before: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    response: Response = None,
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    """Return one page of tasks from the task service.
+
+    Filters are passed through unchanged.  ``limit`` is clamped to
+    :data:`MAX_PAGE_SIZE`; pass the last ``id`` received as ``after_id`` to
+    request the following page.  The page carries an ``ETag``; sending it
+    back in ``If-None-Match`` yields an empty ``304`` while it is current.
+
+    With a sharded task service a ``chat_id`` page comes from the shard
+    owning the chat; other pages are fetched from every shard with the same
+    ``after_id`` and ``limit`` and merged by id.
+    """
+    params = {
+        "chat_id": chat_id,
+        "assignee": assignee,
+        "tag": tag,
+        "due_at": due_at,
+        "due_before": due_before,
+        "after_id": after_id,
+        "limit": max(1, min(limit, MAX_PAGE_SIZE)),
+    }
+    path = with_query("/tasks", params)
+    if chat_id is not None:
+        status, data, etag = await gateway.get_async("task", path, shard_key=chat_id)
+    else:
+        status, data, etag = await gateway.get_all_async(
+            "task", path, lambda replies: merge_by_id(replies, params["limit"])
+        )
+    return conditional(response, unwrap(status, data), etag, if_none_match)
+
+
+@app.get("/task/search")
+async def search_tasks(q: str = "", chat_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE) -> Any:
+    """Proxy a full-text search over the task titles of one chat."""
+    params = {"q": q, "chat_id": chat_id, "limit": max(1, min(limit, MAX_PAGE_SIZE))}
+    status, data, _ = await gateway.get_async("task", with_query("/tasks/search", params), shard_key=chat_id)
+    return body(unwrap(status, data))
+
+
+@app.get("/task/{task_id}")
+async def get_task(
+    task_id: int,
+    response: Response = None,
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    """Return a single task from the task service, with ETag support.
+
+    Task ids are unique across shards, so the task is looked up on every
+    shard and the one that has it answers.
+    """
+    status, data, etag = await gateway.get_all_async("task", f"/tasks/{task_id}", first_found)
+    return conditional(response, unwrap(status, data), etag, if_none_match)
+
+
+@app.patch("/task/{task_id}")
+async def update_task(payload: Dict[str, Any], task_id: int) -> Dict[str, Any]:
+    """Proxy a task update (title, assignee, due date or tags)."""
+    return body(unwrap(*first_found(await gateway.scatter_async("task", "PATCH", f"/tasks/{task_id}", payload))))
+
+
+@app.delete("/task/{task_id}")
+async def delete_task(task_id: int) -> Dict[str, Any]:
+    """Proxy a task deletion."""
+    return body(unwrap(*first_found(await gateway.scatter_async("task", "DELETE", f"/tasks/{task_id}"))))
+
+
+@app.get("/cache/stats")
+def cache_stats() -> Dict[str, Any]:
+    """Expose response cache counters for tuning."""
+    return gateway.cache.stats()
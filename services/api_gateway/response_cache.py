@@ -0,0 +1,116 @@
+"""Response cache for idempotent GET requests forwarded by the gateway.
+
+Entries are keyed by service name and request path (including the query
+string), bounded by an LRU size limit and expire after a per-service TTL.
+Writes passing through the gateway invalidate a service in O(1) by bumping
+its generation number; stale entries are never served and age out of the
+LRU order.  Each entry carries a weak ETag derived from the response body so
+callers can revalidate with ``If-None-Match`` and receive a short ``304``
+reply when nothing changed.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class CacheEntry(NamedTuple):
+    status: int
+    data: Any
+    etag: str
+    expires_at: float
+
+
+def compute_etag(data: Any) -> str:
+    """Return a weak ETag for a JSON-compatible or raw JSON response body."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        encoded = data
+    else:
+        encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return 'W/"%s"' % hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of backend responses."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: "OrderedDict[Tuple[str, int, str], CacheEntry]" = OrderedDict()
+        self._ttls: Dict[str, float] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def enable(self, service: str, ttl: float) -> None:
+        """Cache GET responses of ``service`` for ``ttl`` seconds."""
+        self._ttls[service] = ttl
+        self._generations.setdefault(service, 0)
+
+    def enabled(self, service: str) -> bool:
+        """``True`` if GET responses of ``service`` are cached."""
+        return service in self._ttls
+
+    def get(self, service: str, path: str) -> Optional[CacheEntry]:
+        """Return a fresh entry for ``path`` or ``None``, counting hits."""
+        key = (service, self._generations.get(service, 0), path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, service: str, path: str, status: int, data: Any, generation: Optional[int] = None) -> CacheEntry:
+        """Store a response and return its entry.
+
+        ``generation`` should be the value of :meth:`generation` read before
+        the backend was called; if the service was invalidated meanwhile the
+        response may already be stale and is not stored.
+        """
+        current = self._generations.get(service, 0)
+        entry = CacheEntry(status, data, compute_etag(data), self.clock() + self._ttls.get(service, 0.0))
+        if generation is not None and generation != current:
+            return entry
+        with self._lock:
+            key = (service, current, path)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def generation(self, service: str) -> int:
+        """Current invalidation generation of ``service``."""
+        return self._generations.get(service, 0)
+
+    def invalidate(self, service: str) -> None:
+        """Make every cached response of ``service`` stale."""
+        with self._lock:
+            self._generations[service] = self._generations.get(service, 0) + 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters useful for tuning the size bound and TTLs."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
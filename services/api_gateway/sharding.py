@@ -0,0 +1,120 @@
+"""Consistent-hash sharding used by the API gateway.
+
+Replicas registered with :meth:`APIGateway.register` are interchangeable,
+but task service instances each hold their own tasks, so every chat must
+always be served by the same instance.  :class:`HashRing` maps a shard key
+such as ``chat_id`` to one of several named shards:
+
+* every shard is hashed onto a 64-bit ring at ``vnodes`` points (its
+  virtual nodes) and a key belongs to the shard owning the first point at
+  or after the key's hash, wrapping around;
+* many small arcs per shard keep the load even, and adding a shard only
+  takes over the arcs in front of its own points, so roughly ``1/N`` of the
+  keys move to it and none move between the existing shards.  Removing a
+  shard hands its keys to the remaining ones in the same way.
+
+Hashes come from BLAKE2b rather than :func:`hash`, so placement is stable
+across processes and restarts.
+
+:func:`merge_by_id` and :func:`first_found` combine the replies of a
+request sent to every shard (scatter-gather).
+"""
+
+import hashlib
+import heapq
+import json
+import threading
+from bisect import bisect_left
+from itertools import islice
+from typing import Any, Dict, Generic, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+# Virtual nodes per shard; ~160 keeps shard loads within a few percent.
+DEFAULT_VNODES = 160
+
+T = TypeVar("T")
+Reply = Tuple[int, Any]
+
+
+def ring_hash(key: Any) -> int:
+    """Position of ``key`` on the ring (stable across processes)."""
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+
+class HashRing(Generic[T]):
+    """Consistent-hash ring of named shards with virtual nodes."""
+
+    def __init__(self, vnodes: int = DEFAULT_VNODES) -> None:
+        if vnodes < 1:
+            raise ValueError("vnodes must be positive")
+        self.vnodes = vnodes
+        self.shards: Dict[str, T] = {}
+        # (sorted points, owning shard name per point), replaced as a whole.
+        self._ring: Tuple[List[int], List[str]] = ([], [])
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(list(self.shards.values()))
+
+    def add(self, name: str, shard: T) -> None:
+        """Place ``shard`` on the ring under ``name``."""
+        with self._lock:
+            if name in self.shards:
+                raise ValueError(f"shard {name!r} already exists")
+            self.shards[name] = shard
+            self._rebuild()
+
+    def remove(self, name: str) -> T:
+        """Take the shard ``name`` off the ring and return it."""
+        with self._lock:
+            shard = self.shards.pop(name)
+            self._rebuild()
+            return shard
+
+    def _rebuild(self) -> None:
+        points = sorted(
+            (ring_hash(f"{name}#{index}"), name)
+            for name in self.shards
+            for index in range(self.vnodes)
+        )
+        # One assignment, so lock-free readers never see half a rebuild.
+        self._ring = ([point for point, _ in points], [name for _, name in points])
+
+    def owner_name(self, key: Any) -> str:
+        """Name of the shard owning ``key``."""
+        points, owners = self._ring
+        if not points:
+            raise LookupError("the ring has no shards")
+        index = bisect_left(points, ring_hash(key))
+        return owners[index if index < len(points) else 0]
+
+    def owner(self, key: Any) -> T:
+        """Shard owning ``key``."""
+        return self.shards[self.owner_name(key)]
+
+
+def merge_by_id(replies: Sequence[Reply], limit: Optional[int] = None) -> Reply:
+    """Merge id-ordered list replies into one list of at most ``limit`` items.
+
+    Replies may be raw JSON bodies.  The first error reply, if any, is
+    returned instead.
+    """
+    for status, data in replies:
+        if status >= 400:
+            return status, data
+    pages = (json.loads(bytes(data)) if isinstance(data, (bytes, bytearray, memoryview)) else data for _, data in replies)
+    merged = heapq.merge(*pages, key=lambda item: item["id"])
+    return 200, list(islice(merged, limit))
+
+
+def first_found(replies: Sequence[Reply]) -> Reply:
+    """Return the successful reply, else the first that is not a ``404``."""
+    for status, data in replies:
+        if status < 400:
+            return status, data
+    for status, data in replies:
+        if status != 404:
+            return status, data
+    return replies[0]
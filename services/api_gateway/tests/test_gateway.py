@@ -2,10 +2,15 @@ import importlib.util
 import pathlib
 import sys
 
+import pytest
+
 ROOT = pathlib.Path(__file__).resolve().parents[3]
 SERVICE_DIR = pathlib.Path(__file__).resolve().parents[1]
-sys.path.extend([str(ROOT), str(SERVICE_DIR)])
+TASK_DIR = ROOT / "services" / "task"
+BOT_DIR = ROOT / "services" / "bot"
+sys.path.extend([str(ROOT), str(SERVICE_DIR), str(TASK_DIR), str(BOT_DIR)])
 
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from main import app, gateway
 
@@ -17,13 +22,13 @@ spec.loader.exec_module(bot_main)
 # Register two bot backends with distinct names to verify round-robin behaviour
 bot_a = bot_main.create_app("A")
 bot_b = bot_main.create_app("B")
-gateway.register("bot", [bot_a, bot_b])
+gateway.register("bot", [bot_a, bot_b], health_path="/")
 
 # Register the task service so the gateway can proxy task requests
 task_spec = importlib.util.spec_from_file_location("task_main", ROOT / "services" / "task" / "main.py")
 task_main = importlib.util.module_from_spec(task_spec)
 task_spec.loader.exec_module(task_main)
-gateway.register("task", [task_main.app])
+gateway.register("task", [task_main.app], cache_ttl=30)
 
 
 client = TestClient(app)
@@ -45,3 +50,628 @@ def test_task_proxy():
     listed = client.get("/task")
     assert listed.status_code == 200
     assert listed.json() == [task]
+
+
+def test_task_list_pagination_through_gateway():
+    created = [client.post("/task", json={"chat_id": 5, "title": f"t{i}"}).json() for i in range(5)]
+    page = client.get("/task?chat_id=5&limit=2").json()
+    assert page == created[:2]
+    page = client.get(f"/task?chat_id=5&limit=2&after_id={page[-1]['id']}").json()
+    assert page == created[2:4]
+    pages = list(gateway.iter_pages("task", "/tasks", page_size=2, params={"chat_id": 5}))
+    assert pages == [created[:2], created[2:4], created[4:]]
+    # A failing page is an error, not the end of the collection.
+    with pytest.raises(HTTPException) as failed:
+        list(gateway.iter_pages("task", "/tasks", params={"chat_id": "five"}))
+    assert failed.value.status_code == 422
+
+
+def test_get_single_task_through_gateway():
+    task = client.post("/task", json={"chat_id": 6, "title": "one"}).json()
+    assert client.get(f"/task/{task['id']}").json() == task
+    assert client.get("/task/999999").status_code == 404
+
+
+def test_update_and_delete_task_through_gateway():
+    task = client.post("/task", json={"chat_id": 6, "title": "draft"}).json()
+    assert client.get(f"/task/{task['id']}").json() == task
+    updated = client.patch(f"/task/{task['id']}", json={"title": "final"}).json()
+    assert updated["title"] == "final"
+    # The write invalidated the cached copy.
+    assert client.get(f"/task/{task['id']}").json() == updated
+    assert client.delete(f"/task/{task['id']}").json() == updated
+    assert client.get(f"/task/{task['id']}").status_code == 404
+    assert client.delete(f"/task/{task['id']}").status_code == 404
+
+
+def test_search_tasks_through_gateway():
+    task = client.post("/task", json={"chat_id": 8, "title": "Renew passport"}).json()
+    client.post("/task", json={"chat_id": 8, "title": "Book flights"})
+    assert client.get("/task/search?chat_id=8&q=pass*").json() == [task]
+    assert client.get("/task/search?q=passport").status_code == 422
+
+
+def test_forward_supports_path_parameters_and_all_verbs():
+    from fastapi import FastAPI
+
+    items = {}
+    backend = FastAPI()
+
+    @backend.put("/items/{item_id}")
+    def put_item(data: dict, item_id: int) -> dict:
+        items[item_id] = data
+        return {"id": item_id, **data}
+
+    @backend.patch("/items/{item_id}")
+    def patch_item(data: dict, item_id: int) -> dict:
+        items[item_id].update(data)
+        return {"id": item_id, **items[item_id]}
+
+    @backend.delete("/items/{item_id}")
+    def delete_item(item_id: int) -> dict:
+        return {"deleted": items.pop(item_id) is not None}
+
+    @backend.get("/items/{item_id}/tags/{tag}")
+    def get_tag(item_id: int, tag: str, upper: bool = False) -> dict:
+        return {"id": item_id, "tag": tag.upper() if upper else tag}
+
+    gateway.register("items", [backend])
+    assert gateway.forward("items", "PUT", "/items/3", {"name": "a"}) == (200, {"id": 3, "name": "a"})
+    assert gateway.forward("items", "PATCH", "/items/3", {"name": "b"}) == (200, {"id": 3, "name": "b"})
+    assert gateway.forward("items", "GET", "/items/3/tags/x?upper=true") == (200, {"id": 3, "tag": "X"})
+    assert gateway.forward("items", "DELETE", "/items/3") == (200, {"deleted": True})
+    assert gateway.forward("items", "GET", "/items/3/other")[0] == 404
+
+
+def test_async_forward_limits_concurrency_and_sheds_load():
+    import asyncio
+    from fastapi import FastAPI
+    from main import APIGateway
+
+    backend = FastAPI()
+    peak = {"now": 0, "max": 0}
+
+    @backend.get("/slow")
+    async def slow(delay: float = 0.01) -> dict:
+        peak["now"] += 1
+        peak["max"] = max(peak["max"], peak["now"])
+        await asyncio.sleep(delay)
+        peak["now"] -= 1
+        return {"ok": True}
+
+    local = APIGateway(max_concurrency=2, max_queue=2, timeout=1.0)
+    local.register("slow", [backend])
+
+    async def burst():
+        return await asyncio.gather(*(local.forward_async("slow", "GET", "/slow") for _ in range(6)))
+
+    statuses = sorted(status for status, _ in asyncio.run(burst()))
+    assert statuses == [200, 200, 200, 200, 503, 503]
+    assert peak["max"] == 2
+
+    local = APIGateway(timeout=0.01)
+    local.register("slow", [backend])
+    status, data = asyncio.run(local.forward_async("slow", "GET", "/slow?delay=0.5"))
+    assert (status, data) == (504, {"detail": "backend timeout"})
+
+
+def make_flaky_backend(label: str, state: dict):
+    import time
+
+    from fastapi import FastAPI, HTTPException
+
+    backend = FastAPI()
+
+    @backend.get("/work")
+    def work() -> dict:
+        if state.get("failing"):
+            raise HTTPException(500, "boom")
+        if state.get("delay"):
+            time.sleep(state["delay"])
+        return {"backend": label}
+
+    @backend.get("/health")
+    def health() -> dict:
+        if state.get("failing"):
+            raise HTTPException(503, "unhealthy")
+        return {"status": "ok"}
+
+    return backend
+
+
+def test_passive_health_check_ejects_failing_backend():
+    from main import APIGateway
+
+    now = [0.0]
+    state_a, state_b = {"failing": True}, {}
+    local = APIGateway(max_failures=2, eject_seconds=30, clock=lambda: now[0])
+    local.register("svc", [make_flaky_backend("a", state_a), make_flaky_backend("b", state_b)])
+
+    results = [local.forward("svc", "GET", "/work") for _ in range(8)]
+    # "a" fails twice (round robin interleaves it with "b") and is ejected.
+    assert [status for status, _ in results[:4]] == [500, 200, 500, 200]
+    assert all(data == {"backend": "b"} for _, data in results[4:])
+
+    state_a["failing"] = False
+    now[0] = 31.0
+    picked = {local.forward("svc", "GET", "/work")[1]["backend"] for _ in range(4)}
+    assert picked == {"a", "b"}
+
+
+def test_slow_backend_is_ejected_as_a_latency_outlier():
+    from main import APIGateway
+
+    now = [0.0]
+    slow = {"delay": 0.02}
+    local = APIGateway(eject_seconds=30, clock=lambda: now[0])
+    local.register("svc", [make_flaky_backend("a", {}), make_flaky_backend("b", {}), make_flaky_backend("c", slow)])
+
+    # "c" answers 200, only slowly; after three samples it is ejected.
+    picked = [local.forward("svc", "GET", "/work")[1]["backend"] for _ in range(18)]
+    assert picked[:9].count("c") == 3 and "c" not in picked[9:]
+    assert [backend.healthy for backend in local.backends["svc"].items] == [True, True, False]
+
+    # It comes back with its latency forgotten and stays once fast again.
+    slow["delay"] = 0
+    now[0] = 31.0
+    picked = [local.forward("svc", "GET", "/work")[1]["backend"] for _ in range(12)]
+    assert picked.count("c") == 4
+
+
+def test_active_probe_ejects_and_restores():
+    from main import APIGateway
+
+    state = {"failing": True}
+    local = APIGateway()
+    local.register("svc", [make_flaky_backend("a", state), make_flaky_backend("b", {})])
+    assert local.probe() == {"svc": [False, True]}
+    assert {local.forward("svc", "GET", "/work")[1]["backend"] for _ in range(4)} == {"b"}
+    state["failing"] = False
+    assert local.probe() == {"svc": [True, True]}
+    assert {local.forward("svc", "GET", "/work")[1]["backend"] for _ in range(4)} == {"a", "b"}
+
+
+def test_balancing_strategies():
+    from types import SimpleNamespace
+    from balancing import LeastOutstanding, PowerOfTwoChoices, WeightedRoundRobin
+
+    def node(name, **stats):
+        fields = {"healthy": True, "in_flight": 0, "ewma_latency": 0.0, "weight": 1}
+        fields.update(stats)
+        return SimpleNamespace(name=name, **fields)
+
+    wrr = WeightedRoundRobin([node("a", weight=3), node("b"), node("c")])
+    picks = [wrr.next().name for _ in range(10)]
+    assert picks[:5].count("a") == 3 and picks.count("a") == 6
+
+    busy, idle = node("busy", in_flight=5), node("idle")
+    assert {LeastOutstanding([busy, idle]).next().name for _ in range(4)} == {"idle"}
+
+    slow, fast = node("slow", ewma_latency=0.5), node("fast", ewma_latency=0.01)
+    assert {PowerOfTwoChoices([slow, fast]).next().name for _ in range(10)} == {"fast"}
+    fast.healthy = False
+    assert PowerOfTwoChoices([slow, fast]).next().name == "slow"
+
+    # Latency outliers are ejected, never more than half the pool at once.
+    def sampled(name, latency):
+        item = node(name, ewma_latency=latency, samples=5)
+        item.eject = lambda: setattr(item, "healthy", False)
+        return item
+
+    pool = [sampled("a", 0.01), sampled("b", 0.012), sampled("c", 0.2), sampled("d", 0.3)]
+    assert [item.name for item in LeastOutstanding(pool).eject_outliers()] == ["d", "c"]
+    pool = [sampled("a", 0.01), sampled("b", 0.011), sampled("c", 0.3)]
+    assert [item.name for item in LeastOutstanding(pool).eject_outliers()] == ["c"]
+    pool[1].ewma_latency = 0.3
+    assert LeastOutstanding(pool).eject_outliers() == []
+    # With most of the pool slow, the fast backend is not the outlier.
+    mostly_slow = [sampled("a", 0.01), sampled("b", 0.2), sampled("c", 0.3)]
+    assert LeastOutstanding(mostly_slow).eject_outliers() == []
+    even = [sampled("a", 0.01), sampled("b", 0.04)]
+    assert LeastOutstanding(even).eject_outliers() == []
+    # Jitter on fast calls is not degradation.
+    jitter = [sampled("a", 0.0001), sampled("b", 0.0001), sampled("c", 0.002)]
+    assert LeastOutstanding(jitter).eject_outliers() == []
+
+
+def test_task_list_cache_etag_and_invalidation():
+    first = client.get("/task?chat_id=11")
+    assert first.json() == []
+    etag = first.headers["ETag"]
+    hits = gateway.cache.hits
+    again = client.get("/task?chat_id=11", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.json() is None
+    assert gateway.cache.hits == hits + 1
+
+    task = client.post("/task", json={"chat_id": 11, "title": "fresh"}).json()
+    changed = client.get("/task?chat_id=11", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json() == [task]
+    assert changed.headers["ETag"] != etag
+    stats = client.get("/cache/stats").json()
+    assert stats["invalidations"] >= 1 and stats["misses"] >= 2
+
+
+def test_task_bodies_pass_through_the_gateway_as_bytes():
+    created = client.post("/task", json={"chat_id": 62, "title": "opaque"})
+    assert created.content == task_main.STORE.get(created.json()["id"]).to_json()
+    listed = client.get("/task?chat_id=62")
+    assert isinstance(listed.content, bytes) and listed.headers["content-type"] == "application/json"
+    assert listed.json() == [created.json()]
+    entry = gateway.cache.get("task", "/tasks?chat_id=62&limit=100")
+    assert entry.data is listed.content and listed.headers["ETag"] == entry.etag
+    revalidated = client.get("/task?chat_id=62", headers={"If-None-Match": entry.etag})
+    assert revalidated.status_code == 304
+    # Pages are decoded only where the gateway has to look inside.
+    assert list(gateway.iter_pages("task", "/tasks", params={"chat_id": 62})) == [[created.json()]]
+
+
+def test_response_cache_lru_and_ttl():
+    from response_cache import ResponseCache
+
+    now = [0.0]
+    cache = ResponseCache(max_entries=2, clock=lambda: now[0])
+    cache.enable("svc", ttl=10)
+    cache.put("svc", "/a", 200, ["a"])
+    cache.put("svc", "/b", 200, ["b"])
+    assert cache.get("svc", "/a").data == ["a"]
+    cache.put("svc", "/c", 200, ["c"])
+    assert cache.get("svc", "/b") is None  # least recently used was evicted
+    assert cache.evictions == 1
+    now[0] = 11
+    assert cache.get("svc", "/a") is None
+    stale_generation = cache.generation("svc")
+    cache.invalidate("svc")
+    cache.put("svc", "/d", 200, ["d"], generation=stale_generation)
+    assert cache.get("svc", "/d") is None
+
+
+def test_batch_task_creation_through_gateway():
+    resp = client.post("/task:batch", json={"tasks": [{"chat_id": 12, "title": "x"}, {"chat_id": 12, "title": "y"}]})
+    assert resp.status_code == 200
+    created = resp.json()
+    assert [task["title"] for task in created] == ["x", "y"]
+    assert client.get("/task?chat_id=12").json() == created
+    assert client.post("/task:batch", json={"tasks": [{"title": "no chat"}]}).status_code == 400
+
+
+def test_concurrent_creates_are_coalesced_into_batches():
+    import asyncio
+    from main import APIGateway
+
+    local = APIGateway()
+    local.register("task", [task_main.app])
+    coalescer = local.coalesce("task", "/tasks", "/tasks:batch", max_items=4, max_delay=0.01)
+
+    async def burst(payloads):
+        return await asyncio.gather(*(local.forward_async("task", "POST", "/tasks", p) for p in payloads))
+
+    replies = asyncio.run(burst([{"chat_id": 31, "title": f"c{i}"} for i in range(10)]))
+    assert [status for status, _ in replies] == [200] * 10
+    assert [task["title"] for _, task in replies] == [f"c{i}" for i in range(10)]
+    assert len({task["id"] for _, task in replies}) == 10
+    assert (coalescer.batches, coalescer.items) == (3, 10)
+
+    # One invalid payload must not fail the requests batched with it.
+    replies = asyncio.run(burst([{"chat_id": 31, "title": "ok"}, {"chat_id": 31}, {"chat_id": 31, "title": "ok2"}]))
+    assert [status for status, _ in replies] == [200, 400, 200]
+
+    # A batch reply one item short fails every caller instead of leaving one
+    # waiting forever.
+    from coalescer import Coalescer
+
+    async def short_batch(payloads):
+        return [([0, 1, 2], (200, payloads[:-1]))]
+
+    sent_alone = []
+
+    async def send_one(payload):
+        sent_alone.append(payload)
+        return 200, payload
+
+    short = Coalescer(short_batch, send_one, max_items=3, max_delay=0.01)
+
+    async def submit_all(coalescer, count):
+        return await asyncio.wait_for(asyncio.gather(*(coalescer.submit(i) for i in range(count))), 1)
+
+    replies = asyncio.run(submit_all(short, 3))
+    assert [status for status, _ in replies] == [502] * 3
+    assert replies[0][1]["detail"] == "batch reply has 2 items for 3 requests"
+    assert sent_alone == []
+
+    # Only the items of a rejected part are sent again; the stored part's
+    # items are not, and an uncovered request fails instead of hanging.
+    async def split_batch(payloads):
+        return [([0, 2], (200, ["a", "c"])), ([1, 3], (400, {"detail": "bad"})), ([4], (503, {"detail": "down"}))]
+
+    split = Coalescer(split_batch, send_one, max_items=6, max_delay=0.01)
+    replies = asyncio.run(submit_all(split, 6))
+    assert replies[:5] == [(200, "a"), (200, 1), (200, "c"), (200, 3), (503, {"detail": "down"})]
+    assert replies[5][0] == 502 and sorted(sent_alone) == [1, 3]
+
+
+def test_hash_ring_moves_about_one_nth_of_keys():
+    from sharding import HashRing
+
+    ring = HashRing()
+    for index in range(10):
+        ring.add(f"task-{index}", index)
+    keys = range(20_000)
+    before = {key: ring.owner(key) for key in keys}
+    loads = [list(before.values()).count(index) for index in range(10)]
+    assert max(loads) < 1.35 * min(loads)
+
+    ring.add("task-10", 10)
+    moved = [key for key in keys if ring.owner(key) != before[key]]
+    # Only keys taken over by the new shard move, about 1/11 of them.
+    assert {ring.owner(key) for key in moved} == {10}
+    assert 0.06 < len(moved) / len(keys) < 0.12
+
+    ring.remove("task-10")
+    assert all(ring.owner(key) == before[key] for key in keys)
+
+
+def test_sharded_task_service_routes_by_chat_and_merges_reads(monkeypatch):
+    monkeypatch.setenv("TASK_ID_STRIDE", "1024")
+    shards = []
+    for offset in range(3):
+        monkeypatch.setenv("TASK_ID_OFFSET", str(offset))
+        spec = importlib.util.spec_from_file_location(f"task_shard_{offset}", TASK_DIR / "main.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        shards.append(module)
+    gateway.register_shards("task", [module.app for module in shards], cache_ttl=30)
+    try:
+        created = [client.post("/task", json={"chat_id": chat, "title": f"solo {chat}"}).json() for chat in range(1, 13)]
+        batch = [{"chat_id": chat, "title": f"batch {chat}"} for chat in range(1, 13)]
+        created += client.post("/task:batch", json={"tasks": batch}).json()
+        assert [task["title"] for task in created[12:]] == [item["title"] for item in batch]
+
+        # Every chat lives on exactly one shard, and every shard got some.
+        for chat in range(1, 13):
+            holders = [module for module in shards if module.STORE.query(chat_id=chat)]
+            assert len(holders) == 1
+            assert [task["title"] for task in client.get(f"/task?chat_id={chat}").json()] == [f"solo {chat}", f"batch {chat}"]
+        assert all(len(module.STORE) for module in shards)
+
+        everything = sorted(created, key=lambda task: task["id"])
+        assert client.get("/task?limit=1000").json() == everything
+        first = client.get("/task?limit=10").json()
+        rest = client.get(f"/task?limit=1000&after_id={first[-1]['id']}").json()
+        assert first + rest == everything
+
+        task = created[5]
+        assert client.get(f"/task/{task['id']}").json() == task
+        assert client.patch(f"/task/{task['id']}", json={"title": "renamed"}).json()["title"] == "renamed"
+        assert client.get(f"/task/{task['id']}").json()["title"] == "renamed"
+        assert client.delete(f"/task/{task['id']}").status_code == 200
+        assert client.get(f"/task/{task['id']}").status_code == 404
+        assert client.patch(f"/task/{task['id']}", json={"title": "x"}).status_code == 404
+    finally:
+        gateway.register("task", [task_main.app], cache_ttl=30)
+
+
+def test_mixed_bursts_to_a_sharded_task_service_store_each_task_once(monkeypatch):
+    import asyncio
+    from main import APIGateway
+
+    monkeypatch.setenv("TASK_ID_STRIDE", "1024")
+    shards = []
+    for offset in range(3):
+        monkeypatch.setenv("TASK_ID_OFFSET", str(offset))
+        spec = importlib.util.spec_from_file_location(f"task_mixed_{offset}", TASK_DIR / "main.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        shards.append(module)
+    local = APIGateway()
+    local.register_shards("task", [module.app for module in shards])
+    local.coalesce("task", "/tasks", "/tasks:batch", max_items=20)
+    payloads = [{"chat_id": chat, "title": f"burst {chat}"} for chat in range(2, 11)] + [{"chat_id": 1}]
+
+    async def burst():
+        return await asyncio.gather(*(local.forward_async("task", "POST", "/tasks", p) for p in payloads))
+
+    replies = asyncio.run(burst())
+    assert [status for status, _ in replies] == [200] * 9 + [400]
+    assert sum(len(module.STORE) for module in shards) == 9
+
+    # A plain batch with a failing shard reports every item's outcome.
+    gateway.register_shards("task", [module.app for module in shards])
+    try:
+        resp = client.post("/task:batch", json={"tasks": payloads})
+    finally:
+        gateway.register("task", [task_main.app], cache_ttl=30)
+    items = resp.json()
+    assert resp.status_code == 207 and items[-1]["status"] == 400
+    stored = [item for item in items if "id" in item]
+    assert 0 < len(stored) < 9
+    assert sum(len(module.STORE) for module in shards) == 9 + len(stored)
+    assert all(item["status"] == 400 for item in items if "id" not in item)
+
+
+def test_metrics_endpoint_reports_routes_and_backends():
+    task_client = TestClient(task_main.app)
+    created = task_client.post("/tasks", json={"chat_id": 41, "title": "measured"}).json()
+    task_client.get(f"/tasks/{created['id']}")
+    task_client.get("/tasks/999999")
+    task_client.get("/no/such/path")
+    text = task_client.get("/metrics").content
+    assert 'http_requests_total{method="GET",route="/tasks/{task_id}",status="4xx"}' in text
+    assert 'http_requests_total{method="GET",route="<unmatched>",status="4xx"} ' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/tasks"}' in text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    summary = task_main.app.metrics.summary()["GET /tasks/{task_id}"]
+    assert summary["requests"] >= 2 and summary["in_flight"] == 0
+    assert 0 < summary["p50"] <= summary["max"]
+
+    client.get("/task?chat_id=41")
+    text = client.get("/metrics").content
+    assert 'gateway_backend_requests_total{service="task",backend="task-0"}' in text
+    assert 'gateway_backend_healthy{service="bot",backend="bot-1"} 1' in text
+    assert 'gateway_backend_latency_seconds_bucket{service="task",backend="task-0",le="+Inf"}' in text
+
+
+def test_route_stats_fold_the_slots_of_exited_threads():
+    import threading
+    import time
+
+    from fastapi.metrics import RouteStats
+
+    stats = RouteStats()
+
+    def request():
+        stats.begin().end(time.perf_counter_ns(), 200)
+
+    for _ in range(50):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    request()
+    statuses, in_flight, latency = stats.totals()
+    assert statuses[1] == 51 and in_flight == 0 and latency.count == 51
+    # Only the main thread's slot is still kept on its own.
+    assert len(stats._slots) == 1
+
+
+def test_histogram_buckets_and_sampling_profiler():
+    import time
+
+    from fastapi import FastAPI
+    from fastapi.metrics import Histogram
+
+    histogram = Histogram()
+    for ns in (900, 1_000, 1_500, 3_000, 1_000_000):
+        histogram.record(ns)
+    assert dict(histogram.cumulative((1024, 2048, 4096, 2**20))) == {1024: 2, 2048: 3, 4096: 4, 2**20: 5}
+    assert 1_000e-9 <= histogram.quantile(0.5) <= 1_500e-9 * 1.25
+
+    profiled = FastAPI()
+
+    @profiled.get("/slow")
+    def slow():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return {}
+
+    @profiled.get("/fast")
+    def fast():
+        return {}
+
+    local = TestClient(profiled)
+    local.get("/slow")
+    local.get("/fast")
+    assert local.post("/metrics/profile", json={"top": 1, "interval": 0.001}).json()["routes"] == ["GET /slow"]
+    local.get("/slow")
+    stacks = local.delete("/metrics/profile").content
+    assert stacks.startswith("GET /slow;slow")
+    assert local.post("/metrics/profile", json={"routes": ["GET /nope"]}).status_code == 400
+
+
+def test_task_command_is_traced_across_every_hop(tmp_path, monkeypatch):
+    from fastapi import tracing
+
+    # Sampling is off by default.
+    tracing.COLLECTOR.clear()
+    client.get("/health")
+    assert app.trace_sample_rate == 0 and not len(tracing.COLLECTOR)
+    monkeypatch.setattr(app, "trace_sample_rate", 1.0)
+
+    def task_api(payload):
+        # Like a call to another process, only the header carries the trace.
+        return client.post("/task", json=payload, headers=tracing.inject()).json()
+
+    traced_bot = bot_main.create_app("T", task_api=task_api)
+    gateway.register("bot", [traced_bot], health_path="/")
+    tracing.COLLECTOR.clear()
+    try:
+        reply = client.post("/bot/webhook", json={"message": {"text": "/task Trace me", "chat": {"id": 51}}})
+    finally:
+        gateway.register("bot", [bot_a, bot_b], health_path="/")
+    assert reply.json()["reply"].startswith("created task")
+
+    spans = tracing.COLLECTOR.spans()
+    assert len({span.trace_id for span in spans}) == 1
+    by_id = {span.span_id: span for span in spans}
+
+    def chain(span):
+        names = []
+        while span is not None:
+            names.append(f"{span.service}: {span.name}")
+            span = by_id.get(span.parent_id)
+        return names[::-1]
+
+    leaf = next(span for span in spans if span.service == "task")
+    assert chain(leaf) == [
+        "api_gateway: POST /bot/webhook",
+        "api_gateway: POST /webhook",
+        "bot T: POST /webhook",
+        "bot T: command /task",
+        "api_gateway: POST /task",
+        "api_gateway: POST /tasks",
+        "task: POST /tasks",
+    ]
+    assert leaf.attributes["status"] == 200
+    # Every hop lies within the span that called it.
+    for span in spans:
+        parent = by_id.get(span.parent_id)
+        if parent is not None:
+            assert parent.start <= span.start and span.duration <= parent.duration
+
+    path = tmp_path / "traces.jsonl"
+    assert tracing.COLLECTOR.export(str(path)) == len(spans) and not len(tracing.COLLECTOR)
+    lines = tracing.waterfall(tracing.load(str(path))).splitlines()
+    assert lines[0].startswith(f"trace {leaf.trace_id}")
+    assert lines[1].startswith("api_gateway: POST /bot/webhook")
+    assert lines[-1].startswith("            task: POST /tasks")
+
+    # A request arriving with an unsampled context is not traced.
+    unsampled = f"00-{leaf.trace_id}-{leaf.span_id}-00"
+    client.get("/health", headers={"traceparent": unsampled})
+    assert not len(tracing.COLLECTOR)
+
+
+def test_bot_webhook_calls_back_into_the_gateway():
+    # Gateway -> bot -> gateway in one process: the bot's synchronous call
+    # is made while the gateway's loop is running the webhook request.
+    def task_api(payload):
+        resp = client.post("/task", json=payload)
+        assert resp.status_code == 200
+        return resp.json()
+
+    gateway.register("bot", [bot_main.create_app("L", task_api=task_api)], health_path="/")
+    try:
+        resp = client.post("/bot/webhook", json={"message": {"text": "/task Loop back", "chat": {"id": 54}}})
+    finally:
+        gateway.register("bot", [bot_a, bot_b], health_path="/")
+    assert resp.status_code == 200
+    assert resp.json()["reply"].startswith("created task")
+    assert [task["title"] for task in client.get("/task?chat_id=54").json()] == ["Loop back"]
+
+
+def test_redelivered_task_update_creates_one_task():
+    def task_api(payload):
+        return client.post("/task", json=payload).json()
+
+    gateway.register("bot", [bot_main.create_app("R", task_api=task_api)], health_path="/")
+    update = {"update_id": 1, "message": {"message_id": 17, "text": "/task Only once", "chat": {"id": 52}}}
+    multi = {"update_id": 2, "message": {"message_id": 18, "text": "/task a\nb", "chat": {"id": 52}}}
+    try:
+        first = client.post("/bot/webhook", json=update).json()
+        assert client.post("/bot/webhook", json=update).json() == first
+        assert [task["title"] for task in client.get("/task?chat_id=52").json()] == ["Only once"]
+
+        replies = [client.post("/bot/webhook", json=multi).json()["reply"] for _ in range(2)]
+    finally:
+        gateway.register("bot", [bot_a, bot_b], health_path="/")
+    assert replies[0] == replies[1] and replies[0].startswith("created tasks")
+    assert [task["title"] for task in client.get("/task?chat_id=52").json()] == ["Only once", "a", "b"]
+
+    headers = {"Idempotency-Key": "gw-1"}
+    keyed = client.post("/task", json={"chat_id": 53, "title": "k"}, headers=headers).json()
+    assert client.post("/task", json={"chat_id": 53, "title": "k"}, headers=headers).json() == keyed
+    batch = {"tasks": [{"chat_id": 53, "title": "b0"}, {"chat_id": 53, "title": "b1"}]}
+    created = client.post("/task:batch", json=batch, headers=headers).json()
+    assert client.post("/task:batch", json=batch, headers=headers).json() == created
+    assert len(client.get("/task?chat_id=53").json()) == 3
@@ -0,0 +1,102 @@
+"""Worker pool dispatching Telegram updates with per-chat ordering.
+
+Updates of one chat must be handled in the order Telegram delivered them,
+but updates of different chats are independent.  :class:`ChatDispatcher`
+keeps one FIFO queue per chat and lets a bounded thread pool drain them: at
+most one worker serves a given chat at a time, so a slow ``/task`` in one
+chat only delays later updates of that same chat.  A worker hands its chat
+back to the pool after ``burst`` updates so a very busy chat cannot starve
+the others.
+
+Each update is handled in the :mod:`contextvars` context it was submitted
+from, so the trace of the webhook request that delivered it carries on in
+the worker thread.
+"""
+
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_PENDING = 10_000
+DEFAULT_BURST = 16
+
+
+class Overloaded(Exception):
+    """Raised by :meth:`ChatDispatcher.submit` when the backlog is full."""
+
+
+class ChatDispatcher:
+    """Run ``handle(update)`` on a thread pool, serialised per chat."""
+
+    def __init__(
+        self,
+        handle: Callable[[Dict[str, Any]], Any],
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        burst: int = DEFAULT_BURST,
+    ) -> None:
+        self.handle = handle
+        self.max_pending = max_pending
+        self.burst = burst
+        self.pending = 0
+        self._queues: Dict[Any, Deque[Tuple[Dict[str, Any], Future, contextvars.Context]]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="bot-worker")
+
+    def submit(self, chat_id: Any, update: Dict[str, Any]) -> Future:
+        """Queue ``update`` behind earlier updates of ``chat_id``.
+
+        Returns a future resolved with the handler's result.  Raises
+        :class:`Overloaded` if ``max_pending`` updates are already queued.
+        """
+        return self.submit_many([(chat_id, update)])[0]
+
+    def submit_many(self, items: List[Tuple[Any, Dict[str, Any]]]) -> List[Future]:
+        """Queue several ``(chat_id, update)`` pairs all-or-nothing."""
+        futures: List[Future] = []
+        idle_chats = []
+        with self._lock:
+            if self.pending + len(items) > self.max_pending:
+                raise Overloaded(f"{self.pending} updates pending")
+            self.pending += len(items)
+            for chat_id, update in items:
+                future: Future = Future()
+                futures.append(future)
+                queue = self._queues.get(chat_id)
+                if queue is None:
+                    queue = self._queues[chat_id] = deque()
+                    idle_chats.append(chat_id)
+                # One copy each: a context cannot be entered by two threads.
+                queue.append((update, future, contextvars.copy_context()))
+        for chat_id in idle_chats:
+            self._executor.submit(self._drain, chat_id)
+        return futures
+
+    def _drain(self, chat_id: Any) -> None:
+        for _ in range(self.burst):
+            with self._lock:
+                queue = self._queues[chat_id]
+                if not queue:
+                    del self._queues[chat_id]
+                    return
+                update, future, context = queue.popleft()
+            try:
+                future.set_result(context.run(self.handle, update))
+            except BaseException as exc:
+                future.set_exception(exc)
+            finally:
+                with self._lock:
+                    self.pending -= 1
+        # Let other chats run before serving the rest of this one.
+        try:
+            self._executor.submit(self._drain, chat_id)
+        except RuntimeError:
+            # The pool is shutting down; finish this chat on this worker.
+            self._drain(chat_id)
+
+    def shutdown(self) -> None:
+        """Finish queued updates and stop the worker threads."""
+        self._executor.shutdown(wait=True)
@@ -4,14 +4,38 @@ The real project would expose a Telegram webhook and route messages to
 other services.  For the purposes of this kata the service implements a
 small subset of the behaviour so that it can be unit tested without any
 external dependencies.
+
+Besides the one-update ``/webhook`` endpoint the service accepts bursts of
+updates on ``/webhook/batch``.  They are handled on a bounded worker pool
+that preserves the order of updates within each chat while letting
+different chats proceed in parallel (see :mod:`dispatcher`).  Setting
+``TELEGRAM_BOT_TOKEN`` sends their replies through a rate-limited
+:class:`~send_queue.SendQueue` instead of returning them in the response.
+
+Updates forwarded by the gateway are traced: each command runs in a span
+of the webhook request's trace, and ``task_api`` is called within it.
 """
 
-from fastapi import FastAPI
-from typing import Callable, Dict, List, Any
+from concurrent.futures import Future
+from fastapi import FastAPI, HTTPException, tracing
+from typing import Callable, Dict, List, Tuple, Any
+import atexit
+import logging
+import os
 import re
 
+from dispatcher import DEFAULT_WORKERS, ChatDispatcher, Overloaded
+from send_queue import SendQueue
 from telegram import Bot, BotCommand
 
+logger = logging.getLogger(__name__)
+
+# Leading ``/command`` (optionally ``/command@bot``) of a message.
+COMMAND_RE = re.compile(r"\s*(/\S+)")
+# Reply to messages that are not a command the bot knows.
+UNKNOWN_REPLY = "unknown"
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
 
 def configure_bot_menu(bot: Bot) -> None:
     """Register the commands shown in the Telegram UI.
@@ -32,6 +56,9 @@ def create_app(
     bot_name: str = "bot",
     bot_username: str | None = None,
     task_api: Callable[[Dict[str, Any]], Dict[str, Any]] | None = None,
+    task_batch_api: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]] | None = None,
+    bot: Bot | None = None,
+    workers: int = DEFAULT_WORKERS,
 ) -> FastAPI:
     """Create and configure a bot service instance.
 
@@ -45,15 +72,90 @@ def create_app(
     task_api:
         Callable used to create tasks via the API gateway.  The callable
         receives the task payload and should return the created task as a
-        dictionary.  If ``None`` the ``/task`` command is disabled.
+        dictionary.  If ``None`` the ``/task`` command is disabled.  It is
+        called inside the command's trace span; an HTTP client should send
+        ``fastapi.tracing.inject()`` as headers to continue the trace.
+    task_batch_api:
+        Optional callable creating several tasks in one request.  It receives
+        a list of task payloads and returns the created tasks in order.  Used
+        for multi-line ``/task`` messages; without it such messages create
+        their tasks one by one through ``task_api``.
+    bot:
+        Optional Telegram client, usually wrapped in a
+        :class:`~send_queue.SendQueue` to respect rate limits.  When set,
+        replies to batched updates are sent with ``bot.send_message`` as
+        soon as each one is ready and ``/webhook/batch`` acknowledges the
+        batch immediately.
+    workers:
+        Number of worker threads handling batched updates.
     """
-    app = FastAPI()
+    app = FastAPI(title=f"bot {bot_name}")
 
     @app.get("/")
     def root() -> Dict[str, str]:
         """Health check endpoint used by tests and monitoring."""
         return {"status": "ok"}
 
+    def ping(message: Dict[str, Any], text: str) -> Dict[str, str]:
+        return {"reply": "pong"}
+
+    def who(message: Dict[str, Any], text: str) -> Dict[str, str]:
+        return {"reply": bot_name}
+
+    def task(message: Dict[str, Any], text: str) -> Dict[str, str]:
+        chat_id = message.get("chat", {}).get("id")
+        message_id = message.get("message_id")
+        lines = [line for line in text.splitlines() if line.strip()]
+        if len(lines) == 1:
+            payload = parse_task_command(text)
+            payload["chat_id"] = chat_id
+            if message_id is not None:
+                # Identifies the task when Telegram redelivers the update.
+                payload["message_id"] = message_id
+            created = task_api(payload)
+            return {"reply": f"created task {created['id']}"}
+        payloads = [parse_task_command(lines[0])]
+        payloads += [parse_task_tokens(line.split()) for line in lines[1:]]
+        payloads = [payload for payload in payloads if payload["title"]]
+        if not payloads:
+            return {"reply": UNKNOWN_REPLY}
+        for index, payload in enumerate(payloads):
+            payload["chat_id"] = chat_id
+            if message_id is not None:
+                payload["message_id"] = message_id
+                payload["idempotency_key"] = f"telegram:{chat_id}:{message_id}:{index}"
+        if task_batch_api:
+            tasks = task_batch_api(payloads)
+        else:
+            tasks = [task_api(payload) for payload in payloads]
+        ids = ", ".join(str(created["id"]) for created in tasks)
+        return {"reply": f"created tasks {ids}"}
+
+    # Dispatch table built once per app: every command is reachable both as
+    # ``/name`` and, in group chats, as ``/name@bot_username``.
+    handlers: Dict[str, Callable[[Dict[str, Any], str], Dict[str, str]]] = {}
+    commands: List[Tuple[str, Callable[[Dict[str, Any], str], Dict[str, str]]]] = [("ping", ping), ("who", who)]
+    if task_api:
+        commands.append(("task", task))
+    for name, handler in commands:
+        handlers[f"/{name}"] = handler
+        if bot_username:
+            handlers[f"/{name}@{bot_username}"] = handler
+
+    def handle_update(update: Dict[str, Any]) -> Dict[str, str]:
+        message = update.get("message") or {}
+        text = message.get("text") or ""
+        match = COMMAND_RE.match(text)
+        handler = handlers.get(match.group(1)) if match else None
+        if handler is None:
+            return {"reply": UNKNOWN_REPLY}
+        if tracing.current() is None:
+            return handler(message, text)
+        with tracing.span(f"command {match.group(1)}"):
+            return handler(message, text)
+
+    dispatcher = ChatDispatcher(handle_update, workers=workers)
+
     @app.post("/webhook")
     def telegram_webhook(update: Dict) -> Dict[str, str]:
         """Handle incoming Telegram updates.
@@ -67,34 +169,72 @@ def create_app(
             load balancing behaviour through the API gateway.
         ``/task``
             Parses the message, forwards the task to the API gateway and
-            replies with the created task identifier.
+            replies with the created task identifier.  Every further
+            non-empty line of the message describes one more task, which
+            lets users import a backlog with a single message.  Tasks
+            carry the message's ``message_id``, so a redelivered update
+            gets the tasks created the first time back instead of
+            duplicates.
+
+        Messages without text or with an unknown command get
+        ``{"reply": "unknown"}``.
         """
-        text = update.get("message", {}).get("text", "")
-        command = text.split()[0]
+        return handle_update(update)
 
-        valid_pings = {"/ping"}
-        valid_whos = {"/who"}
-        valid_tasks = {"/task"}
-        if bot_username:
-            valid_pings.add(f"/ping@{bot_username}")
-            valid_whos.add(f"/who@{bot_username}")
-            valid_tasks.add(f"/task@{bot_username}")
-
-        if command in valid_pings:
-            return {"reply": "pong"}
-        if command in valid_whos:
-            return {"reply": bot_name}
-        if command in valid_tasks and task_api:
-            chat_id = update.get("message", {}).get("chat", {}).get("id")
-            payload = parse_task_command(text)
-            payload["chat_id"] = chat_id
-            task = task_api(payload)
-            return {"reply": f"created task {task['id']}"}
-        return {"reply": "unknown"}
+    @app.post("/webhook/batch")
+    def telegram_webhook_batch(updates: Any) -> Any:
+        """Handle a burst of updates on the worker pool.
+
+        Accepts a list of updates or a ``getUpdates`` response
+        (``{"ok": true, "result": [...]}``).  Without a ``bot`` the call
+        waits for every update and returns
+        ``[{"update_id": ..., "reply": ...}, ...]`` in input order; with one
+        it returns ``{"accepted": n}`` straight away and each reply is sent
+        to its chat when ready; ``"unknown"`` replies are not sent, so plain
+        chat in a group does not get an answer per message.  Responds
+        ``400`` unless every update is an object and ``503`` if the backlog
+        is full.
+
+        An update whose handler fails is logged; it gets
+        ``{"update_id": ..., "error": ...}`` in the returned list, or no
+        message with a ``bot``, and the other updates are unaffected.
+        """
+        if isinstance(updates, dict):
+            updates = updates.get("result") or []
+        if not isinstance(updates, list):
+            raise HTTPException(400, "updates must be a list")
+        for index, update in enumerate(updates):
+            if not isinstance(update, dict) or not isinstance(update.get("message") or {}, dict):
+                raise HTTPException(400, f"updates[{index}] must be an update object")
+        chats = [(update.get("message") or {}).get("chat", {}).get("id") for update in updates]
+        try:
+            futures = dispatcher.submit_many(list(zip(chats, updates)))
+        except Overloaded as exc:
+            raise HTTPException(503, str(exc)) from None
+        if bot is not None:
+            for chat_id, update, future in zip(chats, updates, futures):
+
+                def deliver(done: Future, chat_id: Any = chat_id, update: Dict[str, Any] = update) -> None:
+                    outcome = _outcome(update, done)
+                    if outcome.get("reply", UNKNOWN_REPLY) != UNKNOWN_REPLY:
+                        bot.send_message(chat_id, outcome["reply"])
+
+                future.add_done_callback(deliver)
+            return {"accepted": len(futures)}
+        return [_outcome(update, future) for update, future in zip(updates, futures)]
 
     return app
 
 
+def _outcome(update: Dict[str, Any], future: Future) -> Dict[str, Any]:
+    """Reply entry for a handled update, logging a failed handler."""
+    error = future.exception()
+    if error is None:
+        return {"update_id": update.get("update_id"), **future.result()}
+    logger.error("update %s failed", update.get("update_id"), exc_info=error)
+    return {"update_id": update.get("update_id"), "error": str(error) or type(error).__name__}
+
+
 def parse_task_command(text: str) -> Dict[str, Any]:
     """Parse ``/task`` command arguments into a payload dictionary.
 
@@ -104,17 +244,25 @@ def parse_task_command(text: str) -> Dict[str, Any]:
 
     Only the title is required; other components are optional.
     """
-    tokens = text.split()
+    return parse_task_tokens(text.split()[1:])
+
+
+def parse_task_tokens(tokens: List[str]) -> Dict[str, Any]:
+    """Build a task payload from the arguments of a ``/task`` command.
+
+    Tokens are classified in a single pass by their first character, with
+    the date pattern compiled once at import time.
+    """
     title_parts: List[str] = []
     assignee = None
     due_at = None
     tags: List[str] = []
-    for token in tokens[1:]:
+    for token in tokens:
         if token.startswith("@"):
             assignee = token[1:]
         elif token.startswith("#"):
             tags.append(token[1:])
-        elif re.match(r"\d{4}-\d{2}-\d{2}", token):
+        elif DATE_RE.match(token):
             due_at = token
         else:
             title_parts.append(token)
@@ -128,5 +276,12 @@ def parse_task_command(text: str) -> Dict[str, Any]:
     return payload
 
 
+# Rate-limited outgoing replies, enabled by configuring a bot token.
+SEND_QUEUE: SendQueue | None = None
+if os.environ.get("TELEGRAM_BOT_TOKEN"):
+    SEND_QUEUE = SendQueue(Bot(os.environ["TELEGRAM_BOT_TOKEN"]))
+    SEND_QUEUE.start()
+    atexit.register(SEND_QUEUE.close)
+
 # The default application used when running ``python main.py``.
-app = create_app()
+app = create_app(bot=SEND_QUEUE)
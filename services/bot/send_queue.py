@@ -0,0 +1,215 @@
+"""Rate-limited queue for outgoing Telegram messages.
+
+Telegram rejects bots that send more than about one message per second to
+the same chat or about thirty messages per second overall.  A
+:class:`SendQueue` wraps a :class:`telegram.Bot` and holds replies until both
+limits allow them, using one token bucket per chat plus a global one.  While
+a chat is waiting for its bucket, consecutive replies to it are merged into
+one message (up to Telegram's 4096 character limit) so a burst costs a
+single send.  Chats are served round robin so a busy chat cannot starve the
+others of the global budget.
+
+:meth:`SendQueue.flush` sends whatever the limits allow right now and is
+driven either by the background thread started with :meth:`SendQueue.start`
+or, with a fake clock, directly by tests and benchmarks.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+DEFAULT_CHAT_RATE = 1.0
+DEFAULT_CHAT_BURST = 1
+DEFAULT_GLOBAL_RATE = 30.0
+DEFAULT_GLOBAL_BURST = 30
+MAX_MESSAGE_LENGTH = 4096
+
+# Tolerance for the floating point refill arithmetic.
+_EPSILON = 1e-9
+
+
+class TokenBucket:
+    """Allow ``rate`` events per second with bursts of up to ``capacity``."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Earliest time, not before ``now``, at which a token is available."""
+        self._refill(now)
+        if self.tokens >= 1 - _EPSILON:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        """Consume one token; callers check :meth:`ready_at` first."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        """``True`` if the bucket has refilled to capacity."""
+        self._refill(now)
+        return self.tokens >= self.capacity - _EPSILON
+
+
+class SendQueue:
+    """Drop-in replacement for ``bot.send_message`` honouring rate limits."""
+
+    def __init__(
+        self,
+        bot: Any,
+        chat_rate: float = DEFAULT_CHAT_RATE,
+        chat_burst: int = DEFAULT_CHAT_BURST,
+        global_rate: float = DEFAULT_GLOBAL_RATE,
+        global_burst: int = DEFAULT_GLOBAL_BURST,
+        merge: bool = True,
+        separator: str = "\n",
+        max_length: int = MAX_MESSAGE_LENGTH,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.merge = merge
+        self.separator = separator
+        self.max_length = max_length
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._buckets: Dict[Any, TokenBucket] = {}
+        # Chats with queued messages, in the order they are served.
+        self._queues: "OrderedDict[Any, Deque[str]]" = OrderedDict()
+        self._cond = threading.Condition()
+        # Only one flush may send at a time so per-chat order is kept.
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.enqueued = 0
+        self.merged = 0
+        self.sent = 0
+        self.errors = 0
+
+    def send_message(self, chat_id: Any, text: str) -> None:
+        """Queue ``text`` for ``chat_id``; it is sent by a later flush."""
+        with self._cond:
+            queue = self._queues.get(chat_id)
+            if queue is None:
+                queue = self._queues[chat_id] = deque()
+            if (
+                self.merge
+                and queue
+                and len(queue[-1]) + len(self.separator) + len(text) <= self.max_length
+            ):
+                queue[-1] += self.separator + text
+                self.merged += 1
+            else:
+                queue.append(text)
+            self.enqueued += 1
+            self._dirty = True
+            self._cond.notify()
+
+    @property
+    def pending(self) -> int:
+        """Number of messages waiting to be sent (after merging)."""
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def flush(self) -> Optional[float]:
+        """Send every queued message the limits allow at ``clock()``.
+
+        Returns the clock time at which the next message can be sent, or
+        ``None`` if the queue is empty.
+        """
+        with self._flush_lock:
+            sends, next_at = self._take_ready()
+            for chat_id, text in sends:
+                try:
+                    self.bot.send_message(chat_id, text)
+                except Exception:
+                    # A failed reply is dropped rather than retried forever.
+                    self.errors += 1
+                else:
+                    self.sent += 1
+            return next_at
+
+    def _take_ready(self) -> Tuple[List[Tuple[Any, str]], Optional[float]]:
+        sends: List[Tuple[Any, str]] = []
+        with self._cond:
+            self._dirty = False
+            now = self.clock()
+            progress = True
+            while progress and self._queues:
+                progress = False
+                for chat_id in list(self._queues):
+                    if self._global.ready_at(now) > now:
+                        break
+                    bucket = self._buckets.get(chat_id)
+                    if bucket is None:
+                        bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+                    if bucket.ready_at(now) > now:
+                        continue
+                    bucket.take(now)
+                    self._global.take(now)
+                    # Re-inserting moves the chat to the back of the rotation.
+                    queue = self._queues.pop(chat_id)
+                    sends.append((chat_id, queue.popleft()))
+                    if queue:
+                        self._queues[chat_id] = queue
+                    progress = True
+            if len(self._buckets) > 2 * len(self._queues) + 1024:
+                for chat_id in [c for c, b in self._buckets.items() if c not in self._queues and b.full(now)]:
+                    del self._buckets[chat_id]
+            if not self._queues:
+                return sends, None
+            # A chat without a bucket has not sent yet and is ready now.
+            chat_ready = min(
+                self._buckets[chat_id].ready_at(now) if chat_id in self._buckets else now
+                for chat_id in self._queues
+            )
+            return sends, max(chat_ready, self._global.ready_at(now))
+
+    def start(self) -> None:
+        """Flush from a background thread until :meth:`close` is called."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bot-send-queue", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            next_at = self.flush()
+            with self._cond:
+                if self._closed and not self._queues:
+                    return
+                if not self._dirty:
+                    timeout = None if next_at is None else max(next_at - self.clock(), 0.0)
+                    self._cond.wait(timeout)
+
+    def close(self) -> None:
+        """Send the remaining messages and stop the background thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for comparing achieved throughput with the limits."""
+        return {
+            "enqueued": self.enqueued,
+            "merged": self.merged,
+            "sent": self.sent,
+            "errors": self.errors,
+            "pending": self.pending,
+        }
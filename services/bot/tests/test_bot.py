@@ -1,11 +1,14 @@
 import importlib.util
 import pathlib
 import sys
+import threading
+import time
 
 ROOT = pathlib.Path(__file__).resolve().parents[3]
 module_path = ROOT / "services" / "bot" / "main.py"
 # Ensure repository root takes precedence on sys.path so stubs are used
 sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(module_path.parent))
 sys.modules.pop("telegram", None)
 
 spec = importlib.util.spec_from_file_location("bot_main", module_path)
@@ -76,3 +79,235 @@ def test_task_command_creates_task_via_gateway():
         "due_at": "2024-01-01",
         "tags": ["dev", "qa"],
     }
+
+
+def test_multiline_task_message_uses_batch_api():
+    batches = []
+
+    def fake_batch_api(payloads: list) -> list:
+        batches.append(payloads)
+        return [{"id": 10 + i} for i in range(len(payloads))]
+
+    app = bot_main.create_app(task_api=lambda payload: {"id": 1}, task_batch_api=fake_batch_api)
+    local_client = TestClient(app)
+    resp = local_client.post(
+        "/webhook",
+        json={"message": {"text": "/task first @bob\nsecond #ops\n\nthird 2024-02-02", "chat": {"id": 7}}},
+    )
+    assert resp.json()["reply"] == "created tasks 10, 11, 12"
+    assert batches == [[
+        {"title": "first", "assignee": "bob", "chat_id": 7},
+        {"title": "second", "tags": ["ops"], "chat_id": 7},
+        {"title": "third", "due_at": "2024-02-02", "chat_id": 7},
+    ]]
+
+
+def test_empty_or_unknown_messages_do_not_crash():
+    app = bot_main.create_app(bot_name="X", bot_username="testbot")
+    local_client = TestClient(app)
+    for update in ({}, {"message": {}}, {"message": {"text": ""}}, {"message": {"text": "   "}}, {"message": {"text": "hello"}}):
+        resp = local_client.post("/webhook", json=update)
+        assert resp.status_code == 200
+        assert resp.json()["reply"] == "unknown"
+    assert local_client.post("/webhook", json={"message": {"text": "/who@testbot"}}).json()["reply"] == "X"
+    assert local_client.post("/webhook", json={"message": {"text": "/who@otherbot"}}).json()["reply"] == "unknown"
+    # /task is not registered without a task_api.
+    assert local_client.post("/webhook", json={"message": {"text": "/task x"}}).json()["reply"] == "unknown"
+
+
+def test_webhook_batch_preserves_order_per_chat():
+    created = []
+
+    def fake_task_api(payload):
+        created.append(payload["title"])
+        return {"id": len(created)}
+
+    app = bot_main.create_app(task_api=fake_task_api, workers=4)
+    local_client = TestClient(app)
+    updates = [
+        {"update_id": n, "message": {"text": f"/task item {n}", "chat": {"id": 7}}}
+        for n in range(20)
+    ]
+    resp = local_client.post("/webhook/batch", json={"ok": True, "result": updates})
+    assert resp.status_code == 200
+    assert [item["update_id"] for item in resp.json()] == list(range(20))
+    assert [item["reply"] for item in resp.json()] == [f"created task {n}" for n in range(1, 21)]
+    assert created == [f"item {n}" for n in range(20)]
+
+
+def test_webhook_batch_reports_failed_updates(caplog):
+    def flaky_task_api(payload):
+        if payload["title"] == "boom":
+            raise RuntimeError("task service unavailable")
+        return {"id": 1}
+
+    updates = [
+        {"update_id": 1, "message": {"text": "/task boom", "chat": {"id": 1}}},
+        {"update_id": 2, "message": {"text": "/task fine", "chat": {"id": 2}}},
+    ]
+    local_client = TestClient(bot_main.create_app(task_api=flaky_task_api))
+    with caplog.at_level("ERROR"):
+        resp = local_client.post("/webhook/batch", json=updates)
+    assert resp.status_code == 200
+    assert resp.json() == [
+        {"update_id": 1, "error": "task service unavailable"},
+        {"update_id": 2, "reply": "created task 1"},
+    ]
+    assert "update 1 failed" in caplog.text
+
+    sent = []
+
+    class RecordingBot:
+        def send_message(self, chat_id, text):
+            sent.append((chat_id, text))
+
+    caplog.clear()
+    with caplog.at_level("ERROR"):
+        app = bot_main.create_app(task_api=flaky_task_api, bot=RecordingBot())
+        assert TestClient(app).post("/webhook/batch", json=updates).json() == {"accepted": 2}
+        deadline = time.monotonic() + 5
+        while ("update 1 failed" not in caplog.text or not sent) and time.monotonic() < deadline:
+            time.sleep(0.001)
+    assert sent == [(2, "created task 1")]
+    assert "update 1 failed" in caplog.text
+
+
+def test_webhook_batch_skips_unknown_replies_and_rejects_malformed_updates():
+    sent = []
+
+    class RecordingBot:
+        def send_message(self, chat_id, text):
+            sent.append((chat_id, text))
+
+    app = bot_main.create_app(bot=RecordingBot())
+    local_client = TestClient(app)
+    updates = [
+        {"update_id": 1, "message": {"text": "lunch anyone?", "chat": {"id": -5}}},
+        {"update_id": 2, "message": {"text": "/ping", "chat": {"id": -5}}},
+        {"update_id": 3, "message": {"text": "see you there", "chat": {"id": -5}}},
+    ]
+    assert local_client.post("/webhook/batch", json=updates).json() == {"accepted": 3}
+    deadline = time.monotonic() + 5
+    while not sent and time.monotonic() < deadline:
+        time.sleep(0.001)
+    time.sleep(0.05)
+    assert sent == [(-5, "pong")]
+
+    for malformed in ([{"update_id": 1}, "oops"], [7], [{"message": "text"}], {"result": {"update_id": 1}}):
+        assert local_client.post("/webhook/batch", json=malformed).status_code == 400
+    assert local_client.post("/webhook/batch", json=[{"message": "text"}]).json()["detail"] == "updates[0] must be an update object"
+
+
+def test_slow_task_does_not_block_other_chats():
+    release = threading.Event()
+
+    def slow_task_api(payload):
+        release.wait(5)
+        return {"id": 1}
+
+    replies = {}
+
+    class RecordingBot:
+        def send_message(self, chat_id, text):
+            replies[chat_id] = (text, time.monotonic())
+
+    app = bot_main.create_app(task_api=slow_task_api, bot=RecordingBot(), workers=2)
+    local_client = TestClient(app)
+    resp = local_client.post(
+        "/webhook/batch",
+        json=[
+            {"update_id": 1, "message": {"text": "/task slow", "chat": {"id": 1}}},
+            {"update_id": 2, "message": {"text": "/ping", "chat": {"id": 2}}},
+        ],
+    )
+    assert resp.json() == {"accepted": 2}
+    deadline = time.monotonic() + 5
+    while 2 not in replies and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert replies[2][0] == "pong"
+    assert 1 not in replies
+    release.set()
+    while 1 not in replies and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert replies[1][0] == "created task 1"
+
+
+def test_dispatcher_rejects_batches_over_backlog():
+    from dispatcher import ChatDispatcher, Overloaded
+
+    release = threading.Event()
+    dispatcher = ChatDispatcher(lambda update: release.wait(5), workers=1, max_pending=2)
+    first = dispatcher.submit(1, {})
+    try:
+        dispatcher.submit_many([(2, {}), (3, {})])
+    except Overloaded:
+        pass
+    else:
+        raise AssertionError("expected Overloaded")
+    assert dispatcher.pending == 1
+    release.set()
+    assert first.result(5) is True
+    dispatcher.shutdown()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_send_queue_enforces_chat_and_global_limits():
+    from send_queue import SendQueue
+
+    clock = FakeClock()
+    bot = Bot("token")
+    queue = SendQueue(bot, chat_rate=1, chat_burst=1, global_rate=2, global_burst=2, merge=False, clock=clock)
+    for chat_id in (1, 1, 2, 3):
+        queue.send_message(chat_id, f"to {chat_id}")
+    assert queue.flush() == 0.5
+    # Chat 1 is limited to one message per second, the bot to two at once.
+    assert bot.sent_messages == [(1, "to 1"), (2, "to 2")]
+    clock.now = 0.5
+    queue.flush()
+    assert bot.sent_messages[2:] == [(3, "to 3")]
+    clock.now = 1.0
+    assert queue.flush() is None
+    assert bot.sent_messages[3:] == [(1, "to 1")]
+
+
+def test_send_queue_merges_consecutive_messages_per_chat():
+    from send_queue import SendQueue
+
+    clock = FakeClock()
+    bot = Bot("token")
+    queue = SendQueue(bot, max_length=12, clock=clock)
+    queue.send_message(1, "first")
+    queue.flush()
+    for text in ("second", "third", "fourth"):
+        queue.send_message(1, text)
+    clock.now = 1.0
+    queue.flush()
+    clock.now = 2.0
+    queue.flush()
+    assert bot.sent_messages == [(1, "first"), (1, "second\nthird"), (1, "fourth")]
+    assert queue.stats()["merged"] == 1
+
+
+def test_send_queue_background_flush_delivers_batched_replies():
+    from send_queue import SendQueue
+
+    bot = Bot("token")
+    queue = SendQueue(bot, chat_rate=1000, chat_burst=10)
+    queue.start()
+    app = bot_main.create_app(bot=queue)
+    local_client = TestClient(app)
+    updates = [{"update_id": n, "message": {"text": "/ping", "chat": {"id": n % 3}}} for n in range(6)]
+    assert local_client.post("/webhook/batch", json=updates).json() == {"accepted": 6}
+    deadline = time.monotonic() + 5
+    while queue.enqueued < 6 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    queue.close()
+    replies = [text for _, text in bot.sent_messages]
+    assert "\n".join(replies).split("\n") == ["pong"] * 6
@@ -0,0 +1,45 @@
+"""Document generators used by the doc service.
+
+A generator takes the requested document ``type`` and the ``source_text``
+and yields the Markdown document in chunks, so the service can stream the
+first part of a long document while the rest is still being produced.
+Generators are expensive (the real one will call an LLM), which is why the
+service caches their results (see :mod:`result_cache`).
+
+:func:`template_generator` is the local stand-in until then: it emits a
+heading and then the source text paragraph by paragraph, splitting long
+paragraphs at word boundaries into chunks of at most ``chunk_size``
+characters.  Its :attr:`version` is part of every cache key, so changing the
+output of a generator must come with a new version.
+"""
+
+from typing import Callable, Iterator
+
+# Largest chunk, in characters, produced for one piece of a long paragraph.
+DEFAULT_CHUNK_SIZE = 4096
+
+Generator = Callable[[str, str], Iterator[str]]
+
+
+def template_generator(doc_type: str, source_text: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """Render ``source_text`` under a ``# Type`` heading, chunk by chunk."""
+    yield f"# {doc_type.title()}\n\n"
+    start = 0
+    while start < len(source_text):
+        end = min(start + chunk_size, len(source_text))
+        if end < len(source_text):
+            # Prefer a paragraph break, then a space, within the chunk.
+            cut = source_text.rfind("\n\n", start, end)
+            if cut <= start:
+                cut = source_text.rfind(" ", start, end)
+            end = cut + 1 if cut > start else end
+        yield source_text[start:end]
+        start = end
+
+
+template_generator.version = "template-1"  # type: ignore[attr-defined]
+
+
+def generator_version(generator: Generator) -> str:
+    """Identity of ``generator``'s output format, used in cache keys."""
+    return getattr(generator, "version", None) or f"{generator.__module__}.{generator.__qualname__}"
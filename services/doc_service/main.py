@@ -1,7 +1,41 @@
+"""Documentation generation service.
+
+``POST /generate`` turns a ``(type, source_text)`` request into a Markdown
+document; ``POST /generate/stream`` returns the same document as a stream of
+chunks, sent as soon as the generator produces them, so the first bytes of a
+long document arrive before the rest is built.
+
+Generation is expensive and callers often repeat a request, so documents
+are cached under a hash of the request (see :mod:`result_cache`) with LRU
+and TTL eviction, on disk as well when ``DOC_CACHE_DIR`` is set.  Identical
+requests arriving while a document is being generated wait for that one
+generation instead of starting their own.
+"""
+
+import asyncio
+import itertools
+import os
+from typing import Any, Dict, Iterator
+
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-app = FastAPI()
+from generator import Generator, generator_version, template_generator
+from result_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, Abandoned, ResultCache, request_key
+
+app = FastAPI(title="doc_service")
+
+MARKDOWN_MEDIA_TYPE = "text/markdown; charset=utf-8"
+
+# TODO: integrate LLM; the template generator stands in until then.
+GENERATOR: Generator = template_generator
+
+CACHE = ResultCache(
+    int(os.environ.get("DOC_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    float(os.environ.get("DOC_CACHE_TTL", DEFAULT_TTL)),
+    os.environ.get("DOC_CACHE_DIR") or None,
+)
 
 
 class DocRequest(BaseModel):
@@ -13,10 +47,88 @@ class DocResponse(BaseModel):
     markdown: str
 
 
+def _key(req: DocRequest) -> str:
+    return request_key(req.type, req.source_text, generator_version(GENERATOR))
+
+
+def render(doc_type: str, source_text: str) -> str:
+    """Generate a whole document."""
+    return "".join(GENERATOR(doc_type, source_text))
+
+
+async def document(req: DocRequest) -> str:
+    """Return the document for ``req``, generating it at most once at a time."""
+    key = _key(req)
+    while True:
+        cached = CACHE.get(key)
+        if cached is not None:
+            return cached
+        future, leader = CACHE.claim(key)
+        if not leader:
+            try:
+                return await asyncio.wrap_future(future)
+            except Abandoned:
+                continue
+        try:
+            markdown = await asyncio.to_thread(render, req.type, req.source_text)
+        except BaseException:
+            CACHE.abandon(key, future, "generation failed")
+            raise
+        CACHE.finish(key, future, markdown)
+        return markdown
+
+
+def _stream(key: str, future: Any, req: DocRequest) -> Iterator[str]:
+    """Yield the generator's chunks and cache the document once complete."""
+    parts = []
+    try:
+        for chunk in GENERATOR(req.type, req.source_text):
+            parts.append(chunk)
+            yield chunk
+    except BaseException:
+        # Includes ``GeneratorExit`` when the client stops reading.
+        CACHE.abandon(key, future, "stream abandoned")
+        raise
+    CACHE.finish(key, future, "".join(parts))
+
+
 @app.post("/generate", response_model=DocResponse)
 async def generate(req: DocRequest):
-    # TODO: integrate LLM
-    return DocResponse(markdown=f"# {req.type.title()}\n\n{req.source_text}")
+    """Return the document for ``req``, from the cache when possible."""
+    return DocResponse(markdown=await document(req))
+
+
+@app.post("/generate/stream")
+async def generate_stream(req: DocRequest) -> StreamingResponse:
+    """Stream the document for ``req`` as Markdown chunks.
+
+    A cached document is sent at once.  Otherwise the response streams the
+    generator's output as it is produced and caches the whole document at
+    the end; identical requests meanwhile wait for it and get it in one
+    chunk.
+    """
+    key = _key(req)
+    cached = CACHE.get(key)
+    if cached is not None:
+        return StreamingResponse([cached], media_type=MARKDOWN_MEDIA_TYPE)
+    future, leader = CACHE.claim(key)
+    if not leader:
+        try:
+            return StreamingResponse([await asyncio.wrap_future(future)], media_type=MARKDOWN_MEDIA_TYPE)
+        except Abandoned:
+            return StreamingResponse(GENERATOR(req.type, req.source_text), media_type=MARKDOWN_MEDIA_TYPE)
+    stream = _stream(key, future, req)
+    # Produce the first chunk now: once started, the stream releases the
+    # key even if the client never reads the rest.
+    first = await asyncio.to_thread(next, stream, None)
+    chunks = stream if first is None else itertools.chain([first], stream)
+    return StreamingResponse(chunks, media_type=MARKDOWN_MEDIA_TYPE)
+
+
+@app.get("/cache/stats")
+def cache_stats() -> Dict[str, int]:
+    """Expose document cache counters for tuning."""
+    return CACHE.stats()
 
 
 @app.get("/health")
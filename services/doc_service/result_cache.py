@@ -0,0 +1,174 @@
+"""Content-addressed cache of generated documents.
+
+Callers submit the same ``(type, source_text)`` again and again, and every
+generation is expensive, so results are cached under a hash of the request
+(:func:`request_key`): identical requests share one entry whatever their
+origin, and a changed source text or generator version is a different key.
+
+:class:`ResultCache` keeps two tiers:
+
+* memory: an LRU of at most ``max_entries`` documents, each expiring
+  ``ttl`` seconds after it was stored;
+* disk (optional, ``directory``): one file per key, written atomically and
+  expiring by modification time, which survives restarts and is shared by
+  the processes of one host.  Disk hits are promoted to memory.
+
+:meth:`ResultCache.claim` adds single-flight: the first caller missing a
+key becomes its leader and computes it, later callers for the same key wait
+for the leader's result instead of computing it again.  A leader that gives
+up (an abandoned stream, an error) passes the failure to the waiters, which
+then compute for themselves.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 3600.0
+
+
+def request_key(doc_type: str, source_text: str, version: str) -> str:
+    """SHA-256 hex digest identifying a generation request."""
+    canonical = json.dumps([version, doc_type, source_text], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class Abandoned(Exception):
+    """Set on a single-flight future whose leader gave up."""
+
+
+class ResultCache:
+    """LRU + TTL document cache with an optional disk tier and single-flight."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        directory: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.shared = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached document for ``key``, from memory or disk, or ``None``."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+        value = self._read(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value, now)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        """Store ``value`` in memory and, if enabled, on disk."""
+        now = self.clock()
+        with self._lock:
+            self._remember(key, value, now)
+        if self.directory:
+            self._write(key, value, now)
+
+    def _remember(self, key: str, value: str, now: float) -> None:
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read(self, key: str, now: float) -> Optional[str]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if os.stat(path).st_mtime + self.ttl <= now:
+                os.unlink(path)
+                return None
+            with open(path, encoding="utf-8") as handle:
+                return handle.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, value: str, now: float) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers never see a partial document.
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                handle.write(value)
+            os.utime(temporary, (now, now))
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """Join the computation of ``key``: ``(future, is_leader)``.
+
+        The leader must call :meth:`finish` or :meth:`abandon` with the
+        returned future; everyone else waits on it.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._flights[key] = Future()
+            return future, True
+
+    def finish(self, key: str, future: Future, value: str) -> None:
+        """Store the leader's ``value`` and hand it to the waiters."""
+        self.put(key, value)
+        self._release(key, future)
+        future.set_result(value)
+
+    def abandon(self, key: str, future: Future, reason: str = "leader gave up") -> None:
+        """Release ``key`` without a result; waiters get :class:`Abandoned`."""
+        self._release(key, future)
+        if not future.done():
+            future.set_exception(Abandoned(reason))
+
+    def _release(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "shared": self.shared,
+            }
@@ -0,0 +1,127 @@
+import asyncio
+import importlib.util
+import pathlib
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+ROOT = pathlib.Path(__file__).resolve().parents[3]
+SERVICE_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(SERVICE_DIR)])
+
+from fastapi.testclient import AsyncTestClient, TestClient
+
+spec = importlib.util.spec_from_file_location("doc_main", SERVICE_DIR / "main.py")
+doc_main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(doc_main)
+
+client = TestClient(doc_main.app)
+
+
+class RecordingGenerator:
+    """Stand-in generator counting calls and chunks produced."""
+
+    version = "recording-1"
+
+    def __init__(self, gate=None):
+        self.calls = 0
+        self.produced = 0
+        self.gate = gate
+
+    def __call__(self, doc_type, source_text):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        for chunk in doc_main.template_generator(doc_type, source_text, chunk_size=10):
+            self.produced += 1
+            yield chunk
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    recording = RecordingGenerator()
+    monkeypatch.setattr(doc_main, "GENERATOR", recording)
+    monkeypatch.setattr(doc_main, "CACHE", doc_main.ResultCache())
+    return recording
+
+
+def test_generate_is_cached_by_content(generator):
+    request = {"type": "readme", "source_text": "Install with pip."}
+    first = client.post("/generate", json=request).json()
+    assert first == {"markdown": "# Readme\n\nInstall with pip."}
+    assert client.post("/generate", json=dict(request)).json() == first
+    assert generator.calls == 1
+    client.post("/generate", json=dict(request, source_text="Install with uv."))
+    assert generator.calls == 2
+    assert client.get("/cache/stats").json()["hits"] == 1
+
+
+def test_concurrent_identical_requests_generate_once(monkeypatch):
+    gate = threading.Event()
+    recording = RecordingGenerator(gate)
+    monkeypatch.setattr(doc_main, "GENERATOR", recording)
+    monkeypatch.setattr(doc_main, "CACHE", doc_main.ResultCache())
+    async_client = AsyncTestClient(doc_main.app)
+    request = {"type": "guide", "source_text": "Same text for everyone."}
+
+    async def burst():
+        pending = [asyncio.ensure_future(async_client.post("/generate", json=request)) for _ in range(5)]
+        while doc_main.CACHE.shared < 4:
+            await asyncio.sleep(0.001)
+        gate.set()
+        return await asyncio.gather(*pending)
+
+    replies = asyncio.run(burst())
+    assert {reply.json()["markdown"] for reply in replies} == {"# Guide\n\nSame text for everyone."}
+    assert recording.calls == 1
+
+
+def test_stream_sends_first_chunks_before_the_document_is_built(generator):
+    request = {"type": "notes", "source_text": "one two three four five six seven eight nine ten"}
+    response = client.post("/generate/stream", json=request)
+    assert response.headers["content-type"].startswith("text/markdown")
+    chunks = response.iter_bytes()
+    assert next(chunks) == b"# Notes\n\n"
+    assert generator.produced == 1
+    rest = b"".join(chunks)
+    assert generator.produced > 3
+    assert (b"# Notes\n\n" + rest).decode() == doc_main.render(request["type"], request["source_text"])
+
+    # The streamed document was cached for both endpoints.
+    calls = generator.calls - 1
+    assert client.post("/generate", json=request).json()["markdown"].endswith("nine ten")
+    assert client.post("/generate/stream", json=request).content.endswith(b"nine ten")
+    assert generator.calls - 1 == calls
+
+
+def test_abandoned_stream_releases_its_key(generator):
+    request = {"type": "notes", "source_text": "long enough to need several chunks"}
+    chunks = client.post("/generate/stream", json=request).iter_bytes()
+    next(chunks)
+    chunks.close()
+    key = doc_main._key(doc_main.DocRequest(**request))
+    assert doc_main.CACHE.get(key) is None
+    assert doc_main.CACHE.claim(key)[1]
+
+
+def test_result_cache_lru_ttl_and_disk_tier(tmp_path):
+    from result_cache import ResultCache, request_key
+
+    now = [1_000_000.0]
+    cache = ResultCache(max_entries=2, ttl=60, directory=str(tmp_path), clock=lambda: now[0])
+    keys = [request_key("t", f"text {i}", "v1") for i in range(3)]
+    assert len(set(keys)) == 3 and request_key("t", "text 0", "v2") != keys[0]
+    for index, key in enumerate(keys):
+        cache.put(key, f"doc {index}")
+    assert len(cache._entries) == 2
+
+    # Evicted from memory, still on disk; a new process sees all of them.
+    assert cache.get(keys[0]) == "doc 0" and cache.disk_hits == 1
+    reopened = ResultCache(directory=str(tmp_path), ttl=60, clock=lambda: now[0])
+    assert [reopened.get(key) for key in keys] == ["doc 0", "doc 1", "doc 2"]
+
+    now[0] += 61
+    assert cache.get(keys[1]) is None and reopened.get(keys[2]) is None
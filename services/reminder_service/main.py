@@ -1,9 +1,37 @@
+"""Reminder service.
+
+Reminders are kept in memory and scheduled on a
+:class:`~scheduler.ReminderScheduler` whose background thread fires them:
+when a reminder's ``fire_at`` passes it is delivered through the pluggable
+sender (see :func:`set_sender`) and its ``status`` flips from ``pending`` to
+``fired``.  Setting ``TELEGRAM_BOT_TOKEN`` sends reminders with
+``telegram.Bot.send_message``; without a sender they are only marked fired.
+A failed send is retried with exponential backoff (``RETRY_DELAY`` doubling
+per attempt) and the reminder is marked ``failed`` after ``MAX_ATTEMPTS``.
+
+Besides reminders created explicitly, the task service reports task
+deadlines as ``schedule``/``cancel`` events on ``POST /deadlines``.  Each
+task has at most one deadline reminder (its ``id`` is the task id), which is
+replaced when the due date changes and dropped when the task loses its due
+date or is deleted.
+"""
+
+import logging
+import os
 from datetime import datetime
-from typing import List
-from fastapi import FastAPI
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
-app = FastAPI()
+from scheduler import ReminderScheduler
+
+app = FastAPI(title="reminder_service")
+
+logger = logging.getLogger(__name__)
+
+# Delivery attempts per reminder, and the delay before the first retry.
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30.0
 
 
 class Reminder(BaseModel):
@@ -15,18 +43,132 @@ class Reminder(BaseModel):
     status: str = "pending"
 
 
-_reminders: List[Reminder] = []
+_reminders: Dict[int, Reminder] = {}
+# Deadline reminders keyed by task id; scheduled under ``("task", id)``.
+_deadlines: Dict[int, Reminder] = {}
+
+# Failed delivery attempts of the reminders being retried, by schedule key.
+_attempts: Dict[Hashable, int] = {}
+
+# Delivers ``(chat_id, text)``; ``None`` marks reminders fired without sending.
+_sender: Optional[Callable[[int, str], Any]] = None
+
+
+def set_sender(sender: Optional[Callable[[int, str], Any]]) -> None:
+    """Route fired reminders to ``sender(chat_id, text)``."""
+    global _sender
+    _sender = sender
+
+
+def _schedule(key: Hashable, reminder: Reminder) -> None:
+    _attempts.pop(key, None)
+    SCHEDULER.schedule(key, reminder.fire_at.timestamp(), (key, reminder))
+
+
+def _cancel(key: Hashable) -> None:
+    _attempts.pop(key, None)
+    SCHEDULER.cancel(key)
+
+
+def _deliver(entry: Tuple[Hashable, Reminder]) -> None:
+    key, reminder = entry
+    try:
+        if _sender is not None:
+            _sender(reminder.chat_id, reminder.text)
+    except Exception:
+        attempts = _attempts.get(key, 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            _attempts.pop(key, None)
+            reminder.status = "failed"
+            logger.exception("reminder %s failed after %d attempts", key, attempts)
+        else:
+            _attempts[key] = attempts
+            retry_at = SCHEDULER.clock() + RETRY_DELAY * 2 ** (attempts - 1)
+            SCHEDULER.schedule(key, retry_at, entry)
+            logger.warning("reminder %s not delivered, attempt %d; retrying", key, attempts, exc_info=True)
+        raise
+    _attempts.pop(key, None)
+    reminder.status = "fired"
+
+
+SCHEDULER = ReminderScheduler(_deliver)
+SCHEDULER.start()
+
+if os.environ.get("TELEGRAM_BOT_TOKEN"):
+    from telegram import Bot
+
+    set_sender(Bot(os.environ["TELEGRAM_BOT_TOKEN"]).send_message)
 
 
 @app.post("/reminders", response_model=Reminder)
 async def create(reminder: Reminder):
-    _reminders.append(reminder)
+    _reminders[reminder.id] = reminder
+    if reminder.status == "pending":
+        _schedule(reminder.id, reminder)
+    else:
+        _cancel(reminder.id)
     return reminder
 
 
 @app.get("/reminders", response_model=List[Reminder])
 async def list_reminders():
-    return _reminders
+    return list(_reminders.values())
+
+
+@app.post("/deadlines")
+async def apply_deadline_events(data: Dict[str, Any]) -> Dict[str, int]:
+    """Apply ``{"events": [...]}`` emitted by the task service.
+
+    Every event is validated before any is applied; a malformed one
+    rejects the request with ``400``.  Returns how many reminders were
+    scheduled and cancelled.
+    """
+    events = data.get("events")
+    if not isinstance(events, list):
+        raise HTTPException(400, "events must be a list")
+    parsed = [_parse_event(index, event) for index, event in enumerate(events)]
+    scheduled = cancelled = 0
+    for task_id, reminder in parsed:
+        if reminder is not None:
+            _deadlines[task_id] = reminder
+            _schedule(("task", task_id), reminder)
+            scheduled += 1
+        else:
+            _deadlines.pop(task_id, None)
+            _cancel(("task", task_id))
+            cancelled += 1
+    return {"scheduled": scheduled, "cancelled": cancelled}
+
+
+def _parse_event(index: int, event: Any) -> Tuple[int, Optional[Reminder]]:
+    """Return ``(task_id, reminder)`` for a deadline event; ``None`` cancels."""
+    if not isinstance(event, dict):
+        raise HTTPException(400, f"events[{index}] must be an object")
+    op = event.get("op")
+    if op not in ("schedule", "cancel"):
+        raise HTTPException(400, f"events[{index}]: unknown op: {op}")
+    task_id = event.get("task_id")
+    if not isinstance(task_id, int) or isinstance(task_id, bool):
+        raise HTTPException(400, f"events[{index}]: task_id must be an integer")
+    if op == "cancel":
+        return task_id, None
+    try:
+        reminder = Reminder(
+            id=task_id,
+            chat_id=event.get("chat_id"),
+            target=event.get("target"),
+            fire_at=event.get("fire_at"),
+            text=event.get("text"),
+        )
+    except ValueError as exc:
+        # pydantic's ValidationError is a ValueError.
+        raise HTTPException(400, f"events[{index}]: {exc}") from None
+    return task_id, reminder
+
+
+@app.get("/deadlines", response_model=List[Reminder])
+async def list_deadlines():
+    return list(_deadlines.values())
 
 
 @app.get("/health")
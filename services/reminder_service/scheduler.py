@@ -0,0 +1,143 @@
+"""Timer heap firing reminders at their ``fire_at`` time.
+
+:class:`ReminderScheduler` keeps one small list per pending reminder in a
+binary min-heap ordered by fire time, so scheduling and popping the next due
+reminder are O(log n) and the memory cost is a few dozen bytes on top of the
+scheduled item itself.  Cancelling or rescheduling marks the old heap entry
+dead instead of searching for it; dead entries are skipped when they reach
+the top and the heap is compacted once they make up half of it.
+
+Due items are handed to a ``deliver`` callable, either from
+:meth:`ReminderScheduler.fire_due` (driven directly by tests and benchmarks
+with an injected clock) or from the background thread started with
+:meth:`ReminderScheduler.start`.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# Heap entry layout: [fire_at, sequence, key, item].  The sequence number
+# breaks ties between equal fire times without comparing keys or items.
+_FIRE_AT, _SEQ, _KEY, _ITEM = range(4)
+_DEAD = object()
+
+
+class ReminderScheduler:
+    """Min-heap of items keyed by a unique key and ordered by fire time."""
+
+    def __init__(self, deliver: Callable[[Any], Any], clock: Callable[[], float] = time.time) -> None:
+        self.deliver = deliver
+        self.clock = clock
+        self._heap: List[list] = []
+        self._entries: Dict[Hashable, list] = {}
+        self._counter = itertools.count()
+        self._dead = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.fired = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def schedule(self, key: Hashable, fire_at: float, item: Any) -> None:
+        """Fire ``item`` at ``fire_at``, replacing any entry for ``key``."""
+        with self._cond:
+            self._discard(key)
+            entry = [fire_at, next(self._counter), key, item]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                # The background thread may be sleeping past the new head.
+                self._cond.notify()
+
+    def cancel(self, key: Hashable) -> bool:
+        """Forget ``key``; returns ``False`` if it was not pending."""
+        with self._cond:
+            return self._discard(key)
+
+    def _discard(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[_ITEM] = _DEAD
+        self._dead += 1
+        if self._dead > len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[_ITEM] is not _DEAD]
+            heapq.heapify(self._heap)
+            self._dead = 0
+        return True
+
+    def next_fire_at(self) -> Optional[float]:
+        """Fire time of the earliest pending item, or ``None``."""
+        with self._cond:
+            self._drop_dead_head()
+            return self._heap[0][_FIRE_AT] if self._heap else None
+
+    def _drop_dead_head(self) -> None:
+        heap = self._heap
+        while heap and heap[0][_ITEM] is _DEAD:
+            heapq.heappop(heap)
+            self._dead -= 1
+
+    def pop_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[Any]:
+        """Remove and return the items due at ``now`` in fire-time order."""
+        if now is None:
+            now = self.clock()
+        due: List[Any] = []
+        with self._cond:
+            heap = self._heap
+            while heap and heap[0][_FIRE_AT] <= now and (limit is None or len(due) < limit):
+                entry = heapq.heappop(heap)
+                if entry[_ITEM] is _DEAD:
+                    self._dead -= 1
+                    continue
+                del self._entries[entry[_KEY]]
+                due.append(entry[_ITEM])
+        return due
+
+    def fire_due(self, now: Optional[float] = None) -> int:
+        """Deliver every item due at ``now`` and return how many fired."""
+        due = self.pop_due(now)
+        for item in due:
+            try:
+                self.deliver(item)
+            except Exception:
+                # One failing delivery must not stop the others.
+                self.errors += 1
+            else:
+                self.fired += 1
+        return len(due)
+
+    def start(self) -> None:
+        """Fire due items from a background thread until :meth:`close`."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.fire_due()
+            with self._cond:
+                if self._closed:
+                    return
+                self._drop_dead_head()
+                timeout = None if not self._heap else max(self._heap[0][_FIRE_AT] - self.clock(), 0.0)
+                if timeout != 0.0:
+                    self._cond.wait(timeout)
+
+    def close(self) -> None:
+        """Stop the background thread; pending items stay scheduled."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
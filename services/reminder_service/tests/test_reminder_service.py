@@ -0,0 +1,172 @@
+import importlib.util
+import pathlib
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+ROOT = pathlib.Path(__file__).resolve().parents[3]
+SERVICE_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(SERVICE_DIR)])
+
+from fastapi.testclient import TestClient
+from scheduler import ReminderScheduler
+from telegram import Bot
+
+spec = importlib.util.spec_from_file_location("reminder_main", SERVICE_DIR / "main.py")
+reminder_main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(reminder_main)
+# The tests fire reminders themselves, at chosen times.
+reminder_main.SCHEDULER.close()
+
+
+def test_scheduler_fires_in_order_and_skips_cancelled():
+    fired = []
+    scheduler = ReminderScheduler(fired.append, clock=lambda: 0.0)
+    for key, fire_at in [("a", 30), ("b", 10), ("c", 20), ("d", 10)]:
+        scheduler.schedule(key, fire_at, key)
+    scheduler.cancel("c")
+    scheduler.schedule("a", 15, "a")
+    assert scheduler.next_fire_at() == 10
+    assert scheduler.fire_due(now=5) == 0
+    assert scheduler.fire_due(now=20) == 3
+    assert fired == ["b", "d", "a"]
+    assert len(scheduler) == 0
+    assert scheduler.next_fire_at() is None
+
+
+def test_scheduler_compacts_cancelled_entries():
+    scheduler = ReminderScheduler(lambda item: None)
+    for key in range(100):
+        scheduler.schedule(key, float(key), key)
+    for key in range(60):
+        scheduler.cancel(key)
+    assert len(scheduler) == 40
+    assert len(scheduler._heap) <= 2 * len(scheduler) + 1
+    assert scheduler.pop_due(now=1000) == list(range(60, 100))
+
+
+def test_due_reminders_are_sent_and_marked_fired():
+    bot = Bot("token")
+    reminder_main.set_sender(bot.send_message)
+    client = TestClient(reminder_main.app)
+    for reminder_id, fire_at in [(1, "2024-01-01T09:00:00"), (2, "2024-01-02T09:00:00")]:
+        resp = client.post(
+            "/reminders",
+            json={"id": reminder_id, "chat_id": 5, "target": "@alice", "fire_at": fire_at, "text": f"r{reminder_id}"},
+        )
+        assert resp.status_code == 200
+    reminder_main.SCHEDULER.fire_due(now=datetime(2024, 1, 1, 12).timestamp())
+    assert bot.sent_messages == [(5, "r1")]
+    statuses = {item["id"]: item["status"] for item in client.get("/reminders").json()}
+    assert statuses == {1: "fired", 2: "pending"}
+    reminder_main.set_sender(None)
+
+
+def test_task_deadlines_drive_reminders():
+    sys.path.append(str(ROOT / "services" / "task"))
+    task_spec = importlib.util.spec_from_file_location("task_main_for_reminders", ROOT / "services" / "task" / "main.py")
+    task_main = importlib.util.module_from_spec(task_spec)
+    task_spec.loader.exec_module(task_main)
+    reminders = TestClient(reminder_main.app)
+    tasks = TestClient(task_main.app)
+    task_main.set_deadline_listener(lambda events: reminders.post("/deadlines", json={"events": events}))
+
+    first = tasks.post("/tasks", json={"chat_id": 9, "title": "pay rent", "due_at": "2024-03-01"}).json()
+    second = tasks.post("/tasks", json={"chat_id": 9, "title": "renew", "due_at": "2024-03-01"}).json()
+    tasks.patch(f"/tasks/{first['id']}", json={"due_at": "2024-04-01", "assignee": "bob"})
+    tasks.delete(f"/tasks/{second['id']}")
+    deadlines = reminders.get("/deadlines").json()
+    assert [(item["id"], item["target"], item["fire_at"]) for item in deadlines] == [
+        (first["id"], "bob", "2024-04-01T00:00:00")
+    ]
+
+    bot = Bot("token")
+    reminder_main.set_sender(bot.send_message)
+    reminder_main.SCHEDULER.fire_due(now=datetime(2024, 3, 15).timestamp())
+    assert [message for message in bot.sent_messages if message[0] == 9] == []
+    reminder_main.SCHEDULER.fire_due(now=datetime(2024, 4, 1).timestamp())
+    assert [message for message in bot.sent_messages if message[0] == 9] == [(9, f"Task {first['id']} is due: pay rent")]
+    assert reminders.get("/deadlines").json()[0]["status"] == "fired"
+    reminder_main.set_sender(None)
+
+
+def test_malformed_deadline_events_are_rejected():
+    client = TestClient(reminder_main.app)
+    before = client.get("/deadlines").json()
+    valid = {"op": "schedule", "task_id": 70, "chat_id": 1, "target": "", "fire_at": "2030-01-01", "text": "t"}
+    for events, detail in [
+        ([valid, {"op": "schedule", "task_id": 71}], "events[1]: "),
+        ([{"task_id": 72}], "events[0]: unknown op: None"),
+        ([{"op": "cancel"}], "events[0]: task_id must be an integer"),
+        ([valid, "cancel"], "events[1] must be an object"),
+        ([dict(valid, fire_at="soon")], "events[0]: "),
+    ]:
+        resp = client.post("/deadlines", json={"events": events})
+        assert resp.status_code == 400
+        assert resp.json()["detail"].startswith(detail)
+    # Nothing of a rejected request is applied.
+    assert client.get("/deadlines").json() == before
+
+
+def test_failed_sends_are_retried_then_marked_failed():
+    attempts = []
+
+    def failing_sender(chat_id, text):
+        attempts.append(text)
+        raise ConnectionError("telegram unreachable")
+
+    reminder_main.set_sender(failing_sender)
+    client = TestClient(reminder_main.app)
+    client.post(
+        "/reminders",
+        json={"id": 30, "chat_id": 6, "target": "@ann", "fire_at": "2024-05-01T09:00:00", "text": "retry me"},
+    )
+    reminder_main.SCHEDULER.fire_due(now=datetime(2024, 5, 1, 10).timestamp())
+    status = {item["id"]: item["status"] for item in client.get("/reminders").json()}[30]
+    assert (attempts, status) == (["retry me"], "pending")
+    # Retried with backoff, not immediately.
+    assert 30 in reminder_main.SCHEDULER
+    assert reminder_main.SCHEDULER.fire_due(now=time.time()) == 0
+
+    later = time.time() + 3600 * 24
+    for _ in range(reminder_main.MAX_ATTEMPTS):
+        reminder_main.SCHEDULER.fire_due(now=later)
+    status = {item["id"]: item["status"] for item in client.get("/reminders").json()}[30]
+    assert (len(attempts), status) == (reminder_main.MAX_ATTEMPTS, "failed")
+    assert 30 not in reminder_main.SCHEDULER
+
+    bot = Bot("token")
+    reminder_main.set_sender(bot.send_message)
+    client.post(
+        "/reminders",
+        json={"id": 31, "chat_id": 6, "target": "@ann", "fire_at": "2024-05-01T09:00:00", "text": "works"},
+    )
+    reminder_main.set_sender(failing_sender)
+    reminder_main.SCHEDULER.fire_due(now=datetime(2024, 5, 1, 10).timestamp())
+    reminder_main.set_sender(bot.send_message)
+    reminder_main.SCHEDULER.fire_due(now=later)
+    assert bot.sent_messages == [(6, "works")]
+    assert {item["id"]: item["status"] for item in client.get("/reminders").json()}[31] == "fired"
+    reminder_main.set_sender(None)
+
+
+def test_scheduler_runs_without_a_bot_token():
+    spec = importlib.util.spec_from_file_location("reminder_main_default", SERVICE_DIR / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    try:
+        client = TestClient(module.app)
+        client.post(
+            "/reminders",
+            json={"id": 1, "chat_id": 1, "target": "@bob", "fire_at": "2024-01-01T00:00:00", "text": "overdue"},
+        )
+        deadline = time.monotonic() + 5
+        while client.get("/reminders").json()[0]["status"] != "fired" and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert client.get("/reminders").json()[0]["status"] == "fired"
+    finally:
+        module.SCHEDULER.close()
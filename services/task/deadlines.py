@@ -0,0 +1,159 @@
+"""Deadline events derived from task writes.
+
+Instead of having the reminder service poll ``GET /tasks`` for overdue
+tasks, the task service reports deadline changes as they happen.
+:class:`DeadlineFeed` compares each written task with its previous version
+and emits at most one event per task:
+
+``{"op": "schedule", "task_id", "chat_id", "target", "fire_at", "text"}``
+    The task has a due date and the reminder for it is new or changed.
+    Scheduling a task that already has a reminder replaces it, which is how
+    reschedules are expressed.
+``{"op": "cancel", "task_id"}``
+    The task lost its due date or was deleted.
+
+Events of one write are delivered together to ``listener(events)``; a batch
+of created tasks therefore produces a single call.  Writes that do not touch
+the due date or the reminder text emit nothing, so the cost of the feed is
+proportional to the number of changed deadlines, never to the number of
+stored tasks.
+
+Events are queued by the write, which holds the store lock, and delivered
+by :meth:`DeadlineFeed.flush` once the lock is released, so a slow listener
+(an HTTP call to the reminder service) never holds up other requests.  One
+thread at a time drains the queue, so the listener still sees events in
+the order the writes were applied to the store.
+
+The write has already been committed when its events are delivered, so a
+failing listener is logged and counted in :attr:`DeadlineFeed.errors`
+rather than failing the request (a retried create would store the task
+twice).  :func:`http_listener` posts events to the reminder service's
+``POST /deadlines``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import urllib.request
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+Event = Dict[str, Any]
+Listener = Callable[[List[Event]], Any]
+
+# Seconds to wait for the reminder service before giving up on a delivery.
+DEFAULT_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def reminder_event(task: Dict[str, Any]) -> Event:
+    """Return the ``schedule`` event for a task with a due date.
+
+    Date-only due dates become due at the start of that day.
+    """
+    return {
+        "op": "schedule",
+        "task_id": task["id"],
+        "chat_id": task["chat_id"],
+        "target": task.get("assignee") or "",
+        "fire_at": datetime.fromisoformat(task["due_at"]).isoformat(),
+        "text": f"Task {task['id']} is due: {task['title']}",
+    }
+
+
+def http_listener(url: str, timeout: float = DEFAULT_TIMEOUT) -> Listener:
+    """Listener posting ``{"events": [...]}`` to ``<url>/deadlines``."""
+    endpoint = url.rstrip("/") + "/deadlines"
+
+    def post(events: List[Event]) -> None:
+        request = urllib.request.Request(
+            endpoint,
+            data=json.dumps({"events": events}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+
+    return post
+
+
+class DeadlineFeed:
+    """Turn task creations, updates and deletions into deadline events."""
+
+    def __init__(self, listener: Optional[Listener] = None) -> None:
+        self.listener = listener
+        # Listener calls that raised; their events are lost.
+        self.errors = 0
+        # Events waiting for flush(), with the listener they were meant for.
+        self._queue: Deque[Tuple[Listener, List[Event]]] = deque()
+        self._lock = threading.Lock()
+        self._draining = False
+
+    def attach(self, listener: Optional[Listener], due: Iterable[Dict[str, Any]]) -> None:
+        """Report later events to ``listener``, starting with ``due``.
+
+        A ``schedule`` event is queued for each task in ``due`` so that a
+        listener attached after startup catches up.
+        """
+        self.listener = listener
+        self._emit([reminder_event(task) for task in due])
+
+    def created(self, tasks: Iterable[Dict[str, Any]]) -> None:
+        """Report newly stored tasks."""
+        self._emit([reminder_event(task) for task in tasks if task.get("due_at")])
+
+    def updated(self, old: Dict[str, Any], new: Dict[str, Any]) -> None:
+        """Report that ``old`` was replaced by ``new``."""
+        if not new.get("due_at"):
+            if old.get("due_at"):
+                self._emit([{"op": "cancel", "task_id": new["id"]}])
+            return
+        event = reminder_event(new)
+        if not old.get("due_at") or reminder_event(old) != event:
+            self._emit([event])
+
+    def deleted(self, task: Dict[str, Any]) -> None:
+        """Report that ``task`` no longer exists."""
+        if task.get("due_at"):
+            self._emit([{"op": "cancel", "task_id": task["id"]}])
+
+    def _emit(self, events: List[Event]) -> None:
+        if events and self.listener is not None:
+            with self._lock:
+                self._queue.append((self.listener, events))
+
+    def flush(self) -> None:
+        """Deliver queued events; call it without holding the store lock.
+
+        Returns at once if another thread is already delivering: that thread
+        also delivers whatever was queued meanwhile, in order.
+        """
+        with self._lock:
+            if self._draining:
+                return
+            self._draining = True
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._draining = False
+                    return
+                listener, events = self._queue.popleft()
+            try:
+                self.send(listener, events)
+            except BaseException:
+                with self._lock:
+                    self._draining = False
+                raise
+
+    def send(self, listener: Listener, events: List[Event]) -> None:
+        """Call ``listener(events)``, logging instead of raising on failure."""
+        try:
+            listener(events)
+        except Exception:
+            self.errors += 1
+            logger.exception("dropped %d deadline events", len(events))
@@ -0,0 +1,86 @@
+"""Deduplication of retried task creation requests.
+
+Telegram re-delivers a webhook whose reply is late, and every delivery runs
+the ``/task`` command again.  Creates therefore carry an idempotency key,
+and :class:`IdempotencyTable` remembers the task created for each key for
+``ttl`` seconds, so a retry gets the original task back instead of writing
+a second one.  The key of a create (see :func:`item_key`) is, in order of
+preference:
+
+* an explicit ``idempotency_key`` field, or the ``Idempotency-Key`` request
+  header (batch items get ``<header>/<index>``);
+* the ``(chat_id, message_id)`` of the Telegram message it came from.
+
+Requests with neither are not deduplicated.  The table is bounded: entries
+expire after ``ttl`` and, beyond ``max_entries``, the oldest are dropped
+first.  It lives in memory, so retries arriving after a restart are not
+recognised.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 100_000
+# Long enough to cover Telegram's webhook retries.
+DEFAULT_TTL = 3600.0
+
+
+def item_key(item: Dict[str, Any], header: Optional[str] = None) -> Optional[Hashable]:
+    """Idempotency key of one create payload, or ``None``."""
+    key = item.get("idempotency_key") or header
+    if key is not None:
+        return ("key", str(key))
+    if item.get("message_id") is not None:
+        return ("message", item.get("chat_id"), item["message_id"])
+    return None
+
+
+class IdempotencyTable:
+    """Bounded, expiring map from idempotency keys to first results."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        # Insertion order is expiry order, as every entry lives ``ttl``.
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Optional[Hashable]) -> Optional[Any]:
+        """Result stored for ``key``, counting a replay, or ``None``."""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                return None
+            self.replays += 1
+            return entry[1]
+
+    def put(self, key: Optional[Hashable], value: Any) -> None:
+        """Remember ``value`` as the result for ``key``."""
+        if key is None:
+            return
+        now = self.clock()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            entries = self._entries
+            while entries and (len(entries) > self.max_entries or next(iter(entries.values()))[0] <= now):
+                entries.popitem(last=False)
@@ -1,64 +1,445 @@
 """In-memory Task service implemented with the FastAPI stub.
 
-The service exposes two endpoints:
+The service exposes the following endpoints:
 
 * ``POST /tasks`` — create a new task.
-* ``GET /tasks`` — return the list of existing tasks.
+* ``POST /tasks:batch`` — create many tasks atomically.
+* ``GET /tasks`` — return existing tasks, optionally filtered by
+  ``chat_id``, ``assignee``, ``tag``, ``due_at`` or ``due_before`` and
+  paginated with ``limit``/``after_id``.
+* ``GET /tasks/{task_id}`` — return a single task.
+* ``PATCH /tasks/{task_id}`` — change a task's title, assignee, due date
+  or tags.
+* ``DELETE /tasks/{task_id}`` — delete a task.
+* ``GET /tasks:stats`` — count tasks, optionally filtered and grouped by
+  chat, assignee or tag.
+* ``GET /tasks:export`` — every task in a compact binary columnar format.
+* ``GET /tasks/search`` — full-text search over the titles of one chat.
 
 The real project would persist tasks in a database but for the purposes
-of this kata everything is stored in a simple Python list.
+of this kata everything is kept in an indexed in-memory
+:class:`~store.TaskStore` of compact :class:`~record.TaskRecord` objects,
+served as JSON encoded once per record and joined into list responses
+(see :func:`record.encode_list`).  Setting ``TASK_DATA_DIR`` enables durable
+storage: created tasks are appended to a write-ahead log in that directory
+and the store is rebuilt from the latest snapshot plus the log on startup.
+
+Deadline changes are pushed to the reminder service as they happen (see
+:mod:`deadlines` and :func:`set_deadline_listener`); set
+``REMINDER_SERVICE_URL`` to post them to its ``POST /deadlines``.
+
+Creates are idempotent: a retried request carrying the same
+``Idempotency-Key`` header, ``idempotency_key`` field or
+``(chat_id, message_id)`` returns the task created the first time, with an
+``Idempotent-Replayed: true`` header, and writes nothing (see
+:mod:`idempotency`).
+
+Handlers may run on several threads at once.  Each write holds
+``STORE.lock`` from id allocation until the task is logged, indexed for
+search and its deadline events are queued, so the log, the search index
+and the deadline events see writes in the same order as the store.  The
+events are delivered after the lock is released (:meth:`DeadlineFeed.flush`),
+so a slow reminder service does not block the store.
 """
 
 from __future__ import annotations
 
+import atexit
+import os
+import time
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, Hashable, List, Optional, Union
+
+from fastapi import FastAPI, Header, HTTPException, Response
+
+from columns import TaskColumns
+from deadlines import DeadlineFeed, Listener, http_listener
+from idempotency import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, IdempotencyTable, item_key
+from ids import IdAllocator
+from record import TaskRecord, encode_list
+from search import DEFAULT_LIMIT, SearchIndex
+from store import TaskStore
+from wal import WriteAheadLog
+
+app = FastAPI(title="task")
+
+# In-memory store of tasks.  Behind the sharding gateway every instance gets
+# its own ``TASK_ID_OFFSET`` below a shared ``TASK_ID_STRIDE`` so that ids
+# stay unique across shards.
+STORE = TaskStore(
+    IdAllocator.for_shard(int(os.environ.get("TASK_ID_OFFSET", 0)), int(os.environ.get("TASK_ID_STRIDE", 1)))
+)
+
+# Optional durable log; ``None`` keeps the service purely in memory.
+WAL: Optional[WriteAheadLog] = None
+if os.environ.get("TASK_DATA_DIR"):
+    WAL = WriteAheadLog(os.environ["TASK_DATA_DIR"], STORE, decode=TaskRecord.from_dict)
+    WAL.recover()
+    atexit.register(WAL.close)
+
+# Full-text index over task titles, maintained on every write.
+SEARCH = SearchIndex()
+for _task in STORE:
+    SEARCH.add(_task.id, _task.chat_id, _task.title)
+
+# Tasks created per idempotency key, so that retried creates are not repeated.
+IDEMPOTENCY = IdempotencyTable(
+    int(os.environ.get("TASK_IDEMPOTENCY_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    float(os.environ.get("TASK_IDEMPOTENCY_TTL", DEFAULT_TTL)),
+)
+
+# Deadline events for the reminder service; silent until a listener is set.
+DEADLINES = DeadlineFeed()
+
+# Columnar view of the store for reports, rebuilt lazily after writes.
+_columns: Optional[TaskColumns] = None
+_columns_version = -1
+
+# Upper bound on the number of tasks accepted by one batch request.
+MAX_BATCH_SIZE = 1000
+
+# Chat ids are stored in signed 64-bit columns (see :class:`TaskColumns`).
+MAX_CHAT_ID = 2**63 - 1
+
+# Fields that ``PATCH /tasks/{task_id}`` may change.
+EDITABLE_FIELDS = ("title", "assignee", "due_at", "tags")
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def set_deadline_listener(listener: Optional[Listener]) -> None:
+    """Send deadline events to ``listener(events)``.
+
+    The listener first receives a ``schedule`` event for every stored task
+    with a due date, read from the store's due-date index, so a reminder
+    service attached after startup catches up; afterwards it only hears
+    about changes.
+    """
+    with STORE.lock:
+        DEADLINES.attach(listener, STORE.iter_due() if listener is not None else ())
+    DEADLINES.flush()
+
+
+if os.environ.get("REMINDER_SERVICE_URL"):
+    set_deadline_listener(http_listener(os.environ["REMINDER_SERVICE_URL"]))
+
+
+def _validate(data: Dict[str, Any]) -> None:
+    if not isinstance(data, dict) or not data.get("title") or not data.get("chat_id"):
+        raise HTTPException(400, "title and chat_id are required")
+    chat_id = data["chat_id"]
+    if not isinstance(chat_id, int) or isinstance(chat_id, bool) or not -MAX_CHAT_ID - 1 <= chat_id <= MAX_CHAT_ID:
+        raise HTTPException(400, "chat_id must be a 64-bit integer")
+    if not isinstance(data.get("idempotency_key", ""), str):
+        raise HTTPException(400, "idempotency_key must be a string")
+    _validate_fields(data)
+
+
+def _validate_fields(data: Dict[str, Any]) -> None:
+    """Check the types of the editable fields present in ``data``."""
+    if not isinstance(data.get("title", ""), str):
+        raise HTTPException(400, "title must be a string")
+    if data.get("assignee") is not None and not isinstance(data["assignee"], str):
+        raise HTTPException(400, "assignee must be a string")
+    tags = data.get("tags")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        raise HTTPException(400, "tags must be a list of strings")
+    _validate_due_at(data.get("due_at"))
+
+
+def _validate_due_at(due_at: Any) -> None:
+    if due_at is None:
+        return
+    try:
+        datetime.fromisoformat(due_at)
+    except (TypeError, ValueError):
+        raise HTTPException(400, "due_at must be an ISO date") from None
+
+
+def _build_task(task_id: int, data: Dict[str, Any], created_at: int) -> TaskRecord:
+    return TaskRecord(
+        task_id,
+        data["chat_id"],
+        data["title"],
+        data.get("assignee"),
+        data.get("due_at"),
+        data.get("tags") or (),
+        created_at,
+    )
+
+
+def columns() -> TaskColumns:
+    """Return the columnar view of the store, rebuilding it if stale."""
+    global _columns, _columns_version
+    if _columns is None or _columns_version != STORE.version:
+        version = STORE.version
+        _columns = TaskColumns.from_tasks(STORE)
+        _columns_version = version
+    return _columns
 
-from fastapi import FastAPI, HTTPException
 
-app = FastAPI()
+def _json(task: TaskRecord) -> Response:
+    return Response(task.to_json(), media_type=JSON_MEDIA_TYPE)
 
-# In-memory store of tasks.
-TASKS: List[Dict[str, Any]] = []
-_task_counter = 1
+
+def _replayed(task: TaskRecord) -> Response:
+    return Response(task.to_json(), headers={"Idempotent-Replayed": "true"}, media_type=JSON_MEDIA_TYPE)
+
+
+def _json_list(tasks: List[TaskRecord]) -> Response:
+    return Response(encode_list(tasks), media_type=JSON_MEDIA_TYPE)
+
+
+def _now() -> int:
+    """Current UTC time in microseconds since the epoch."""
+    return time.time_ns() // 1000
 
 
 @app.post("/tasks")
-def create_task(data: Dict[str, Any]) -> Dict[str, Any]:
+def create_task(data: Dict[str, Any], idempotency_key: Optional[str] = Header(None)) -> Response:
     """Create a new task and return it.
 
     Parameters
     ----------
     data:
         JSON payload containing at minimum ``title`` and ``chat_id``.
+    idempotency_key:
+        ``Idempotency-Key`` header; a retry with the same key, or with the
+        same ``(chat_id, message_id)``, returns the original task.
     """
-    global _task_counter
-    title = data.get("title")
-    chat_id = data.get("chat_id")
-    if not title or not chat_id:
-        raise HTTPException(400, "title and chat_id are required")
+    _validate(data)
+    key = item_key(data, idempotency_key)
+    with STORE.lock:
+        original = IDEMPOTENCY.get(key)
+        if original is not None:
+            return _replayed(original)
+        task = _build_task(STORE.allocate_id(), data, _now())
+        STORE.add(task)
+        if WAL is not None:
+            try:
+                WAL.append(task)
+            except BaseException:
+                # Not logged, so not created: a retry must create it again.
+                STORE.remove(task.id)
+                raise
+        IDEMPOTENCY.put(key, task)
+        SEARCH.add(task.id, task.chat_id, task.title)
+        DEADLINES.created([task])
+    DEADLINES.flush()
+    return _json(task)
+
+
+@app.post("/tasks:batch")
+def create_tasks(data: Dict[str, Any], idempotency_key: Optional[str] = Header(None)) -> Response:
+    """Create every task in ``data["tasks"]`` or none of them.
 
-    task = {
-        "id": _task_counter,
-        "chat_id": chat_id,
-        "title": title,
-        "assignee": data.get("assignee"),
-        "due_at": data.get("due_at"),
-        "tags": data.get("tags", []),
-        "created_at": datetime.utcnow().isoformat(),
-    }
-    TASKS.append(task)
-    _task_counter += 1
-    return task
+    All payloads are validated before anything is stored, a contiguous block
+    of ids is allocated in one step and the batch is written to the log as a
+    single record.  Tasks are returned in request order.
+
+    Items whose idempotency key was seen before return their original task
+    and are not created again, nor are repeats of a key within the batch.
+    The ``Idempotency-Key`` header gives item ``i`` the key ``<key>/<i>``.
+    """
+    items = data.get("tasks")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(400, "tasks must be a non-empty list")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(413, f"at most {MAX_BATCH_SIZE} tasks per batch")
+    for index, item in enumerate(items):
+        try:
+            _validate(item)
+        except HTTPException as exc:
+            raise HTTPException(exc.status_code, f"tasks[{index}]: {exc.detail}") from None
+
+    keys = [
+        item_key(item, None if idempotency_key is None else f"{idempotency_key}/{index}")
+        for index, item in enumerate(items)
+    ]
+    created_at = _now()
+    with STORE.lock:
+        tasks: List[Optional[TaskRecord]] = [IDEMPOTENCY.get(key) for key in keys]
+        # Request positions of each task to create, by key (or position).
+        pending: Dict[Union[Hashable, int], List[int]] = {}
+        for index, (key, task) in enumerate(zip(keys, tasks)):
+            if task is None:
+                pending.setdefault(index if key is None else key, []).append(index)
+        created: List[TaskRecord] = []
+        if pending:
+            for task_id, indexes in zip(STORE.allocate_ids(len(pending)), pending.values()):
+                task = _build_task(task_id, items[indexes[0]], created_at)
+                created.append(task)
+                for index in indexes:
+                    tasks[index] = task
+            for task in created:
+                STORE.add(task)
+            if WAL is not None:
+                try:
+                    WAL.append_batch(created)
+                except BaseException:
+                    for task in created:
+                        STORE.remove(task.id)
+                    raise
+            for task, indexes in zip(created, pending.values()):
+                IDEMPOTENCY.put(keys[indexes[0]], task)
+            for task in created:
+                SEARCH.add(task.id, task.chat_id, task.title)
+            DEADLINES.created(created)
+    DEADLINES.flush()
+    return _json_list(tasks)
 
 
 @app.get("/tasks")
-def list_tasks() -> List[Dict[str, Any]]:
-    """Return all stored tasks."""
-    return TASKS
+def list_tasks(
+    chat_id: Optional[int] = None,
+    assignee: Optional[str] = None,
+    tag: Optional[str] = None,
+    due_at: Optional[str] = None,
+    due_before: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Response:
+    """Return stored tasks matching the optional query filters.
+
+    Filters are resolved through the store's secondary indexes, so the cost
+    of a filtered request depends on the number of matching tasks rather
+    than on the total number of tasks.
+
+    Pagination is keyset based: pass the ``id`` of the last task received as
+    ``after_id`` to fetch the next page.  A page shorter than ``limit``
+    marks the end of the result set.
+    """
+    if limit is not None and limit < 1:
+        raise HTTPException(422, "limit must be positive")
+    tasks = STORE.query(
+        chat_id=chat_id,
+        assignee=assignee,
+        tag=tag,
+        due_at=due_at,
+        due_before=due_before,
+        after_id=after_id,
+        limit=limit,
+    )
+    return _json_list(tasks)
+
+
+@app.get("/tasks:stats")
+def task_stats(
+    group_by: Optional[str] = None,
+    chat_id: Optional[int] = None,
+    assignee: Optional[str] = None,
+    tag: Optional[str] = None,
+    due_before: Optional[str] = None,
+    overdue: bool = False,
+) -> Dict[str, Any]:
+    """Count the tasks matching the filters.
+
+    Returns ``{"total": n}``, plus ``"groups"`` mapping each ``chat_id``,
+    ``assignee`` or ``tag`` to its count when ``group_by`` names one of
+    them.  ``overdue=true`` only counts tasks due before now, so
+    ``group_by=chat_id&overdue=true`` reports overdue tasks per chat.  The
+    counts are computed on the columnar view, not by walking the tasks.
+    """
+    if group_by not in (None, "chat_id", "assignee", "tag"):
+        raise HTTPException(422, "group_by must be chat_id, assignee or tag")
+    _validate_due_at(due_before)
+    if overdue:
+        now = datetime.utcnow().isoformat()
+        due_before = min(due_before, now) if due_before else now
+    view = columns()
+    mask = view.select(chat_id=chat_id, assignee=assignee, tag=tag, due_before=due_before)
+    stats: Dict[str, Any] = {"total": view.count(mask)}
+    if group_by is not None:
+        stats["groups"] = view.count_by(group_by, mask)
+    return stats
+
+
+@app.get("/tasks:export")
+def export_tasks() -> Response:
+    """Return every task in the binary format of :meth:`TaskColumns.dump`."""
+    return Response(columns().to_bytes(), media_type="application/octet-stream")
+
+
+@app.get("/tasks/search")
+def search_tasks(q: str = "", chat_id: Optional[int] = None, limit: int = DEFAULT_LIMIT) -> Response:
+    """Return the tasks of ``chat_id`` whose title matches every word of ``q``.
+
+    A word ending in ``*`` matches by prefix (``q=rep*`` finds "report").
+    Results are ranked by relevance, best first.
+    """
+    if chat_id is None:
+        raise HTTPException(422, "chat_id is required")
+    if limit < 1:
+        raise HTTPException(422, "limit must be positive")
+    with STORE.lock:
+        tasks = [STORE.get(task_id) for task_id in SEARCH.search(chat_id, q, min(limit, MAX_BATCH_SIZE))]
+    return _json_list(tasks)
+
+
+@app.get("/tasks/{task_id}")
+def get_task(task_id: int) -> Response:
+    """Return the task identified by ``task_id``."""
+    task = STORE.get(task_id)
+    if task is None:
+        raise HTTPException(404, "task not found")
+    return _json(task)
+
+
+@app.patch("/tasks/{task_id}")
+def update_task(data: Dict[str, Any], task_id: int) -> Response:
+    """Apply the changes in ``data`` to a task and return the new version.
+
+    Only :data:`EDITABLE_FIELDS` may be changed; ``null`` clears
+    ``assignee`` or ``due_at``.  Changing or clearing ``due_at``
+    reschedules or cancels the task's reminder.
+    """
+    if not isinstance(data, dict):
+        raise HTTPException(400, "changes must be an object")
+    unknown = sorted(set(data) - set(EDITABLE_FIELDS))
+    if unknown:
+        raise HTTPException(400, f"fields cannot be changed: {', '.join(unknown)}")
+    if "title" in data and not data["title"]:
+        raise HTTPException(400, "title must not be empty")
+    _validate_fields(data)
+    with STORE.lock:
+        task = STORE.get(task_id)
+        if task is None:
+            raise HTTPException(404, "task not found")
+        updated = TaskRecord.from_dict(dict(task.to_dict(), **data))
+        old = STORE.replace(updated)
+        if WAL is not None:
+            try:
+                WAL.append_update(updated)
+            except BaseException:
+                # Not logged, so not applied: keep the store in step with the log.
+                STORE.replace(old)
+                raise
+        if updated.title != old.title:
+            SEARCH.add(updated.id, updated.chat_id, updated.title)
+        DEADLINES.updated(old, updated)
+    DEADLINES.flush()
+    return _json(updated)
+
+
+@app.delete("/tasks/{task_id}")
+def delete_task(task_id: int) -> Response:
+    """Delete a task, cancelling its reminder, and return it."""
+    with STORE.lock:
+        task = STORE.remove(task_id)
+        if task is None:
+            raise HTTPException(404, "task not found")
+        if WAL is not None:
+            try:
+                WAL.append_delete(task_id)
+            except BaseException:
+                STORE.add(task)
+                raise
+        SEARCH.remove(task_id)
+        DEADLINES.deleted(task)
+    DEADLINES.flush()
+    return _json(task)
 
 
 if __name__ == "__main__":
     # Allow running ``python main.py`` for manual exploration.
-    import json
-    print(json.dumps(list_tasks(), indent=2))
+    print(list_tasks().content.decode())
@@ -0,0 +1,139 @@
+"""Compact in-memory representation of a task.
+
+A task dictionary costs several hundred bytes: the dict itself, a fresh
+``tags`` list and a 26 character ``created_at`` string per task.
+:class:`TaskRecord` stores the same fields in ``__slots__``, keeps ``tags``
+as a tuple (the empty tuple is shared), interns the strings that repeat
+across tasks (assignees, tags and due dates) and holds ``created_at`` as an
+integer number of microseconds since the Unix epoch.
+
+Records support read-only mapping access (``record["chat_id"]``,
+``record.get("assignee")``) so the store and the deadline feed work with
+them unchanged; :meth:`TaskRecord.to_dict` produces the JSON shape served
+by the API, and :meth:`TaskRecord.from_dict` reverses it exactly.
+
+Records never change once built (an update stores a new one), so each keeps
+its JSON encoding once it has been produced.  :meth:`TaskRecord.to_json`
+encodes a task at most once, when it is created or first read after a
+restart, and :func:`encode_list` assembles a list response by joining the
+cached fragments into one buffer instead of encoding every task again.
+The encoding roughly doubles the memory of a record that has been served.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+FIELDS = ("id", "chat_id", "title", "assignee", "due_at", "tags", "created_at")
+
+
+def _intern(value: Any) -> Any:
+    # Only strings can be interned; anything else is kept as given.
+    return sys.intern(value) if isinstance(value, str) and value else value
+
+
+def to_epoch_us(timestamp: Optional[str]) -> Optional[int]:
+    """Convert a naive UTC ISO timestamp to microseconds since the epoch."""
+    if timestamp is None:
+        return None
+    return (datetime.fromisoformat(timestamp) - _EPOCH) // _MICROSECOND
+
+
+def from_epoch_us(value: Optional[int]) -> Optional[str]:
+    """Inverse of :func:`to_epoch_us`."""
+    if value is None:
+        return None
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+class TaskRecord:
+    """One task with the fields of the API's task object."""
+
+    __slots__ = FIELDS + ("_json",)
+
+    def __init__(
+        self,
+        id: int,
+        chat_id: Any,
+        title: str,
+        assignee: Optional[str] = None,
+        due_at: Optional[str] = None,
+        tags: Iterable[str] = (),
+        created_at: Optional[int] = None,
+    ) -> None:
+        self.id = id
+        self.chat_id = chat_id
+        self.title = title
+        self.assignee = _intern(assignee)
+        self.due_at = _intern(due_at)
+        self.tags: Tuple[str, ...] = tuple(_intern(tag) for tag in tags) if tags else ()
+        self.created_at = created_at
+        self._json: Optional[bytes] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TaskRecord":
+        """Build a record from the API's JSON shape."""
+        return cls(
+            data["id"],
+            data["chat_id"],
+            data["title"],
+            data.get("assignee"),
+            data.get("due_at"),
+            data.get("tags") or (),
+            to_epoch_us(data.get("created_at")),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the task in the API's JSON shape."""
+        return {
+            "id": self.id,
+            "chat_id": self.chat_id,
+            "title": self.title,
+            "assignee": self.assignee,
+            "due_at": self.due_at,
+            "tags": list(self.tags),
+            "created_at": from_epoch_us(self.created_at),
+        }
+
+    def to_json(self) -> bytes:
+        """Return :meth:`to_dict` encoded as compact UTF-8 JSON, cached."""
+        encoded = self._json
+        if encoded is None:
+            encoded = self._json = json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":")).encode()
+        return encoded
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Mapping-style access mirroring :meth:`dict.get`."""
+        return getattr(self, key) if key in FIELDS else default
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TaskRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"TaskRecord({self.to_dict()!r})"
+
+
+def encode_list(records: Iterable[TaskRecord]) -> bytes:
+    """Encode ``records`` as a JSON array from their cached encodings."""
+    parts = [record.to_json() for record in records]
+    if not parts:
+        return b"[]"
+    # Bracket the end fragments so the array is built in a single copy.
+    parts[0] = b"[" + parts[0]
+    parts[-1] = parts[-1] + b"]"
+    return b",".join(parts)
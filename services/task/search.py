@@ -0,0 +1,206 @@
+"""Inverted full-text index over task text, partitioned by chat.
+
+Searches are always scoped to one chat, so the index keeps a separate
+vocabulary and posting lists per chat: a query only touches the postings of
+that chat, however many tasks other chats hold.  Posting lists are sorted
+task ids, which keeps membership checks to a binary search, and each chat's
+vocabulary is kept sorted so a prefix term (``rep*``) expands to a
+contiguous slice of it.
+
+A query is a conjunction: every term must match.  Candidates come from the
+term with the fewest postings and are checked against the other terms, so
+cost follows the rarest term rather than the most common one.  To keep
+latency flat in very large chats the postings of that term are checked in
+windows of ``max_candidates``, newest first, and the scan stops once the
+windows seen so far hold ``limit`` matches: a query whose rarest word
+occurs in many tasks ranks the most recent matches, while one whose words
+seldom occur together keeps scanning older windows until it has found
+enough (or every) match.  Matches are ranked by the
+summed inverse document frequency of the matched terms (prefix matches count
+a little less than exact ones) divided by the square root of the document
+length, newest task first on ties.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from itertools import repeat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r"(\w+)(\*?)")
+
+# Weight of a term reached through prefix expansion relative to an exact hit.
+PREFIX_WEIGHT = 0.8
+# Upper bound on the vocabulary terms a single prefix expands to.
+MAX_EXPANSIONS = 128
+DEFAULT_LIMIT = 20
+# Postings of the rarest query term checked per window, newest first.
+DEFAULT_MAX_CANDIDATES = 1_000
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split ``text`` into lower-case word tokens."""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+class _Chat:
+    __slots__ = ("postings", "vocab", "docs")
+
+    def __init__(self) -> None:
+        self.postings: Dict[str, List[int]] = {}
+        self.vocab: List[str] = []
+        self.docs = 0
+
+
+class SearchIndex:
+    """Per-chat inverted index mapping words to task ids."""
+
+    def __init__(self, max_candidates: int = DEFAULT_MAX_CANDIDATES) -> None:
+        self.max_candidates = max_candidates
+        self._chats: Dict[Any, _Chat] = {}
+        # task id -> (chat id, distinct terms)
+        self._docs: Dict[int, Tuple[Any, Tuple[str, ...]]] = {}
+        # task id -> length normalisation factor, 1 / sqrt(token count)
+        self._norms: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, task_id: int, chat_id: Any, *texts: Optional[str]) -> None:
+        """Index the words of ``texts`` for ``task_id``, replacing old ones."""
+        if task_id in self._docs:
+            self.remove(task_id)
+        tokens = [token for text in texts for token in tokenize(text)]
+        terms = tuple(dict.fromkeys(tokens))
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+        for term in terms:
+            postings = chat.postings.get(term)
+            if postings is None:
+                postings = chat.postings[term] = []
+                insort(chat.vocab, term)
+            if not postings or task_id > postings[-1]:
+                postings.append(task_id)
+            else:
+                insort(postings, task_id)
+        chat.docs += 1
+        self._docs[task_id] = (chat_id, terms)
+        self._norms[task_id] = 1.0 / math.sqrt(len(tokens) or 1)
+
+    def remove(self, task_id: int) -> None:
+        """Drop ``task_id`` from the index if present."""
+        entry = self._docs.pop(task_id, None)
+        if entry is None:
+            return
+        del self._norms[task_id]
+        chat_id, terms = entry
+        chat = self._chats[chat_id]
+        for term in terms:
+            postings = chat.postings[term]
+            del postings[bisect_left(postings, task_id)]
+            if not postings:
+                del chat.postings[term]
+                del chat.vocab[bisect_left(chat.vocab, term)]
+        chat.docs -= 1
+        if not chat.docs:
+            del self._chats[chat_id]
+
+    def search(self, chat_id: Any, query: str, limit: int = DEFAULT_LIMIT) -> List[int]:
+        """Return ids of the best ``limit`` tasks of ``chat_id`` matching ``query``.
+
+        Every word of ``query`` must occur in the task; a word ending in
+        ``*`` matches any word starting with it.
+        """
+        chat = self._chats.get(chat_id)
+        words = QUERY_RE.findall(query.lower())
+        if chat is None or not words:
+            return []
+        clauses = []
+        for word, star in words:
+            clause = self._expand(chat, word, bool(star))
+            if not clause:
+                return []
+            clauses.append(clause)
+        clauses.sort(key=lambda clause: sum(len(postings) for postings, _ in clause))
+
+        if len(clauses) == 1 and len(clauses[0]) == 1:
+            # One exact term: every match has the same weight, so only the
+            # length of the title decides; ties go to the newest task.
+            postings = clauses[0][0][0]
+            return heapq.nlargest(limit, reversed(postings[-self.max_candidates:]), key=self._norms.__getitem__)
+        matches: Dict[int, float] = {}
+        for scores in self._candidates(clauses[0]):
+            for clause in clauses[1:]:
+                narrowed: Dict[int, float] = {}
+                for task_id, score in scores.items():
+                    best = 0.0
+                    for postings, weight in clause:
+                        if weight > best and _contains(postings, task_id):
+                            best = weight
+                    if best:
+                        narrowed[task_id] = score + best
+                scores = narrowed
+                if not scores:
+                    break
+            matches.update(scores)
+            if len(matches) >= limit:
+                break
+        norms = self._norms
+        return heapq.nlargest(limit, matches, key=lambda task_id: (matches[task_id] * norms[task_id], task_id))
+
+    def _candidates(self, clause: List[Tuple[List[int], float]]) -> Iterator[Dict[int, float]]:
+        """Score the tasks matching ``clause``, ``max_candidates`` at a time, newest first."""
+        limit = self.max_candidates
+        # Lowest weight first, so a task matching several expanded terms
+        # keeps its best weight.
+        clause = sorted(clause, key=lambda item: item[1])
+        # Postings before these positions have not been scored yet.
+        ends = [len(postings) for postings, _ in clause]
+        while True:
+            scores: Dict[int, float] = {}
+            for (postings, weight), end in zip(clause, ends):
+                scores.update(zip(postings[max(end - limit, 0):end], repeat(weight)))
+            if not scores:
+                return
+            if len(scores) > limit:
+                scores = {task_id: scores[task_id] for task_id in heapq.nlargest(limit, scores)}
+            # Every unscored posting at or above the oldest kept id was in
+            # this window, so the next one starts below it.
+            oldest = min(scores)
+            ends = [bisect_left(postings, oldest, 0, end) for (postings, _), end in zip(clause, ends)]
+            yield scores
+
+    def _expand(self, chat: _Chat, word: str, prefix: bool) -> List[Tuple[List[int], float]]:
+        """Posting lists and weights of the terms matching one query word."""
+        if not prefix:
+            postings = chat.postings.get(word)
+            return [(postings, self._idf(chat, postings))] if postings else []
+        clause = []
+        start = bisect_left(chat.vocab, word)
+        for term in _take_prefixed(chat.vocab, start, word):
+            postings = chat.postings[term]
+            weight = self._idf(chat, postings) * (1.0 if term == word else PREFIX_WEIGHT)
+            clause.append((postings, weight))
+        return clause
+
+    @staticmethod
+    def _idf(chat: _Chat, postings: List[int]) -> float:
+        return math.log(1.0 + chat.docs / len(postings))
+
+
+def _take_prefixed(vocab: List[str], start: int, prefix: str) -> Iterable[str]:
+    for index in range(start, min(start + MAX_EXPANSIONS, len(vocab))):
+        term = vocab[index]
+        if not term.startswith(prefix):
+            return
+        yield term
+
+
+def _contains(postings: List[int], task_id: int) -> bool:
+    index = bisect_left(postings, task_id)
+    return index < len(postings) and postings[index] == task_id
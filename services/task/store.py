@@ -0,0 +1,268 @@
+"""Indexed in-memory task store used by the task service.
+
+Tasks are kept in a primary-key dictionary and mirrored into secondary
+indexes on ``chat_id``, ``assignee``, ``tags`` and ``due_at``.  Every index
+bucket is a list of task ids in insertion order, and because ids are
+allocated monotonically those lists are also sorted.  Filtered queries start
+from the smallest matching bucket so their cost grows with the size of the
+result rather than with the number of stored tasks.  The same ordering makes
+keyset pagination cheap: a page after a given id starts with a binary search
+into the chosen bucket.
+
+The store is safe to share between threads.  Ids come from a thread-safe
+:class:`~ids.IdAllocator`, and every read and write runs under one
+re-entrant :attr:`TaskStore.lock`.  Callers that must keep several steps
+together, such as allocating an id, storing the task and logging it, hold
+the lock around all of them, so tasks enter the store in id order and one
+write is never observed half applied.  A single lock rather than stripes is
+deliberate: the secondary indexes span chats, so any write may touch any
+bucket, and the work done under the lock is pure Python that the
+interpreter lock would serialise anyway.
+"""
+
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+from ids import IdAllocator
+
+
+class TaskStore:
+    """Primary-key store with secondary indexes for tasks.
+
+    Tasks are task dictionaries or any object offering the same read-only
+    mapping access, such as :class:`~record.TaskRecord`.
+    """
+
+    def __init__(self, ids: Optional[IdAllocator] = None) -> None:
+        self._tasks: Dict[int, Dict[str, Any]] = {}
+        self._ids: List[int] = []
+        self._by_chat: Dict[Any, List[int]] = defaultdict(list)
+        self._by_assignee: Dict[str, List[int]] = defaultdict(list)
+        self._by_tag: Dict[str, List[int]] = defaultdict(list)
+        self._by_due: Dict[str, List[int]] = defaultdict(list)
+        # Distinct due dates kept sorted for range lookups.
+        self._due_keys: List[str] = []
+        self.ids = ids or IdAllocator()
+        # Guards every read and write; re-entrant so callers can hold it
+        # around several store calls.
+        self.lock = threading.RLock()
+        # Incremented by every write; lets callers cache derived views.
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Iterate over a copy, in id order, so concurrent writes cannot break
+        # the loop and a task put back after a failed delete keeps its place.
+        with self.lock:
+            tasks = self._tasks
+            return iter([tasks[task_id] for task_id in self._ids])
+
+    @property
+    def next_id(self) -> int:
+        """Identifier that :meth:`allocate_id` will hand out next."""
+        return self.ids.next_id
+
+    def advance_ids(self, next_id: int) -> None:
+        """Ensure no identifier below ``next_id`` is allocated again."""
+        self.ids.advance(next_id)
+
+    def allocate_id(self) -> int:
+        """Reserve and return the next task identifier."""
+        return self.ids.allocate()[0]
+
+    def allocate_ids(self, count: int) -> range:
+        """Reserve ``count`` consecutive identifiers in one step."""
+        return self.ids.allocate(count)
+
+    def add(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Store ``task`` and update every secondary index."""
+        with self.lock:
+            return self._add(task)
+
+    def _add(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        task_id = task["id"]
+        self.version += 1
+        # Ids normally arrive in increasing order and are appended; an older
+        # id (e.g. replayed during recovery) is inserted in place instead.
+        place = list.append if not self._ids or task_id > self._ids[-1] else insort
+        self._tasks[task_id] = task
+        place(self._ids, task_id)
+        place(self._by_chat[task["chat_id"]], task_id)
+        if task.get("assignee"):
+            place(self._by_assignee[task["assignee"]], task_id)
+        for tag in dict.fromkeys(task.get("tags") or ()):
+            place(self._by_tag[tag], task_id)
+        due_at = task.get("due_at")
+        if due_at:
+            if due_at not in self._by_due:
+                insort(self._due_keys, due_at)
+            place(self._by_due[due_at], task_id)
+        if task_id >= self.ids.next_id:
+            self.ids.advance(task_id + 1)
+        return task
+
+    def replace(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Swap the stored task with the same id for ``task``.
+
+        Only the index buckets whose key changed are touched.  Returns the
+        previous version of the task.
+        """
+        with self.lock:
+            return self._replace(task)
+
+    def _replace(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        task_id = task["id"]
+        old = self._tasks[task_id]
+        self._tasks[task_id] = task
+        self.version += 1
+        if old["chat_id"] != task["chat_id"]:
+            _discard(self._by_chat, old["chat_id"], task_id)
+            insort(self._by_chat[task["chat_id"]], task_id)
+        if old.get("assignee") != task.get("assignee"):
+            if old.get("assignee"):
+                _discard(self._by_assignee, old["assignee"], task_id)
+            if task.get("assignee"):
+                insort(self._by_assignee[task["assignee"]], task_id)
+        old_tags = set(old.get("tags") or ())
+        new_tags = set(task.get("tags") or ())
+        for tag in old_tags - new_tags:
+            _discard(self._by_tag, tag, task_id)
+        for tag in new_tags - old_tags:
+            insort(self._by_tag[tag], task_id)
+        if old.get("due_at") != task.get("due_at"):
+            self._unindex_due(old.get("due_at"), task_id)
+            self._index_due(task.get("due_at"), task_id)
+        return old
+
+    def remove(self, task_id: int) -> Optional[Dict[str, Any]]:
+        """Delete the task stored under ``task_id`` and return it."""
+        with self.lock:
+            return self._remove(task_id)
+
+    def _remove(self, task_id: int) -> Optional[Dict[str, Any]]:
+        task = self._tasks.pop(task_id, None)
+        if task is None:
+            return None
+        self.version += 1
+        del self._ids[bisect_left(self._ids, task_id)]
+        _discard(self._by_chat, task["chat_id"], task_id)
+        if task.get("assignee"):
+            _discard(self._by_assignee, task["assignee"], task_id)
+        for tag in set(task.get("tags") or ()):
+            _discard(self._by_tag, tag, task_id)
+        self._unindex_due(task.get("due_at"), task_id)
+        return task
+
+    def _index_due(self, due_at: Optional[str], task_id: int) -> None:
+        if due_at:
+            if due_at not in self._by_due:
+                insort(self._due_keys, due_at)
+            insort(self._by_due[due_at], task_id)
+
+    def _unindex_due(self, due_at: Optional[str], task_id: int) -> None:
+        if due_at and _discard(self._by_due, due_at, task_id):
+            del self._due_keys[bisect_left(self._due_keys, due_at)]
+
+    def iter_due(self) -> Iterator[Dict[str, Any]]:
+        """Yield tasks that have a due date, earliest due date first."""
+        with self.lock:
+            due = [self._tasks[task_id] for key in self._due_keys for task_id in self._by_due[key]]
+        return iter(due)
+
+    def get(self, task_id: int) -> Optional[Dict[str, Any]]:
+        """Return the task stored under ``task_id`` or ``None``."""
+        return self._tasks.get(task_id)
+
+    def query(
+        self,
+        chat_id: Any = None,
+        assignee: Optional[str] = None,
+        tag: Optional[str] = None,
+        due_at: Optional[str] = None,
+        due_before: Optional[str] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return tasks matching every supplied filter, ordered by id.
+
+        ``due_before`` is an inclusive upper bound on ``due_at``; tasks
+        without a due date never match it.  ``after_id`` and ``limit``
+        implement keyset pagination: only tasks with an id greater than
+        ``after_id`` are considered and at most ``limit`` are returned.
+        """
+        with self.lock:
+            return self._query(chat_id, assignee, tag, due_at, due_before, after_id, limit)
+
+    def _query(
+        self,
+        chat_id: Any,
+        assignee: Optional[str],
+        tag: Optional[str],
+        due_at: Optional[str],
+        due_before: Optional[str],
+        after_id: Optional[int],
+        limit: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        candidates: List[List[int]] = []
+        if chat_id is not None:
+            candidates.append(self._by_chat.get(chat_id, []))
+        if assignee is not None:
+            candidates.append(self._by_assignee.get(assignee, []))
+        if tag is not None:
+            candidates.append(self._by_tag.get(tag, []))
+        if due_at is not None:
+            candidates.append(self._by_due.get(due_at, []))
+        if not candidates:
+            # Merging the due-date buckets costs as much as the tasks due
+            # before the bound, so it is only worth it without a smaller
+            # bucket; otherwise the scan below filters on ``due_at``.
+            candidates.append(self._ids if due_before is None else self._ids_due_before(due_before))
+
+        smallest = min(candidates, key=len)
+        start = bisect_right(smallest, after_id) if after_id is not None else 0
+        result: List[Dict[str, Any]] = []
+        for index in range(start, len(smallest)):
+            if limit is not None and len(result) >= limit:
+                break
+            task_id = smallest[index]
+            task = self._tasks[task_id]
+            if chat_id is not None and task["chat_id"] != chat_id:
+                continue
+            if assignee is not None and task.get("assignee") != assignee:
+                continue
+            if tag is not None and tag not in (task.get("tags") or ()):
+                continue
+            if due_at is not None and task.get("due_at") != due_at:
+                continue
+            if due_before is not None and not (task.get("due_at") and task["due_at"] <= due_before):
+                continue
+            result.append(task)
+        return result
+
+    def _ids_due_before(self, bound: str) -> List[int]:
+        """Return ids of tasks due on or before ``bound`` in id order."""
+        end = bisect_right(self._due_keys, bound)
+        ids: List[int] = []
+        for key in self._due_keys[:end]:
+            ids.extend(self._by_due[key])
+        ids.sort()
+        return ids
+
+
+def _discard(index: Dict[Any, List[int]], key: Any, task_id: int) -> bool:
+    """Remove ``task_id`` from ``index[key]``; drop the bucket when empty.
+
+    Returns ``True`` if the bucket was dropped.
+    """
+    bucket = index[key]
+    del bucket[bisect_left(bucket, task_id)]
+    if not bucket:
+        del index[key]
+        return True
+    return False
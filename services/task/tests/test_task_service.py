@@ -25,3 +25,636 @@ def test_create_and_list_tasks():
     list_resp = client.get("/tasks")
     assert list_resp.status_code == 200
     assert list_resp.json() == [task]
+
+
+def test_list_tasks_filters_use_indexes():
+    created = [
+        client.post("/tasks", json={"chat_id": 7, "title": "a", "assignee": "ann", "tags": ["x"], "due_at": "2024-03-01"}).json(),
+        client.post("/tasks", json={"chat_id": 7, "title": "b", "tags": ["y"], "due_at": "2024-05-01"}).json(),
+        client.post("/tasks", json={"chat_id": 8, "title": "c", "assignee": "ann", "tags": ["x", "y"]}).json(),
+    ]
+    assert client.get("/tasks?chat_id=7").json() == created[:2]
+    assert client.get("/tasks?chat_id=7&tag=x").json() == [created[0]]
+    assert client.get("/tasks?assignee=ann").json() == [created[0], created[2]]
+    assert client.get("/tasks?tag=y").json() == created[1:]
+    assert client.get("/tasks?due_at=2024-05-01").json() == [created[1]]
+    assert client.get("/tasks?due_before=2024-04-01").json() == [created[0]]
+    assert client.get("/tasks?chat_id=999").json() == []
+    assert client.get("/tasks?chat_id=abc").status_code == 422
+
+
+def test_due_before_with_a_narrower_filter_scans_only_that_bucket(monkeypatch):
+    from store import TaskStore
+
+    store = TaskStore()
+    for task_id in range(1, 101):
+        store.add({"id": task_id, "chat_id": 1 if task_id % 50 else 2, "title": "t", "due_at": f"2024-01-{task_id % 28 + 1:02d}"})
+    assert [task["id"] for task in store.query(due_before="2024-01-02")] == [1, 28, 29, 56, 57, 84, 85]
+
+    def merge_everything(bound):
+        raise AssertionError("merged every due-date bucket")
+
+    monkeypatch.setattr(store, "_ids_due_before", merge_everything)
+    assert [task["id"] for task in store.query(chat_id=2, due_before="2024-01-20")] == [100]
+    assert store.query(chat_id=2, due_before="2024-01-01") == []
+
+
+def test_list_tasks_keyset_pagination():
+    created = [client.post("/tasks", json={"chat_id": 9, "title": f"t{i}"}).json() for i in range(5)]
+    first = client.get("/tasks?chat_id=9&limit=2").json()
+    assert first == created[:2]
+    second = client.get(f"/tasks?chat_id=9&limit=2&after_id={first[-1]['id']}").json()
+    assert second == created[2:4]
+    last = client.get(f"/tasks?chat_id=9&limit=2&after_id={second[-1]['id']}").json()
+    assert last == created[4:]
+    assert client.get("/tasks?limit=0").status_code == 422
+
+
+def test_write_ahead_log_recovers_snapshot_and_tail(tmp_path):
+    from store import TaskStore
+    from wal import WriteAheadLog
+
+    store = TaskStore()
+    wal = WriteAheadLog(str(tmp_path), store, sync_every=2, snapshot_every=3)
+    wal.recover()
+    tasks = []
+    for i in range(5):
+        task = {"id": store.allocate_id(), "chat_id": 1, "title": f"t{i}", "tags": []}
+        store.add(task)
+        wal.append(task)
+        tasks.append(task)
+    wal.close()
+    # Simulate a crash in the middle of the next append.
+    with open(tmp_path / "tasks.log", "a", encoding="utf-8") as fh:
+        fh.write('{"op": "create", "task": {"id": 6')
+
+    recovered = TaskStore()
+    wal = WriteAheadLog(str(tmp_path), recovered)
+    assert wal.recover() == 2
+    assert list(recovered) == tasks
+    task = {"id": recovered.allocate_id(), "chat_id": 1, "title": "after crash", "tags": []}
+    assert task["id"] == 6
+    recovered.add(task)
+    wal.append(task)
+    wal.close()
+
+    again = TaskStore()
+    WriteAheadLog(str(tmp_path), again).recover()
+    assert list(again) == tasks + [task]
+
+
+def test_write_ahead_log_syncs_on_a_timer_and_snapshots_in_the_background(tmp_path, monkeypatch):
+    import os
+    import threading
+    import time
+
+    from store import TaskStore
+    from wal import WriteAheadLog
+
+    store = TaskStore()
+    wal = WriteAheadLog(str(tmp_path), store, sync_every=1000, sync_interval=0.01, snapshot_every=0)
+    wal.recover()
+    task = {"id": store.allocate_id(), "chat_id": 1, "title": "acknowledged", "tags": []}
+    store.add(task)
+    wal.append(task)
+    # No further write arrives: the flusher thread still syncs the event.
+    deadline = time.monotonic() + 2
+    while os.path.getsize(tmp_path / "tasks.log") == 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert os.path.getsize(tmp_path / "tasks.log") > 0
+
+    # The snapshot is serialised off the write path, from a rotated segment.
+    started, release = [], threading.Event()
+    write_snapshot = wal._write_snapshot
+
+    def slow_snapshot(next_id, tasks):
+        started.append(len(tasks))
+        release.wait(2)
+        write_snapshot(next_id, tasks)
+
+    monkeypatch.setattr(wal, "_write_snapshot", slow_snapshot)
+    wal.snapshot_every = 2
+    tasks = [task]
+    for title in ("rotated", "after rotation"):
+        task = {"id": store.allocate_id(), "chat_id": 1, "title": title, "tags": []}
+        store.add(task)
+        wal.append(task)
+        tasks.append(task)
+    assert started == [2]
+    assert (tmp_path / "tasks.log.1").exists()
+
+    # A crash now leaves the old segment next to the new log.
+    wal.sync()
+    recovered = TaskStore()
+    assert WriteAheadLog(str(tmp_path), recovered).recover() == 3
+    assert list(recovered) == tasks
+    assert not (tmp_path / "tasks.log.1").exists()
+
+    release.set()
+    wal.close()
+
+
+def test_get_task_by_id():
+    task = client.post("/tasks", json={"chat_id": 3, "title": "single"}).json()
+    resp = client.get(f"/tasks/{task['id']}")
+    assert resp.status_code == 200
+    assert resp.json() == task
+    assert client.get("/tasks/999999").status_code == 404
+    assert client.get("/tasks/abc").status_code == 422
+
+
+def test_batch_create_is_atomic_and_allocates_a_block():
+    before = len(client.get("/tasks?chat_id=21").json())
+    bad = client.post("/tasks:batch", json={"tasks": [{"chat_id": 21, "title": "ok"}, {"chat_id": 21}]})
+    assert bad.status_code == 400
+    assert bad.json()["detail"].startswith("tasks[1]")
+    assert len(client.get("/tasks?chat_id=21").json()) == before
+
+    resp = client.post("/tasks:batch", json={"tasks": [{"chat_id": 21, "title": f"b{i}", "tags": ["imp"]} for i in range(3)]})
+    assert resp.status_code == 200
+    tasks = resp.json()
+    assert [task["title"] for task in tasks] == ["b0", "b1", "b2"]
+    assert [task["id"] for task in tasks] == list(range(tasks[0]["id"], tasks[0]["id"] + 3))
+    assert client.get("/tasks?chat_id=21&tag=imp").json() == tasks
+    assert client.post("/tasks:batch", json={"tasks": []}).status_code == 400
+
+
+def test_write_ahead_log_replays_batches(tmp_path):
+    from store import TaskStore
+    from wal import WriteAheadLog
+
+    store = TaskStore()
+    wal = WriteAheadLog(str(tmp_path), store)
+    wal.recover()
+    tasks = [{"id": task_id, "chat_id": 1, "title": "t", "tags": []} for task_id in store.allocate_ids(3)]
+    for task in tasks:
+        store.add(task)
+    wal.append_batch(tasks)
+    wal.close()
+
+    recovered = TaskStore()
+    assert WriteAheadLog(str(tmp_path), recovered).recover() == 1
+    assert list(recovered) == tasks
+
+
+def test_update_and_delete_keep_indexes_consistent():
+    task = client.post("/tasks", json={"chat_id": 40, "title": "move", "assignee": "ann", "tags": ["a", "b"]}).json()
+    resp = client.patch(f"/tasks/{task['id']}", json={"assignee": "bob", "tags": ["b", "c"], "due_at": "2031-01-02"})
+    assert resp.status_code == 200
+    updated = resp.json()
+    assert client.get("/tasks?assignee=ann&chat_id=40").json() == []
+    assert client.get("/tasks?assignee=bob&chat_id=40").json() == [updated]
+    assert client.get("/tasks?tag=a&chat_id=40").json() == []
+    assert client.get("/tasks?tag=c&chat_id=40").json() == [updated]
+    assert client.get("/tasks?due_at=2031-01-02").json() == [updated]
+    assert client.patch(f"/tasks/{task['id']}", json={"chat_id": 1}).status_code == 400
+    assert client.patch(f"/tasks/{task['id']}", json={"due_at": "soon"}).status_code == 400
+    assert client.patch("/tasks/999999", json={"title": "x"}).status_code == 404
+
+    assert client.delete(f"/tasks/{task['id']}").json() == updated
+    assert client.get(f"/tasks/{task['id']}").status_code == 404
+    assert client.get("/tasks?chat_id=40").json() == []
+    assert client.get("/tasks?due_at=2031-01-02").json() == []
+    assert client.delete(f"/tasks/{task['id']}").status_code == 404
+
+
+def test_deadline_events_follow_task_changes():
+    events = []
+    task_main.set_deadline_listener(events.extend)
+    try:
+        replayed = [event["task_id"] for event in events]
+        assert replayed == [task["id"] for task in task_main.STORE.iter_due()]
+        events.clear()
+
+        task = client.post("/tasks", json={"chat_id": 41, "title": "report", "due_at": "2030-05-01"}).json()
+        client.post("/tasks", json={"chat_id": 41, "title": "no deadline"})
+        assert events == [{
+            "op": "schedule",
+            "task_id": task["id"],
+            "chat_id": 41,
+            "target": "",
+            "fire_at": "2030-05-01T00:00:00",
+            "text": f"Task {task['id']} is due: report",
+        }]
+        client.patch(f"/tasks/{task['id']}", json={"tags": ["x"]})
+        assert len(events) == 1
+        client.patch(f"/tasks/{task['id']}", json={"due_at": "2030-06-01"})
+        assert events[-1]["op"] == "schedule" and events[-1]["fire_at"] == "2030-06-01T00:00:00"
+        client.patch(f"/tasks/{task['id']}", json={"due_at": None})
+        assert events[-1] == {"op": "cancel", "task_id": task["id"]}
+        client.patch(f"/tasks/{task['id']}", json={"due_at": "2030-07-01"})
+        client.delete(f"/tasks/{task['id']}")
+        assert [event["op"] for event in events] == ["schedule", "schedule", "cancel", "schedule", "cancel"]
+    finally:
+        task_main.set_deadline_listener(None)
+
+
+def test_failing_deadline_listener_does_not_fail_the_write(caplog):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    from deadlines import http_listener
+
+    def unavailable(events):
+        raise ConnectionError("reminder service down")
+
+    errors = task_main.DEADLINES.errors
+    task_main.set_deadline_listener(unavailable)
+    try:
+        with caplog.at_level("ERROR"):
+            resp = client.post("/tasks", json={"chat_id": 42, "title": "still saved", "due_at": "2030-01-01"})
+    finally:
+        task_main.set_deadline_listener(None)
+    assert resp.status_code == 200
+    assert client.get(f"/tasks/{resp.json()['id']}").json() == resp.json()
+    assert task_main.DEADLINES.errors > errors
+    assert "dropped 1 deadline events" in caplog.text
+
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append((self.path, json.loads(self.rfile.read(int(self.headers["Content-Length"])))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        http_listener(f"http://127.0.0.1:{server.server_port}/")([{"op": "cancel", "task_id": 1}])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert received == [("/deadlines", {"events": [{"op": "cancel", "task_id": 1}]})]
+
+
+def test_deadline_listener_is_called_outside_the_store_lock():
+    import threading
+
+    entered, release = threading.Event(), threading.Event()
+    events, blocking, first = [], [], []
+
+    def slow(batch):
+        if blocking:
+            entered.set()
+            release.wait(5)
+        events.extend(batch)
+
+    task_main.set_deadline_listener(slow)
+    events.clear()
+    blocking.append(True)
+    writer = threading.Thread(
+        target=lambda: first.append(client.post("/tasks", json={"chat_id": 47, "title": "first", "due_at": "2030-02-01"}).json())
+    )
+    writer.start()
+    try:
+        assert entered.wait(5)
+        # The listener is stuck, yet the store serves reads and writes.
+        second = client.post("/tasks", json={"chat_id": 47, "title": "second", "due_at": "2030-02-02"}).json()
+        assert client.get("/tasks?chat_id=47").json()[-1] == second
+        assert events == []
+    finally:
+        release.set()
+        writer.join(5)
+        task_main.set_deadline_listener(None)
+    # The second write's events were delivered after the first's.
+    assert [event["task_id"] for event in events] == [first[0]["id"], second["id"]]
+
+
+def test_write_ahead_log_replays_updates_and_deletes(tmp_path):
+    from store import TaskStore
+    from wal import WriteAheadLog
+
+    store = TaskStore()
+    wal = WriteAheadLog(str(tmp_path), store)
+    wal.recover()
+    tasks = [{"id": i, "chat_id": 1, "title": f"t{i}", "tags": [], "due_at": None} for i in (1, 2, 3)]
+    for task in tasks:
+        store.add(task)
+        wal.append(task)
+    store.replace(dict(tasks[0], due_at="2024-01-01"))
+    wal.append_update(dict(tasks[0], due_at="2024-01-01"))
+    store.remove(2)
+    wal.append_delete(2)
+    wal.close()
+
+    recovered = TaskStore()
+    WriteAheadLog(str(tmp_path), recovered).recover()
+    assert [task["id"] for task in recovered] == [1, 3]
+    assert recovered.query(due_before="2024-12-31") == [dict(tasks[0], due_at="2024-01-01")]
+    assert recovered.next_id == 4
+
+
+def test_fields_of_the_wrong_type_are_rejected():
+    for bad in ({"assignee": 5}, {"due_at": 20240101}, {"tags": ["ok", 1]}, {"tags": "work"}, {"title": ["x"]}):
+        assert client.post("/tasks", json=dict({"chat_id": 46, "title": "typed"}, **bad)).status_code == 400
+        assert client.post("/tasks:batch", json={"tasks": [dict({"chat_id": 46, "title": "typed"}, **bad)]}).status_code == 400
+    task = client.post("/tasks", json={"chat_id": 46, "title": "typed"}).json()
+    assert client.patch(f"/tasks/{task['id']}", json={"assignee": {"name": "ann"}}).status_code == 400
+    assert client.patch(f"/tasks/{task['id']}", json={"tags": [None]}).status_code == 400
+    assert client.get("/tasks?chat_id=46").json() == [task]
+
+    from record import TaskRecord
+
+    assert TaskRecord(1, 46, "kept", assignee=5, tags=(2,)).to_dict()["assignee"] == 5
+
+
+def test_task_record_round_trips_the_json_shape(tmp_path):
+    from record import TaskRecord
+    from store import TaskStore
+    from wal import WriteAheadLog
+
+    data = {
+        "id": 7,
+        "chat_id": 3,
+        "title": "compact",
+        "assignee": "ann",
+        "due_at": "2024-02-03",
+        "tags": ["a", "b"],
+        "created_at": "2024-01-02T03:04:05.000006",
+    }
+    record = TaskRecord.from_dict(data)
+    assert record.to_dict() == data
+    assert record.tags == ("a", "b")
+    assert record.created_at == 1704164645000006
+    assert record["assignee"] is TaskRecord.from_dict(dict(data, id=8))["assignee"]
+    assert TaskRecord(9, 3, "bare").to_dict()["tags"] == []
+
+    store = TaskStore()
+    wal = WriteAheadLog(str(tmp_path), store, snapshot_every=2, decode=TaskRecord.from_dict)
+    wal.recover()
+    for task_id in (7, 8, 9):
+        record = TaskRecord.from_dict(dict(data, id=task_id))
+        store.add(record)
+        wal.append(record)
+    wal.close()
+    recovered = TaskStore()
+    WriteAheadLog(str(tmp_path), recovered, decode=TaskRecord.from_dict).recover()
+    assert list(recovered) == list(store)
+    assert recovered.query(tag="b", assignee="ann") == list(store)
+
+
+def test_list_responses_join_cached_task_encodings():
+    import json
+
+    created = client.post("/tasks", json={"chat_id": 61, "title": "Überweisung", "tags": ["money"]})
+    task = created.json()
+    assert created.headers["content-type"] == "application/json"
+    record = task_main.STORE.get(task["id"])
+    # Encoded once at creation and reused by every later response.
+    assert record.to_json() is record.to_json() == created.content
+    client.post("/tasks", json={"chat_id": 61, "title": "second"})
+    listed = client.get("/tasks?chat_id=61")
+    assert listed.content == b"[" + record.to_json() + b"," + task_main.STORE.get(task["id"] + 1).to_json() + b"]"
+    assert json.loads(listed.content) == [task, listed.json()[1]]
+    assert client.get("/tasks?chat_id=9999").content == b"[]"
+
+    # An update stores a new record with its own encoding.
+    updated = client.patch(f"/tasks/{task['id']}", json={"title": "renamed"}).json()
+    assert client.get(f"/tasks/{task['id']}").json() == updated == dict(task, title="renamed")
+
+
+def test_retried_creates_return_the_original_task():
+    stored = len(task_main.STORE)
+    first = client.post("/tasks", json={"chat_id": 71, "message_id": 5, "title": "once"})
+    retry = client.post("/tasks", json={"chat_id": 71, "message_id": 5, "title": "once"})
+    assert retry.json() == first.json() and retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    # The same message id in another chat is another message.
+    assert client.post("/tasks", json={"chat_id": 72, "message_id": 5, "title": "once"}).json() != first.json()
+
+    keyed = client.post("/tasks", json={"chat_id": 71, "title": "keyed"}, headers={"Idempotency-Key": "abc"}).json()
+    assert client.post("/tasks", json={"chat_id": 71, "title": "keyed"}, headers={"Idempotency-Key": "abc"}).json() == keyed
+    assert client.post("/tasks", json={"chat_id": 71, "title": "x", "idempotency_key": 3}).status_code == 400
+
+    batch = [
+        {"chat_id": 71, "message_id": 5, "title": "once"},
+        {"chat_id": 71, "title": "new", "idempotency_key": "b-1"},
+        {"chat_id": 71, "title": "new", "idempotency_key": "b-1"},
+        {"chat_id": 71, "title": "unkeyed"},
+    ]
+    created = client.post("/tasks:batch", json={"tasks": batch}).json()
+    assert created[0] == first.json() and created[1] == created[2] and created[3]["id"] == created[1]["id"] + 1
+    replayed = client.post("/tasks:batch", json={"tasks": batch}).json()
+    assert replayed[:3] == created[:3] and replayed[3]["id"] != created[3]["id"]
+    assert len(task_main.STORE) == stored + 6
+    assert client.get("/tasks?chat_id=71").json().count(first.json()) == 1
+
+
+def test_failed_creates_do_not_record_their_idempotency_key(monkeypatch):
+    import pytest
+
+    class FullDisk:
+        def append(self, task):
+            raise OSError("no space left on device")
+
+        append_batch = append
+
+    stored = len(task_main.STORE)
+    monkeypatch.setattr(task_main, "WAL", FullDisk())
+    payload = {"chat_id": 72, "message_id": 9, "title": "retry me"}
+    with pytest.raises(OSError):
+        client.post("/tasks", json=payload)
+    with pytest.raises(OSError):
+        client.post("/tasks:batch", json={"tasks": [dict(payload, message_id=10)]})
+    assert len(task_main.STORE) == stored
+
+    monkeypatch.setattr(task_main, "WAL", None)
+    retry = client.post("/tasks", json=payload)
+    assert retry.status_code == 200 and "Idempotent-Replayed" not in retry.headers
+    batch = client.post("/tasks:batch", json={"tasks": [dict(payload, message_id=10)]})
+    assert "Idempotent-Replayed" not in batch.headers
+    assert client.get("/tasks?chat_id=72").json()[-2:] == [retry.json()] + batch.json()
+    assert len(task_main.STORE) == stored + 2
+
+
+def test_updates_and_deletes_the_log_refuses_are_rolled_back(monkeypatch):
+    import pytest
+
+    class FullDisk:
+        def append_update(self, task):
+            raise OSError("no space left on device")
+
+        def append_delete(self, task_id):
+            raise OSError("no space left on device")
+
+    tasks = [client.post("/tasks", json={"chat_id": 73, "title": f"kept {n}", "tags": ["wal"]}).json() for n in range(3)]
+    monkeypatch.setattr(task_main, "WAL", FullDisk())
+    with pytest.raises(OSError):
+        client.patch(f"/tasks/{tasks[1]['id']}", json={"title": "renamed", "assignee": "ann"})
+    with pytest.raises(OSError):
+        client.delete(f"/tasks/{tasks[1]['id']}")
+    assert client.get(f"/tasks/{tasks[1]['id']}").json() == tasks[1]
+    assert client.get("/tasks?chat_id=73").json() == tasks
+    assert client.get("/tasks?tag=wal&chat_id=73").json() == tasks
+    assert client.get("/tasks?assignee=ann&chat_id=73").json() == []
+
+
+def test_idempotency_table_is_bounded_and_expires():
+    from idempotency import IdempotencyTable
+
+    now = [0.0]
+    table = IdempotencyTable(max_entries=2, ttl=10, clock=lambda: now[0])
+    table.put("a", 1)
+    now[0] = 5
+    table.put("b", 2)
+    now[0] = 8
+    table.put("c", 3)
+    assert (table.get("a"), table.get("b"), table.get("c")) == (None, 2, 3)
+    now[0] = 16
+    assert (table.get("b"), table.get("c")) == (None, 3)
+    table.put("d", 4)
+    assert len(table) == 2 and table.replays == 3
+    assert table.get(None) is None
+
+
+def test_columnar_stats_match_the_task_list():
+    tasks = client.post("/tasks:batch", json={"tasks": [
+        {"chat_id": 50, "title": "a", "assignee": "ann", "tags": ["ops", "db"], "due_at": "2020-01-01"},
+        {"chat_id": 50, "title": "b", "assignee": "bob", "tags": ["ops"], "due_at": "2999-01-01"},
+        {"chat_id": 51, "title": "c", "assignee": "ann"},
+        {"chat_id": 51, "title": "d", "tags": ["db"], "due_at": "2021-06-01T12:00:00"},
+    ]}).json()
+    stats = client.get("/tasks:stats?chat_id=50&group_by=tag").json()
+    assert stats == {"total": 2, "groups": {"ops": 2, "db": 1}}
+    assert client.get("/tasks:stats?group_by=assignee&tag=db&chat_id=50").json() == {"total": 1, "groups": {"ann": 1}}
+    overdue = client.get("/tasks:stats?overdue=true&group_by=chat_id").json()["groups"]
+    assert overdue[50] == 1 and overdue[51] == 1
+    assert client.get("/tasks:stats?due_before=2021-06-01&chat_id=51").json() == {"total": 0}
+    assert client.get("/tasks:stats?assignee=nobody").json() == {"total": 0}
+    assert client.get("/tasks:stats?group_by=title").status_code == 422
+
+    client.delete(f"/tasks/{tasks[0]['id']}")
+    assert client.get("/tasks:stats?chat_id=50").json() == {"total": 1}
+
+
+def test_columnar_export_round_trips():
+    from columns import TaskColumns
+
+    resp = client.get("/tasks:export")
+    assert resp.headers["content-type"] == "application/octet-stream"
+    view = TaskColumns.load(resp.content)
+    listed = client.get("/tasks").json()
+    assert list(view.ids) == [task["id"] for task in listed]
+    assert view.count_by("assignee") == task_main.columns().count_by("assignee")
+    assert view.count_by("tag", view.select(chat_id=50)) == task_main.columns().count_by("tag", task_main.columns().select(chat_id=50))
+    try:
+        TaskColumns.load(b"nope" + bytes(16))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_chat_ids_must_fit_the_columnar_view():
+    stored = len(task_main.STORE)
+    for chat_id in ("@channel", "5", 2**63, -(2**63) - 1, True, 1.5):
+        assert client.post("/tasks", json={"chat_id": chat_id, "title": "odd chat"}).status_code == 400
+        assert client.post("/tasks:batch", json={"tasks": [{"chat_id": chat_id, "title": "odd chat"}]}).status_code == 400
+    assert len(task_main.STORE) == stored
+    for chat_id in (2**63 - 1, -(2**63)):
+        assert client.post("/tasks", json={"chat_id": chat_id, "title": "edge chat"}).status_code == 200
+    assert client.get("/tasks:stats?group_by=chat_id").json()["groups"][2**63 - 1] == 1
+    assert client.get("/tasks:export").status_code == 200
+
+
+def test_search_ranks_and_scopes_to_chat():
+    created = client.post("/tasks:batch", json={"tasks": [
+        {"chat_id": 60, "title": "Write quarterly report"},
+        {"chat_id": 60, "title": "Report bug in report generator"},
+        {"chat_id": 60, "title": "Review the quarterly budget and report to finance team"},
+        {"chat_id": 61, "title": "Write quarterly report"},
+    ]}).json()
+    ids = [task["id"] for task in created]
+
+    def search(query):
+        return [task["id"] for task in client.get(f"/tasks/search?chat_id=60&q={query}").json()]
+
+    assert search("quarterly+report") == [ids[0], ids[2]]
+    assert search("REPORT") == [ids[0], ids[1], ids[2]]
+    assert search("rep*") == [ids[0], ids[1], ids[2]]
+    assert search("quart*+rev*") == [ids[2]]
+    assert search("quarterly+missing") == []
+    assert search("rep") == []
+    assert client.get("/tasks/search?q=report").status_code == 422
+
+    client.patch(f"/tasks/{ids[0]}", json={"title": "Write annual summary"})
+    client.delete(f"/tasks/{ids[1]}")
+    assert search("report") == [ids[2]]
+    assert search("annual") == [ids[0]]
+
+
+def test_search_finds_old_matches_beyond_the_candidate_window():
+    from search import SearchIndex
+
+    index = SearchIndex()
+    for task_id in range(1, 11):
+        index.add(task_id, 1, "alpha beta")
+    for task_id in range(11, 1511):
+        index.add(task_id, 1, "alpha")
+    for task_id in range(1511, 3011):
+        index.add(task_id, 1, "beta")
+    assert sorted(index.search(1, "alpha beta")) == list(range(1, 11))
+    assert sorted(index.search(1, "alp* bet*")) == list(range(1, 11))
+    assert index.search(1, "alpha beta", limit=3) == [10, 9, 8]
+
+    # Enough matches in the newest window: older ones are not scanned.
+    small = SearchIndex(max_candidates=4)
+    for task_id in range(1, 21):
+        small.add(task_id, 1, "alpha beta" if task_id % 2 else "alpha")
+    assert small.search(1, "alpha beta", limit=2) == [19, 17]
+    assert sorted(small.search(1, "alpha beta")) == list(range(1, 21, 2))
+
+
+def test_concurrent_writes_allocate_unique_ids_in_order(tmp_path, monkeypatch):
+    import sys
+    import threading
+
+    from store import TaskStore
+    from wal import WriteAheadLog
+
+    wal = WriteAheadLog(str(tmp_path), TaskStore(), snapshot_every=0)
+    wal.recover()
+    monkeypatch.setattr(task_main, "WAL", wal)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    created, errors = [], []
+    start = threading.Barrier(8)
+
+    def writer(worker: int) -> None:
+        try:
+            start.wait()
+            for i in range(40):
+                created.append(client.post("/tasks", json={"chat_id": 31, "title": f"w{worker} t{i}"}).json())
+                if i % 10 == 0:
+                    batch = {"tasks": [{"chat_id": 31, "title": f"w{worker} b{i}"} for _ in range(5)]}
+                    created.extend(client.post("/tasks:batch", json=batch).json())
+                # Readers paginate while others write.
+                client.get("/tasks?chat_id=31&limit=50")
+        except Exception as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    wal.close()
+
+    assert not errors
+    ids = [task["id"] for task in created]
+    assert len(ids) == len(set(ids)) == 8 * (40 + 4 * 5)
+    listed = [task["id"] for task in client.get("/tasks?chat_id=31").json()]
+    assert listed == sorted(ids)
+    assert len(client.get("/tasks/search?chat_id=31&q=w3&limit=1000").json()) == 40 + 4 * 5
+
+    recovered = TaskStore()
+    WriteAheadLog(str(tmp_path), recovered).recover()
+    assert [task["id"] for task in recovered] == sorted(ids)
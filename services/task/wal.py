@@ -0,0 +1,277 @@
+"""Append-only persistence for the task service.
+
+:class:`WriteAheadLog` records every created, updated or deleted task as one
+JSON line in ``tasks.log`` (a batch of tasks shares a single line, so it is
+recovered all-or-nothing) and periodically compacts the store into
+``snapshot.json``.
+Appends are group committed: the log is flushed and ``fsync``-ed as soon as
+``sync_every`` events are pending, and a background thread syncs whatever
+is pending every ``sync_interval`` seconds, so an acknowledged event reaches
+the disk within that window even if no further write arrives.  A
+``sync_interval`` of ``0`` syncs every append before it returns.  Call
+:meth:`WriteAheadLog.sync` (or :meth:`close`) to force pending events to
+disk.
+
+Snapshots stay off the write path: after ``snapshot_every`` events the
+current log is renamed to ``tasks.log.1`` and the store's tasks are copied
+(references only, records are immutable), then a background thread
+serialises them into the snapshot and deletes the old segment.  New events
+go to a fresh ``tasks.log`` meanwhile.
+
+Recovery loads the snapshot and replays the old segment, if a snapshot did
+not finish, then the log tail.  Replay skips tasks already present in the
+snapshot and updates carry the whole task, which makes a crash at any point
+of a snapshot harmless.  A torn final line left by a crash mid-write is
+ignored and truncated before new events are appended.
+
+Tasks may be plain dictionaries or objects with a ``to_dict()`` method such
+as :class:`~record.TaskRecord`; pass ``decode`` to turn recovered
+dictionaries back into the store's representation.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, IO, List, Optional
+
+from store import TaskStore
+
+LOG_NAME = "tasks.log"
+# The log segment a snapshot in progress is replacing.
+PREVIOUS_LOG_NAME = "tasks.log.1"
+SNAPSHOT_NAME = "snapshot.json"
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(task: Any) -> Dict[str, Any]:
+    to_dict = getattr(task, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"cannot serialise {type(task).__name__}")
+    return to_dict()
+
+
+class WriteAheadLog:
+    """Durable event log and snapshot manager for a :class:`TaskStore`.
+
+    Appends may come from several threads; callers that need events logged
+    in store order hold ``store.lock`` around the store change and the
+    append, as the task service does.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        store: TaskStore,
+        sync_every: int = 64,
+        sync_interval: float = 0.05,
+        snapshot_every: int = 10_000,
+        decode: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ) -> None:
+        self.directory = directory
+        self.store = store
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.decode = decode
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.previous_path = os.path.join(directory, PREVIOUS_LOG_NAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        self._pending = 0
+        self._since_snapshot = 0
+        self._log: Optional[IO[str]] = None
+        # Guards the log file; taken after ``store.lock`` when both are held.
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._snapshotter: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def recover(self) -> int:
+        """Load the snapshot and replay the log into the store.
+
+        Returns the number of events replayed from the log tail.
+        """
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as fh:
+                snapshot = json.load(fh)
+            for task in snapshot["tasks"]:
+                self.store.add(self._decode(task))
+            self.store.advance_ids(snapshot["next_id"])
+
+        interrupted = os.path.exists(self.previous_path)
+        replayed = self._replay(self.previous_path) if interrupted else 0
+        replayed += self._replay(self.log_path)
+        self._since_snapshot = replayed
+        if interrupted:
+            # Finish the snapshot that was cut short, now covering both logs.
+            self._write_snapshot(self.store.next_id, list(self.store))
+            open(self.log_path, "w", encoding="utf-8").close()
+            self._since_snapshot = 0
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        return replayed
+
+    def _replay(self, path: str) -> int:
+        """Apply the events logged in ``path``; return how many there were."""
+        if not os.path.exists(path):
+            return 0
+        replayed = 0
+        intact = 0
+        with open(path, "rb") as fh:
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                op = event["op"]
+                if op == "update":
+                    if self.store.get(event["task"]["id"]) is not None:
+                        self.store.replace(self._decode(event["task"]))
+                elif op == "delete":
+                    self.store.remove(event["id"])
+                else:
+                    for task in event["tasks"] if op == "batch" else (event["task"],):
+                        if self.store.get(task["id"]) is None:
+                            self.store.add(self._decode(task))
+                intact += len(line)
+                replayed += 1
+        if intact < os.path.getsize(path):
+            # Drop a torn final write so new appends start on a clean line.
+            with open(path, "r+b") as fh:
+                fh.truncate(intact)
+        return replayed
+
+    def _decode(self, task: Dict[str, Any]) -> Any:
+        return task if self.decode is None else self.decode(task)
+
+    def append(self, task: Any) -> None:
+        """Record the creation of ``task`` in the log."""
+        self._write({"op": "create", "task": task}, 1)
+
+    def append_batch(self, tasks: List[Any]) -> None:
+        """Record the creation of ``tasks`` as one atomic log record."""
+        self._write({"op": "batch", "tasks": tasks}, len(tasks))
+
+    def append_update(self, task: Any) -> None:
+        """Record the new version of an updated ``task``."""
+        self._write({"op": "update", "task": task}, 1)
+
+    def append_delete(self, task_id: int) -> None:
+        """Record the deletion of the task ``task_id``."""
+        self._write({"op": "delete", "id": task_id}, 1)
+
+    def _write(self, event: Dict[str, Any], count: int) -> None:
+        line = json.dumps(event, separators=(",", ":"), default=_encode)
+        with self._lock:
+            if self._log is None:
+                raise RuntimeError("recover() must be called before append()")
+            self._log.write(line)
+            self._log.write("\n")
+            self._pending += count
+            self._since_snapshot += count
+            if self._pending >= self.sync_every or self.sync_interval <= 0:
+                self._sync()
+            elif self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name="wal-flusher", daemon=True)
+                self._flusher.start()
+        if self.snapshot_every and self._since_snapshot >= self.snapshot_every and not self._snapshotting:
+            self._start_snapshot()
+
+    def _flush_periodically(self) -> None:
+        while not self._closing.wait(self.sync_interval):
+            with self._lock:
+                if self._pending and self._log is not None:
+                    self._sync()
+
+    def sync(self) -> None:
+        """Flush and ``fsync`` all pending log entries."""
+        with self._lock:
+            if self._log is not None:
+                self._sync()
+
+    def _sync(self) -> None:
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._pending = 0
+
+    def snapshot(self) -> None:
+        """Write a compact snapshot of the store and truncate the log.
+
+        Blocks until the snapshot is on disk.
+        """
+        self._wait_for_snapshot()
+        self._start_snapshot()
+        self._wait_for_snapshot()
+
+    def _start_snapshot(self) -> None:
+        """Rotate the log and serialise the store in a background thread."""
+        # Lock order: ``store.lock`` before ``self._lock``, as in the service.
+        with self.store.lock, self._lock:
+            if self._log is None or self._snapshotting:
+                return
+            self._sync()
+            self._log.close()
+            if os.path.exists(self.previous_path):
+                # A failed snapshot left its segment behind; keep its events
+                # ahead of the current ones.
+                with open(self.previous_path, "ab") as old, open(self.log_path, "rb") as new:
+                    shutil.copyfileobj(new, old)
+                    old.flush()
+                    os.fsync(old.fileno())
+                os.remove(self.log_path)
+            else:
+                os.replace(self.log_path, self.previous_path)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+            self._since_snapshot = 0
+            next_id, tasks = self.store.next_id, list(self.store)
+            self._snapshotter = threading.Thread(
+                target=self._snapshot_in_background, args=(next_id, tasks), name="wal-snapshot", daemon=True
+            )
+            self._snapshotter.start()
+
+    def _write_snapshot(self, next_id: int, tasks: List[Any]) -> None:
+        """Persist ``tasks`` as the snapshot and drop the log it replaces."""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"next_id": next_id, "tasks": tasks}, fh, separators=(",", ":"), default=_encode)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        if os.path.exists(self.previous_path):
+            os.remove(self.previous_path)
+
+    def _snapshot_in_background(self, next_id: int, tasks: List[Any]) -> None:
+        try:
+            self._write_snapshot(next_id, tasks)
+        except Exception:
+            # The old segment stays and is folded into the next snapshot.
+            logger.exception("task snapshot failed")
+
+    @property
+    def _snapshotting(self) -> bool:
+        return self._snapshotter is not None and self._snapshotter.is_alive()
+
+    def _wait_for_snapshot(self) -> None:
+        snapshotter = self._snapshotter
+        if snapshotter is not None:
+            snapshotter.join()
+
+    def close(self) -> None:
+        """Finish a running snapshot, sync pending entries and close the log."""
+        self._wait_for_snapshot()
+        self._closing.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            if self._log is None:
+                return
+            self._sync()
+            self._log.close()
+            self._log = None
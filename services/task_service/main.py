@@ -1,19 +1,67 @@
-from fastapi import FastAPI
-from typing import List
+import pathlib
+import sys
+import threading
+from fastapi import FastAPI, Header, HTTPException
+from typing import Dict, List, Optional
 from models import Task
 
-app = FastAPI()
+# The full-text index, the id allocator and the idempotency table live with
+# the ``task`` service and are shared by both.  The Dockerfile builds from
+# services/ and copies them to the same relative place.
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "task"))
+
+from idempotency import IdempotencyTable, item_key  # noqa: E402
+from ids import IdAllocator  # noqa: E402
+from search import DEFAULT_LIMIT, SearchIndex  # noqa: E402
+
+app = FastAPI(title="task_service")
 
 _tasks: List[Task] = []
+_by_id: Dict[int, Task] = {}
+_search = SearchIndex()
+_ids = IdAllocator()
+# Task created for each ``(chat_id, message_id)`` or ``Idempotency-Key``.
+_created = IdempotencyTable()
+# Serialises writes from concurrent requests.
+_lock = threading.Lock()
 
 @app.post("/tasks", response_model=Task)
-async def create_task(task: Task):
-    _tasks.append(task)
+async def create_task(task: Task, idempotency_key: Optional[str] = Header(None)):
+    """Store ``task``, allocating its id unless the client chose one.
+
+    A client-chosen id must be new (409 otherwise) and moves allocation
+    past it, so allocated ids never collide with chosen ones.  A retry of
+    the same message (``chat_id`` and ``message_id``), or with the same
+    ``Idempotency-Key`` header, returns the task stored the first time.
+    """
+    key = item_key({"chat_id": task.chat_id, "message_id": task.message_id}, idempotency_key)
+    with _lock:
+        original = _created.get(key)
+        if original is not None:
+            return original
+        if task.id is None:
+            task.id = _ids.allocate()[0]
+        elif task.id in _by_id:
+            raise HTTPException(409, "task id already exists")
+        else:
+            _ids.advance(task.id + 1)
+        _created.put(key, task)
+        _tasks.append(task)
+        _by_id[task.id] = task
+        _search.add(task.id, task.chat_id, task.title, task.description)
     return task
 
 @app.get("/tasks", response_model=List[Task])
 async def list_tasks():
-    return _tasks
+    return list(_tasks)
+
+@app.get("/tasks/search", response_model=List[Task])
+async def search_tasks(q: str = "", chat_id: Optional[int] = None, limit: int = DEFAULT_LIMIT):
+    """Rank the chat's tasks matching all words of ``q`` (``word*`` = prefix)."""
+    if chat_id is None:
+        raise HTTPException(422, "chat_id is required")
+    with _lock:
+        return [_by_id[task_id] for task_id in _search.search(chat_id, q, max(limit, 1))]
 
 @app.get("/health")
 async def health():
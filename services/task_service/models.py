@@ -4,7 +4,8 @@ from pydantic import BaseModel, Field
 
 
 class Task(BaseModel):
-    id: int
+    # Assigned by the service when the client leaves it out.
+    id: Optional[int] = None
     chat_id: int
     message_id: int
     title: str
@@ -0,0 +1,121 @@
+import asyncio
+import importlib.util
+import pathlib
+import sys
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+ROOT = pathlib.Path(__file__).resolve().parents[3]
+SERVICE_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.extend([str(ROOT), str(SERVICE_DIR)])
+
+from fastapi.testclient import AsyncTestClient, TestClient
+
+spec = importlib.util.spec_from_file_location("task_service_main", SERVICE_DIR / "main.py")
+task_service_main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(task_service_main)
+
+
+def make_task(task_id: int) -> dict:
+    return {
+        "id": task_id,
+        "chat_id": 1,
+        "message_id": task_id,
+        "title": f"task {task_id}",
+        "created_by": "alice",
+        "created_at": "2024-01-01T00:00:00",
+        "updated_at": "2024-01-01T00:00:00",
+    }
+
+
+def test_async_handlers_run_through_sync_client():
+    client = TestClient(task_service_main.app)
+    assert client.get("/health").json() == {"status": "ok"}
+    resp = client.post("/tasks", json=make_task(1))
+    assert resp.status_code == 200
+    assert resp.json()["title"] == "task 1"
+    assert resp.json()["created_at"] == "2024-01-01T00:00:00"
+    assert client.post("/tasks", json={"id": 2}).status_code == 422
+
+
+def test_async_client_runs_requests_concurrently():
+    from fastapi import FastAPI
+
+    # Every request waits until all of them have arrived, so the requests
+    # can only complete if they are in flight at the same time.
+    barrier_app = FastAPI()
+    arrived = []
+    everyone = asyncio.Event()
+
+    @barrier_app.get("/wait/{index}")
+    async def wait(index: int):
+        arrived.append(index)
+        if len(arrived) == 10:
+            everyone.set()
+        await asyncio.wait_for(everyone.wait(), 2)
+        return {"index": index}
+
+    async def overlap():
+        barrier = AsyncTestClient(barrier_app)
+        return await asyncio.gather(*(barrier.get(f"/wait/{i}") for i in range(10)))
+
+    assert [resp.json()["index"] for resp in asyncio.run(overlap())] == list(range(10))
+
+    client = AsyncTestClient(task_service_main.app)
+
+    async def scenario():
+        created = await asyncio.gather(*(client.post("/tasks", json=make_task(i)) for i in range(10, 20)))
+        listed = await client.get("/tasks")
+        return created, listed
+
+    created, listed = asyncio.run(scenario())
+    assert [resp.status_code for resp in created] == [200] * 10
+    ids = [task["id"] for task in listed.json()]
+    assert ids[-10:] == list(range(10, 20))
+
+
+def test_search_covers_title_and_description():
+    client = TestClient(task_service_main.app)
+    first = dict(make_task(101), chat_id=77, title="Deploy gateway", description="after the load tests")
+    second = dict(make_task(102), chat_id=77, title="Load testing plan")
+    for task in (first, second):
+        client.post("/tasks", json=task)
+    found = client.get("/tasks/search?chat_id=77&q=load").json()
+    assert [task["id"] for task in found] == [102, 101]
+    assert [task["id"] for task in client.get("/tasks/search?chat_id=77&q=deploy+test*").json()] == [101]
+    assert client.get("/tasks/search?chat_id=78&q=load").json() == []
+
+
+def test_ids_are_allocated_uniquely_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = TestClient(task_service_main.app)
+    chosen = client.post("/tasks", json=make_task(500)).json()
+    assert client.post("/tasks", json=dict(make_task(500), message_id=501)).status_code == 409
+
+    def create(i: int) -> int:
+        task = make_task(0)
+        del task["id"]
+        return client.post("/tasks", json=dict(task, message_id=1000 + i, title=f"auto {i}")).json()["id"]
+
+    with ThreadPoolExecutor(8) as pool:
+        ids = list(pool.map(create, range(200)))
+    assert len(set(ids)) == 200
+    assert min(ids) > chosen["id"]
+
+
+def test_retried_messages_return_the_original_task():
+    client = TestClient(task_service_main.app)
+    task = make_task(0)
+    del task["id"]
+    first = client.post("/tasks", json=dict(task, chat_id=90, message_id=7)).json()
+    retry = client.post("/tasks", json=dict(task, chat_id=90, message_id=7)).json()
+    assert retry == first
+    assert client.post("/tasks", json=dict(task, chat_id=91, message_id=7)).json()["id"] != first["id"]
+
+    keyed = client.post("/tasks", json=dict(task, message_id=8), headers={"Idempotency-Key": "k-1"}).json()
+    again = client.post("/tasks", json=dict(task, message_id=9), headers={"Idempotency-Key": "k-1"}).json()
+    assert again == keyed
+    assert [t["id"] for t in client.get("/tasks").json()].count(first["id"]) == 1